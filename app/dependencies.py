@@ -1,23 +1,39 @@
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException
 from app.exceptions import AWSServicesException
-from app.utils.auth import aws_jwt
-from app.settings import Settings
-from app.utils.dynamodb_service import NotesDBService
-settings = Settings()
+from app.settings import get_settings
+from app.utils.concurrency import run_blocking
+settings = get_settings()
 
 root_path = settings.api_root_path if settings.api_root_path else ''
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=root_path + '/auth/sign_in', scheme_name='UserCredentials')
 
+# The auth and storage modules pull in python-jose, requests and PynamoDB, so they are imported on first
+# use (or by app.startup.initialize) instead of when the Lambda handler module is loaded.
+
 
 async def aws_identity(token=Depends(oauth2_scheme)):
+    from app.utils.auth import aws_jwt
     try:
-        identity = aws_jwt.get_aws_identity(token)
+        identity = await run_blocking(aws_jwt.get_aws_identity, token)
         return identity
     except AWSServicesException as ex:
         raise HTTPException(status_code=ex.recommended_status_code, detail=ex.detail)
 
 
+async def verified_claims(token=Depends(oauth2_scheme)):
+    from app.utils.auth import jwks
+    try:
+        return jwks.verify_token(token)
+    except AWSServicesException as ex:
+        raise HTTPException(status_code=ex.recommended_status_code, detail=ex.detail)
+
+
 async def dynamodb_service(identity=Depends(aws_identity)):
+    from app.utils.notes_service import NotesDBService
+    from app.utils.notes_cache import CachedNotesDBService, get_notes_cache
+    notes_cache = get_notes_cache()
+    if notes_cache is not None:
+        return CachedNotesDBService(identity, notes_cache)
     return NotesDBService(identity)
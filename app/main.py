@@ -1,14 +1,35 @@
 from fastapi import FastAPI
-from .routers import auth
+from .routers import auth, metrics
 from .routers.v1 import notes
 from mangum import Mangum
-from .settings import Settings
+from . import startup
+from .settings import get_settings
+from .utils.compression import CompressionMiddleware, encode_compressed_lambda_body
+from .utils.metrics import MetricsMiddleware, is_running_in_lambda
 
-settings = Settings()
+settings = get_settings()
 root_path = settings.api_root_path
 
 app = FastAPI(root_path=root_path)
 app.include_router(auth.router)
 app.include_router(notes.router)
+app.include_router(metrics.router)
+app.add_middleware(CompressionMiddleware,
+                   minimum_size=settings.compression_minimum_size,
+                   gzip_level=settings.compression_gzip_level,
+                   brotli_quality=settings.compression_brotli_quality)
+app.add_middleware(MetricsMiddleware,
+                   emit_emf=settings.metrics_emf if settings.metrics_emf is not None else is_running_in_lambda(),
+                   namespace=settings.metrics_namespace)
 
-handler = Mangum(app)
+mangum_handler = Mangum(app)
+
+if settings.eager_init:
+    startup.initialize()
+
+
+def handler(event, context):
+    startup.initialize()
+    if startup.is_warm_up_event(event):
+        return {'warmed': True}
+    return encode_compressed_lambda_body(mangum_handler(event, context))
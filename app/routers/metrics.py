@@ -0,0 +1,30 @@
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from app.settings import Settings, get_settings
+from app.utils.metrics import REGISTRY, is_running_in_lambda
+
+router = APIRouter(tags=['metrics'])
+
+
+def metrics_access(authorization: str = Header(None), settings: Settings = Depends(get_settings)):
+    """
+    The endpoint is off by default under Lambda, where it sits on the public API and only sees one container's
+    registry (EMF carries the metrics there). When METRICS_TOKEN is set, scrapers must send it as a bearer token.
+    """
+    enabled = settings.metrics_endpoint if settings.metrics_endpoint is not None else not is_running_in_lambda()
+    if not enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Not Found')
+    if settings.metrics_token is not None:
+        scheme, _, token = (authorization or '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode('utf-8'),
+                                                                  settings.metrics_token.encode('utf-8')):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Not authenticated',
+                                headers={'WWW-Authenticate': 'Bearer'})
+
+
+@router.get('/metrics', response_class=PlainTextResponse, dependencies=[Depends(metrics_access)])
+async def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type='text/plain; version=0.0.4')
@@ -1,55 +1,174 @@
-from fastapi import APIRouter, HTTPException, Depends
-from app.schemas import Note, StoredNote, NoteUpdate
+from fastapi import APIRouter, HTTPException, Depends, Query, Header, Response
+from app.schemas import Note, StoredNote, NoteUpdate, NotesPage, NoteSummariesPage, NotesBatchWrite, NotesBatchDelete, \
+    NotesBatchGet, NotesBatchGetResult, BatchResult, NoteChangesPage, NoteSearchResults
+from app.settings import get_settings
 from app.exceptions import AWSServicesException
 from app.dependencies import dynamodb_service
+from app.utils.metrics import InstrumentedRoute
+from app.utils.concurrency import run_blocking, iterate_blocking
+from app.utils.etags import get_note_etag, get_notes_page_etag, etag_matches, parse_if_match
+from app.utils.serialization import NotesJSONResponse
 from fastapi import status
+from fastapi.responses import StreamingResponse
 
-router = APIRouter(prefix='/v1/notes', tags=['notes'])
+router = APIRouter(prefix='/v1/notes', tags=['notes'], route_class=InstrumentedRoute)
 
 
 @router.post('', status_code=status.HTTP_201_CREATED)
 async def create_note(note: Note, notes_service=Depends(dynamodb_service)) -> StoredNote:
     try:
-        return notes_service.create_note(note)
+        stored_note = await run_blocking(notes_service.create_note, note)
+    except AWSServicesException as exc:
+        raise HTTPException(status_code=exc.recommended_status_code, detail=exc.detail)
+    return NotesJSONResponse(stored_note, status_code=status.HTTP_201_CREATED,
+                             headers={'ETag': get_note_etag(stored_note)})
+
+
+@router.post(':batch', status_code=status.HTTP_200_OK)
+async def batch_save_notes(batch: NotesBatchWrite, notes_service=Depends(dynamodb_service)) -> BatchResult:
+    try:
+        return await run_blocking(notes_service.batch_save_notes, batch.notes)
+    except AWSServicesException as exc:
+        raise HTTPException(status_code=exc.recommended_status_code, detail=exc.detail)
+
+
+@router.post(':batchDelete', status_code=status.HTTP_200_OK)
+async def batch_delete_notes(batch: NotesBatchDelete, notes_service=Depends(dynamodb_service)) -> BatchResult:
+    try:
+        return await run_blocking(notes_service.batch_delete_notes, batch.note_ids)
+    except AWSServicesException as exc:
+        raise HTTPException(status_code=exc.recommended_status_code, detail=exc.detail)
+
+
+@router.post(':batchGet', status_code=status.HTTP_200_OK)
+async def batch_get_notes(batch: NotesBatchGet, notes_service=Depends(dynamodb_service)) -> NotesBatchGetResult:
+    try:
+        return NotesJSONResponse(await run_blocking(notes_service.batch_get_notes, batch.note_ids))
     except AWSServicesException as exc:
         raise HTTPException(status_code=exc.recommended_status_code, detail=exc.detail)
 
 
 @router.get('', status_code=status.HTTP_200_OK)
-async def get_notes(notes_service=Depends(dynamodb_service)) -> [StoredNote]:
+async def get_notes(limit: int = Query(None, ge=1), cursor: str = None,
+                    if_none_match: str = Header(None),
+                    notes_service=Depends(dynamodb_service), settings=Depends(get_settings)) -> NotesPage:
+    limit = min(limit or settings.notes_page_default_limit, settings.notes_page_max_limit)
+    try:
+        page = await run_blocking(notes_service.get_notes, limit, cursor)
+    except AWSServicesException as exc:
+        raise HTTPException(status_code=exc.recommended_status_code, detail=exc.detail)
+    return _conditional_get_response(page, get_notes_page_etag(page), if_none_match)
+
+
+@router.get('/summaries', status_code=status.HTTP_200_OK)
+async def get_note_summaries(limit: int = Query(None, ge=1), cursor: str = None,
+                             preview_length: int = Query(None, ge=1),
+                             notes_service=Depends(dynamodb_service),
+                             settings=Depends(get_settings)) -> NoteSummariesPage:
+    limit = min(limit or settings.notes_page_default_limit, settings.notes_page_max_limit)
+    try:
+        return await run_blocking(notes_service.get_note_summaries, limit, cursor, preview_length)
+    except AWSServicesException as exc:
+        raise HTTPException(status_code=exc.recommended_status_code, detail=exc.detail)
+
+
+@router.get('/search', status_code=status.HTTP_200_OK)
+async def search_notes(q: str = Query(..., min_length=1), limit: int = Query(None, ge=1),
+                       notes_service=Depends(dynamodb_service), settings=Depends(get_settings)) -> NoteSearchResults:
+    limit = min(limit or settings.notes_search_default_limit, settings.notes_page_max_limit)
     try:
-        return notes_service.get_notes()
+        return await run_blocking(notes_service.search_notes, q, limit)
     except AWSServicesException as exc:
         raise HTTPException(status_code=exc.recommended_status_code, detail=exc.detail)
 
 
+@router.get('/changes', status_code=status.HTTP_200_OK)
+async def get_note_changes(since: int = Query(..., ge=0), limit: int = Query(None, ge=1), cursor: str = None,
+                           notes_service=Depends(dynamodb_service),
+                           settings=Depends(get_settings)) -> NoteChangesPage:
+    limit = min(limit or settings.notes_page_default_limit, settings.notes_page_max_limit)
+    try:
+        return NotesJSONResponse(await run_blocking(notes_service.get_note_changes, since, limit, cursor))
+    except AWSServicesException as exc:
+        raise HTTPException(status_code=exc.recommended_status_code, detail=exc.detail)
+
+
+@router.get('/export', status_code=status.HTTP_200_OK, response_class=StreamingResponse)
+async def export_notes(notes_service=Depends(dynamodb_service), settings=Depends(get_settings)):
+    page_size = settings.notes_export_page_size
+    ndjson_chunks = _iterate_ndjson_chunks(notes_service.export_notes(page_size), page_size)
+    return StreamingResponse(iterate_blocking(ndjson_chunks), media_type='application/x-ndjson')
+
+
 @router.get('/{note_id}', status_code=status.HTTP_200_OK)
-async def get_note(note_id: str, notes_service=Depends(dynamodb_service)) -> StoredNote:
+async def get_note(note_id: str, if_none_match: str = Header(None),
+                   notes_service=Depends(dynamodb_service)) -> StoredNote:
     try:
-        return notes_service.get_note(note_id)
+        stored_note = await run_blocking(notes_service.get_note, note_id)
     except AWSServicesException as exc:
         raise HTTPException(status_code=exc.recommended_status_code, detail=exc.detail)
+    return _conditional_get_response(stored_note, get_note_etag(stored_note), if_none_match)
 
 
 @router.put('/{note_id}', status_code=status.HTTP_200_OK)
-async def update_note(note_id: str, note: Note, notes_service=Depends(dynamodb_service)) -> StoredNote:
+async def update_note(note_id: str, note: Note, if_match: str = Header(None),
+                      notes_service=Depends(dynamodb_service)) -> StoredNote:
     try:
-        return notes_service.update_note(note_id, note.title, note.text)
+        expected_updated_at = await _get_expected_updated_at(notes_service, note_id, if_match)
+        stored_note = await run_blocking(notes_service.update_note, note_id, note.title, note.text,
+                                         expected_updated_at)
     except AWSServicesException as exc:
         raise HTTPException(status_code=exc.recommended_status_code, detail=exc.detail)
+    return NotesJSONResponse(stored_note, headers={'ETag': get_note_etag(stored_note)})
 
 
 @router.patch('/{note_id}', status_code=status.HTTP_200_OK)
-async def partial_update_note(note_id: str, note: NoteUpdate, notes_service=Depends(dynamodb_service)) -> StoredNote:
+async def partial_update_note(note_id: str, note: NoteUpdate, if_match: str = Header(None),
+                              notes_service=Depends(dynamodb_service)) -> StoredNote:
     try:
-        return notes_service.update_note(note_id, note.title, note.text)
+        expected_updated_at = await _get_expected_updated_at(notes_service, note_id, if_match)
+        stored_note = await run_blocking(notes_service.update_note, note_id, note.title, note.text,
+                                         expected_updated_at)
     except AWSServicesException as exc:
         raise HTTPException(status_code=exc.recommended_status_code, detail=exc.detail)
+    return NotesJSONResponse(stored_note, headers={'ETag': get_note_etag(stored_note)})
 
 
 @router.delete('/{note_id}', status_code=status.HTTP_204_NO_CONTENT)
 async def delete_note(note_id: str, notes_service=Depends(dynamodb_service)):
     try:
-        notes_service.delete_note(note_id)
+        await run_blocking(notes_service.delete_note, note_id)
     except AWSServicesException as exc:
         raise HTTPException(status_code=exc.recommended_status_code, detail=exc.detail)
+
+
+def _conditional_get_response(body, etag: str, if_none_match: str):
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return NotesJSONResponse(body, headers={'ETag': etag})
+
+
+async def _get_expected_updated_at(notes_service, note_id: str, if_match: str):
+    """
+    Reduces an If-Match header to the single version the conditional update checks. With several entity tags the
+    note is read first to find the one it currently has; the update still fails with 412 if it changes meanwhile.
+    """
+    versions = parse_if_match(if_match)
+    if versions is None or len(versions) == 1:
+        return versions[0] if versions else None
+    current_updated_at = (await run_blocking(notes_service.get_note, note_id)).updated_at or 0
+    if current_updated_at not in versions:
+        raise AWSServicesException(recommended_status_code=status.HTTP_412_PRECONDITION_FAILED,
+                                   detail=f'Note with id {note_id} has been modified')
+    return current_updated_at
+
+
+def _iterate_ndjson_chunks(notes, chunk_size: int):
+    lines = []
+    for note in notes:
+        lines.append(note.json() + '\n')
+        if len(lines) >= chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
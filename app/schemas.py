@@ -1,4 +1,5 @@
 import datetime
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -29,6 +30,77 @@ class NoteUpdate(Note):
 
 class StoredNote(Note):
     note_id: str
+    updated_at: int = None
+
+
+class NotesPage(BaseModel):
+    notes: List[StoredNote]
+    next_cursor: str = None
+
+
+class NoteDeletion(BaseModel):
+    note_id: str
+    deleted_at: int
+
+
+class NoteChangesPage(BaseModel):
+    upserts: List[StoredNote]
+    deletions: List[NoteDeletion]
+    next_cursor: str = None
+    # Set on the last page: the since to pass on the next sync.
+    sync_token: int = None
+
+
+class NoteSummary(BaseModel):
+    note_id: str
+    title: str
+    preview: str = None
+
+
+class NoteSummariesPage(BaseModel):
+    notes: List[NoteSummary]
+    next_cursor: str = None
+
+
+class NoteSearchHit(BaseModel):
+    note_id: str
+    title: str
+    score: float
+
+
+class NoteSearchResults(BaseModel):
+    hits: List[NoteSearchHit]
+
+
+class BatchNote(Note):
+    note_id: str = None
+
+
+class NotesBatchWrite(BaseModel):
+    notes: List[BatchNote]
+
+
+class NotesBatchDelete(BaseModel):
+    note_ids: List[str]
+
+
+class NotesBatchGet(BaseModel):
+    note_ids: List[str]
+
+
+class NotesBatchGetResult(BaseModel):
+    notes: List[StoredNote]
+    missing_ids: List[str]
+
+
+class BatchItemResult(BaseModel):
+    note_id: str
+    status: str
+    detail: str = None
+
+
+class BatchResult(BaseModel):
+    results: List[BatchItemResult]
 
 
 class AWSIdentityCredentials(BaseModel):
@@ -41,6 +113,7 @@ class AWSIdentityCredentials(BaseModel):
 class AWSIdentity(BaseModel):
     identity_id: str = Field(alias='IdentityId')
     cognito_claims: dict = {}
-    credentials: AWSIdentityCredentials = Field(alias='Credentials')
+    # Only set when AWS_IDENTITY_MODE is 'credentials'.
+    credentials: Optional[AWSIdentityCredentials] = Field(None, alias='Credentials')
 
 
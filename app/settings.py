@@ -1,3 +1,6 @@
+from functools import lru_cache
+from typing import Dict
+
 from pydantic import BaseSettings
 
 
@@ -11,3 +14,58 @@ class Settings(BaseSettings):
     aws_account_id: str
     dynamo_db_notes_table: str
     api_root_path: str = None
+    eager_init: bool = False
+    identity_cache_max_size: int = 1024
+    aws_identity_mode: str = 'local'
+    identity_id_cache_max_size: int = 10000
+    identity_id_store: str = None
+    identity_id_sqlite_path: str = 'identity_ids.db'
+    identity_connections_max_size: int = 256
+    cognito_jwks_path: str = None
+    jwks_refresh_interval: int = 3600
+    aws_client_max_pool_connections: int = 50
+    aws_client_max_attempts: int = 5
+    aws_rate_limits: Dict[str, float] = {}
+    aws_rate_limit_timeout: float = 2.0
+    aws_retry_max_attempts: int = 4
+    aws_retry_base_delay: float = 0.05
+    aws_retry_max_delay: float = 2.0
+    aws_call_timeout: float = 10.0
+    blocking_io_max_threads: int = 32
+    notes_storage_backend: str = 'dynamodb'
+    notes_sqlite_path: str = 'notes.db'
+    notes_page_default_limit: int = 100
+    notes_page_max_limit: int = 1000
+    notes_export_page_size: int = 500
+    notes_batch_max_size: int = 5000
+    notes_tombstone_ttl: int = 30 * 24 * 3600
+    notes_cache_backend: str = None
+    notes_cache_ttl: int = 60
+    notes_cache_max_size: int = 10000
+    notes_cache_redis_url: str = None
+    notes_search_default_limit: int = 20
+    notes_search_max_indexes: int = 64
+    notes_compression_threshold: int = 1024
+    notes_blob_threshold: int = 65536
+    notes_blob_backend: str = None
+    notes_blob_bucket: str = None
+    notes_blob_path: str = None
+    notes_blob_max_concurrency: int = 16
+    metrics_emf: bool = None
+    metrics_namespace: str = 'FastNote'
+    metrics_endpoint: bool = None
+    metrics_token: str = None
+    compression_minimum_size: int = 1024
+    compression_gzip_level: int = None
+    compression_brotli_quality: int = None
+
+
+@lru_cache()
+def get_settings() -> Settings:
+    """
+    The settings, built from the environment on first use. Services call this directly, often from worker threads
+    outside any request, so app.dependency_overrides[get_settings] reaches only the route parameters declared with
+    Depends(get_settings), not the services behind them. To change settings, change the environment and call
+    get_settings.cache_clear().
+    """
+    return Settings()
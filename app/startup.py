@@ -0,0 +1,59 @@
+import importlib
+import logging
+import threading
+import time
+
+from app.settings import get_settings
+
+HEAVY_MODULES = (
+    'app.utils.auth.aws_jwt',
+    'app.utils.dynamodb_service',
+)
+AWS_CLIENTS = (
+    'cognito-idp',
+    'cognito-identity',
+)
+
+init_timings = {}
+_initialized = False
+_lock = threading.Lock()
+
+
+def initialize() -> dict:
+    global _initialized
+    if _initialized:
+        return init_timings
+    with _lock:
+        if not _initialized:
+            started = time.perf_counter()
+            for module_name in HEAVY_MODULES:
+                _timed(f'import {module_name}', importlib.import_module, module_name)
+            _timed('settings', get_settings)
+            from app.utils import aws_clients
+            for service_name in AWS_CLIENTS:
+                _timed(f'client {service_name}', aws_clients.get_client, service_name)
+            if get_settings().notes_storage_backend == 'dynamodb':
+                from app.utils.dynamodb_service import DynamoDBNote
+                _timed('client dynamodb', lambda: DynamoDBNote._get_connection().connection.client)
+            init_timings['total'] = _elapsed_ms(started)
+            logging.info(f'Initialized in {init_timings["total"]:.1f} ms: {init_timings}')
+            _initialized = True
+    return init_timings
+
+
+def is_warm_up_event(event) -> bool:
+    if not isinstance(event, dict):
+        return False
+    if event.get('warmup') is True:
+        return True
+    return event.get('source') == 'aws.events' and event.get('detail-type') == 'Scheduled Event'
+
+
+def _timed(name, func, *args):
+    started = time.perf_counter()
+    func(*args)
+    init_timings[name] = _elapsed_ms(started)
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 3)
@@ -1,33 +1,141 @@
-import boto3
+import hashlib
 import logging
-import cognitojwt
-from app.settings import Settings
+from app.settings import get_settings
 from app.schemas import AWSIdentity
 from app.exceptions import AWSServicesException
+from app.utils import aws_clients
+from app.utils.auth.identity_cache import IdentityCache, IdentityIdCache
+from app.utils.auth.identity_store import get_identity_id_store
+from app.utils.auth.jwks import verify_token
+from app.utils.metrics import timed
+from app.utils.throttling import SingleFlight, call_aws
 from fastapi import status
 
+_identity_cache = None
+_identity_id_cache = None
+_identity_resolutions = SingleFlight()
 
+
+def get_identity_cache() -> IdentityCache:
+    global _identity_cache
+    if _identity_cache is None:
+        _identity_cache = IdentityCache(max_size=get_settings().identity_cache_max_size)
+    return _identity_cache
+
+
+def get_identity_id_cache() -> IdentityIdCache:
+    global _identity_id_cache
+    if _identity_id_cache is None:
+        _identity_id_cache = IdentityIdCache(max_size=get_settings().identity_id_cache_max_size)
+    return _identity_id_cache
+
+
+@timed('aws_jwt.get_aws_identity')
 def get_aws_identity(token: str) -> AWSIdentity:
-    settings = Settings()
-    identity_client = boto3.client('cognito-identity')
+    identity_cache = get_identity_cache()
+    identity_object = identity_cache.get(token)
+    if identity_object is not None:
+        return identity_object
+
+    # Requests carrying the same token share one resolution instead of each calling Cognito.
+    return _identity_resolutions.do(hashlib.sha256(token.encode('utf-8')).hexdigest(), _resolve_and_cache, token,
+                                    timeout=get_settings().aws_call_timeout)
+
+
+def _resolve_and_cache(token: str) -> AWSIdentity:
+    identity_cache = get_identity_cache()
+    identity_object = identity_cache.get(token)
+    if identity_object is None:
+        identity_object = _resolve_aws_identity(token)
+        identity_cache.put(token, identity_object)
+    return identity_object
+
+
+def _resolve_aws_identity(token: str) -> AWSIdentity:
+    """
+    Resolves the identity behind a token as far as AWS_IDENTITY_MODE asks for:
+    'local' verifies the token and looks its sub up in the identity id cache and store, calling get_id only for subs
+    never seen before; 'get_id' asks Cognito Identity for the identity id on every resolution; 'credentials' looks
+    the identity id up like 'local' and fetches the identity's temporary credentials, which DynamoDB calls are then
+    signed with.
+    """
+    settings = get_settings()
+    claims = verify_token(token)
+    credentials = None
+    if settings.aws_identity_mode == 'local':
+        identity_id = _lookup_identity_id(claims['sub'], token)
+    elif settings.aws_identity_mode == 'get_id':
+        identity_id = _get_identity_id(token)
+    elif settings.aws_identity_mode == 'credentials':
+        identity_id = _lookup_identity_id(claims['sub'], token)
+        credentials = _call_identity_pool('get_credentials_for_identity', IdentityId=identity_id,
+                                          Logins=_get_logins(token))['Credentials']
+    else:
+        raise ValueError(f'Unknown AWS identity mode: {settings.aws_identity_mode}')
+
+    try:
+        identity_object = AWSIdentity.parse_obj({'IdentityId': identity_id, 'Credentials': credentials})
+        identity_object.cognito_claims = claims
+    except Exception as ex:
+        raise AWSServicesException(recommended_status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=repr(ex))
+
+    return identity_object
+
+
+def _lookup_identity_id(sub: str, token: str) -> str:
+    """
+    The identity id of a sub never changes, so it is looked up in the in-process cache, then in the identity id
+    store, and only asked from Cognito Identity when neither has it. The store is an optimization: when it fails,
+    resolution goes on with get_id.
+    """
+    identity_id_cache = get_identity_id_cache()
+    identity_id = identity_id_cache.get(sub)
+    if identity_id is not None:
+        return identity_id
+    identity_id_store = get_identity_id_store()
+    if identity_id_store is not None:
+        try:
+            identity_id = identity_id_store.get(sub)
+        except Exception as ex:
+            logging.error(ex)
+    if identity_id is None:
+        identity_id = _get_identity_id(token)
+        if identity_id_store is not None:
+            try:
+                identity_id_store.put(sub, identity_id)
+            except Exception as ex:
+                logging.error(ex)
+    identity_id_cache.put(sub, identity_id)
+    return identity_id
+
+
+def _get_identity_id(token: str) -> str:
+    settings = get_settings()
+    return _call_identity_pool('get_id', AccountId=settings.aws_account_id,
+                               IdentityPoolId=settings.cognito_identity_pool_id,
+                               Logins=_get_logins(token))['IdentityId']
+
+
+def _get_logins(token: str) -> dict:
+    settings = get_settings()
     user_pool_full_identifier = f'cognito-idp.{settings.aws_region}.amazonaws.com/{settings.cognito_user_pool_id}'
+    return {user_pool_full_identifier: token}
+
+
+def _call_identity_pool(operation: str, **kwargs) -> dict:
+    identity_client = aws_clients.get_client('cognito-identity')
     try:
-        id_response = identity_client.get_id(AccountId=settings.aws_account_id,
-                                             IdentityPoolId=settings.cognito_identity_pool_id,
-                                             Logins={
-                                                 user_pool_full_identifier: token
-                                             })
-        identity_id = id_response['IdentityId']
-        credentials = identity_client.get_credentials_for_identity(IdentityId=identity_id, Logins={
-            user_pool_full_identifier: token
-        })
+        return call_aws(getattr(identity_client, operation), **kwargs)
     except identity_client.exceptions.NotAuthorizedException:
         raise AWSServicesException(recommended_status_code=status.HTTP_401_UNAUTHORIZED,
                                    detail="AWS exception: not authorized")
+    except (identity_client.exceptions.TooManyRequestsException,
+            identity_client.exceptions.LimitExceededException) as ex:
+        logging.warning(ex)
+        raise AWSServicesException(recommended_status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                   detail='Too many requests, try again later')
     except (identity_client.exceptions.ResourceNotFoundException,
             identity_client.exceptions.ResourceConflictException,
-            identity_client.exceptions.TooManyRequestsException,
-            identity_client.exceptions.LimitExceededException,
             identity_client.exceptions.InternalErrorException,
             identity_client.exceptions.ExternalServiceException,
             identity_client.exceptions.InvalidIdentityPoolConfigurationException,
@@ -35,14 +143,3 @@ def get_aws_identity(token: str) -> AWSIdentity:
             ) as ex:
         logging.error(ex)
         raise AWSServicesException(recommended_status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=repr(ex))
-
-    try:
-        claims = cognitojwt.decode(token, settings.aws_region, settings.cognito_user_pool_id,
-                                   settings.cognito_client_id, testmode=False)
-        identity_object = AWSIdentity.parse_obj(credentials)
-        identity_object.cognito_claims = claims
-    except Exception as ex:
-        raise AWSServicesException(recommended_status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=repr(ex))
-
-    return identity_object
-
@@ -2,15 +2,18 @@ import base64
 import hashlib
 import hmac
 import logging
-import boto3
-from app.settings import Settings
+from app.settings import get_settings
 from app.exceptions import AWSServicesException
+from app.utils import aws_clients
+from app.utils.metrics import timed
+from app.utils.throttling import call_aws
 from fastapi import status
 
 
+@timed('cognito.sign_up')
 def sign_up(username: str, password: str, email: str):
-    client = boto3.client('cognito-idp')
-    settings = Settings()
+    client = aws_clients.get_client('cognito-idp')
+    settings = get_settings()
     _call_client(client.sign_up,
                  ClientId=settings.cognito_client_id,
                  Username=username,
@@ -29,18 +32,20 @@ def sign_up(username: str, password: str, email: str):
                  )
 
 
+@timed('cognito.add_user_to_default_group')
 def add_user_to_default_group(username: str):
-    client = boto3.client('cognito-idp')
-    settings = Settings()
+    client = aws_clients.get_client('cognito-idp')
+    settings = get_settings()
     _call_client(client.admin_add_user_to_group,
                  UserPoolId=settings.cognito_user_pool_id,
                  Username=username,
                  GroupName=settings.cognito_regular_user_group_name)
 
 
+@timed('cognito.confirm_sign_up')
 def confirm_sign_up(username: str, confirmation_code: str):
-    client = boto3.client('cognito-idp')
-    settings = Settings()
+    client = aws_clients.get_client('cognito-idp')
+    settings = get_settings()
     _call_client(client.confirm_sign_up,
                  ClientId=settings.cognito_client_id,
                  Username=username,
@@ -49,9 +54,10 @@ def confirm_sign_up(username: str, confirmation_code: str):
                  )
 
 
+@timed('cognito.initiate_auth')
 def initiate_auth(username: str, password: str):
-    client = boto3.client('cognito-idp')
-    settings = Settings()
+    client = aws_clients.get_client('cognito-idp')
+    settings = get_settings()
     response = _call_client(client.initiate_auth,
                             AuthFlow='USER_PASSWORD_AUTH',
                             ClientId=settings.cognito_client_id,
@@ -70,17 +76,20 @@ def initiate_auth(username: str, password: str):
 
 
 def _call_client(method, **kwargs):
-    client = boto3.client('cognito-idp')
+    client = aws_clients.get_client('cognito-idp')
     try:
-        return method(**kwargs)
+        return call_aws(method, **kwargs)
+    except (client.exceptions.TooManyRequestsException,
+            client.exceptions.LimitExceededException) as ex:
+        logging.warning(ex)
+        raise AWSServicesException(recommended_status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                   detail='Too many requests, try again later')
     except (client.exceptions.ResourceNotFoundException,
             client.exceptions.InvalidParameterException,
             client.exceptions.UnexpectedLambdaException,
             client.exceptions.UserLambdaValidationException,
             client.exceptions.InvalidLambdaResponseException,
-            client.exceptions.TooManyRequestsException,
             client.exceptions.TooManyFailedAttemptsException,
-            client.exceptions.LimitExceededException,
             client.exceptions.AliasExistsException,
             client.exceptions.InternalErrorException,
             client.exceptions.InvalidSmsRoleAccessPolicyException,
@@ -113,7 +122,7 @@ def _call_client(method, **kwargs):
 
 
 def _generate_secret_hash(username):
-    settings = Settings()
+    settings = get_settings()
     app_client_id = settings.cognito_client_id
     app_client_secret = settings.cognito_client_secret
     message = bytes(username + app_client_id, 'utf-8')
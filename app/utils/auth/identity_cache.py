@@ -0,0 +1,113 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.schemas import AWSIdentity
+
+# Credentials are treated as expired this long before their expiration, both by this cache and by the DynamoDB model
+# cache, so calls in flight don't run into ExpiredTokenException and fresh credentials are fetched before the model
+# cache rejects the old ones.
+CREDENTIALS_EXPIRATION_MARGIN = 60
+
+
+class IdentityCache:
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[AWSIdentity]:
+        key = self._get_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                identity, expires_at = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return identity
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, identity: AWSIdentity):
+        expires_at = self._get_expiration_timestamp(identity)
+        if expires_at <= time.time() or self.max_size <= 0:
+            return
+        key = self._get_key(token)
+        with self._lock:
+            self._entries[key] = (identity, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _get_key(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _get_expiration_timestamp(identity: AWSIdentity) -> float:
+        expiration_timestamps = [math.inf]
+        if identity.credentials is not None:
+            expiration_timestamps.append(identity.credentials.expiration.timestamp() - CREDENTIALS_EXPIRATION_MARGIN)
+        token_expiration = identity.cognito_claims.get('exp')
+        if token_expiration is not None:
+            expiration_timestamps.append(float(token_expiration))
+        return min(expiration_timestamps)
+
+
+class IdentityIdCache:
+    """
+    Maps user pool subs to Cognito identity ids. An identity id never changes for a given sub, so entries only
+    leave the cache when they are evicted.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sub: str) -> Optional[str]:
+        with self._lock:
+            identity_id = self._entries.get(sub)
+            if identity_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(sub)
+            self.hits += 1
+            return identity_id
+
+    def put(self, sub: str, identity_id: str):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[sub] = identity_id
+            self._entries.move_to_end(sub)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
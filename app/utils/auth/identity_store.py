@@ -0,0 +1,68 @@
+import sqlite3
+import threading
+from typing import Optional
+
+from app.settings import get_settings
+
+
+class SQLiteIdentityIdStore:
+    """Keeps sub to identity id mappings in a SQLite database, for running without DynamoDB on a single host."""
+
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS identity_ids ('
+              ' sub TEXT NOT NULL,'
+              ' identity_pool_id TEXT NOT NULL,'
+              ' identity_id TEXT NOT NULL,'
+              ' PRIMARY KEY (sub, identity_pool_id)'
+              ') WITHOUT ROWID')
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute(self.SCHEMA)
+
+    def get(self, sub: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute('SELECT identity_id FROM identity_ids WHERE sub = ? AND identity_pool_id = ?',
+                                          (sub, get_settings().cognito_identity_pool_id)).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, sub: str, identity_id: str):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO identity_ids (sub, identity_pool_id, identity_id) '
+                                    'VALUES (?, ?, ?)', (sub, get_settings().cognito_identity_pool_id, identity_id))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+_identity_id_store = None
+_identity_id_store_lock = threading.Lock()
+
+
+def get_identity_id_store():
+    global _identity_id_store
+    settings = get_settings()
+    if not settings.identity_id_store:
+        return None
+    if _identity_id_store is None:
+        with _identity_id_store_lock:
+            if _identity_id_store is None:
+                if settings.identity_id_store == 'dynamodb':
+                    # Imported here so that PynamoDB is only loaded when the mappings live in DynamoDB.
+                    from app.utils.dynamodb_service import DynamoDBIdentityIdStore
+                    _identity_id_store = DynamoDBIdentityIdStore()
+                elif settings.identity_id_store == 'sqlite':
+                    _identity_id_store = SQLiteIdentityIdStore(settings.identity_id_sqlite_path)
+                else:
+                    raise ValueError(f'Unknown identity id store: {settings.identity_id_store}')
+    return _identity_id_store
+
+
+def reset_identity_id_store():
+    global _identity_id_store
+    with _identity_id_store_lock:
+        if isinstance(_identity_id_store, SQLiteIdentityIdStore):
+            _identity_id_store.close()
+        _identity_id_store = None
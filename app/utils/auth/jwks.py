@@ -0,0 +1,157 @@
+import json
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from jose import jwk, jwt
+from jose.exceptions import JOSEError
+from jose.utils import base64url_decode
+from fastapi import status
+
+from app.exceptions import AWSServicesException
+from app.settings import get_settings
+from app.utils.metrics import timed
+
+CLIENT_ID_CLAIMS = {
+    'access': 'client_id',
+    'id': 'aud'
+}
+
+
+class JWKSVerifier:
+
+    def __init__(self, jwks_location: str, issuer: str, app_client_id: str,
+                 refresh_interval: float = 3600, unknown_kid_reload_interval: float = 60,
+                 failed_reload_interval: float = 5):
+        self.jwks_location = jwks_location
+        self.issuer = issuer
+        self.app_client_id = app_client_id
+        self.refresh_interval = refresh_interval
+        self.unknown_kid_reload_interval = unknown_kid_reload_interval
+        self.failed_reload_interval = failed_reload_interval
+        self._keys = {}
+        self._loaded_at = None
+        # After a failed fetch no request tries again before this time, so an outage of the JWKS endpoint does not
+        # make every request wait for its own fetch.
+        self._retry_at = None
+        self._lock = threading.Lock()
+
+    def verify(self, token: str) -> Dict:
+        try:
+            message, encoded_signature = str(token).rsplit('.', 1)
+            headers = jwt.get_unverified_header(token)
+            claims = jwt.get_unverified_claims(token)
+            signature = base64url_decode(encoded_signature.encode('utf-8'))
+        except (ValueError, JOSEError):
+            raise self._unauthorized('Token is malformed')
+
+        public_key = self._get_public_key(headers.get('kid'))
+        if public_key is None:
+            raise self._unauthorized('Public key not found in JWKS')
+        if not public_key.verify(message.encode('utf-8'), signature):
+            raise self._unauthorized('Signature verification failed')
+
+        self._check_claims(claims)
+        return claims
+
+    def _get_public_key(self, kid: Optional[str]):
+        if kid is None:
+            return None
+        if self._needs_reload(kid, time.monotonic()):
+            # A request whose key is already known keeps using it rather than waiting for a reload in progress.
+            if self._lock.acquire(blocking=kid not in self._keys):
+                try:
+                    # Another request may have reloaded the keys while this one waited for the lock.
+                    if self._needs_reload(kid, time.monotonic()):
+                        self._load_keys()
+                finally:
+                    self._lock.release()
+        public_key = self._keys.get(kid)
+        if public_key is None and (self._loaded_at is None or self._in_backoff(time.monotonic())):
+            # The key may exist in a keyset we could not fetch; answering 401 would make clients drop valid tokens.
+            raise self._unavailable('JWKS is unavailable')
+        return public_key
+
+    def _in_backoff(self, now: float) -> bool:
+        return self._retry_at is not None and now < self._retry_at
+
+    def _needs_reload(self, kid: str, now: float) -> bool:
+        if self._in_backoff(now):
+            return False
+        if self._loaded_at is None:
+            return True
+        age = now - self._loaded_at
+        return age >= self.refresh_interval or (kid not in self._keys and age >= self.unknown_kid_reload_interval)
+
+    def _load_keys(self):
+        now = time.monotonic()
+        try:
+            raw_keys = self._read_jwks()
+        except (OSError, ValueError, requests.RequestException) as ex:
+            logging.error(ex)
+            self._retry_at = now + self.failed_reload_interval
+            if not self._keys:
+                raise self._unavailable(repr(ex))
+            return
+        keys = {}
+        for raw_key in raw_keys:
+            try:
+                keys[raw_key['kid']] = jwk.construct(raw_key)
+            except (KeyError, JOSEError) as ex:
+                logging.warning(f'Skipping unusable JWKS key: {ex!r}')
+        self._keys = keys
+        self._loaded_at = now
+        self._retry_at = None
+
+    def _read_jwks(self):
+        if self.jwks_location.startswith('http'):
+            response = requests.get(self.jwks_location, timeout=5)
+            response.raise_for_status()
+            jwks = response.json()
+        else:
+            with open(self.jwks_location, 'r') as f:
+                jwks = json.load(f)
+        return jwks.get('keys', [])
+
+    def _check_claims(self, claims: Dict):
+        if time.time() > claims.get('exp', 0):
+            raise self._unauthorized('Token is expired')
+        if claims.get('iss') != self.issuer:
+            raise self._unauthorized('Token was not issued by the configured user pool')
+        client_id_claim = CLIENT_ID_CLAIMS.get(claims.get('token_use'))
+        if client_id_claim is None:
+            raise self._unauthorized('Invalid token_use')
+        if claims.get(client_id_claim) != self.app_client_id:
+            raise self._unauthorized('Token was not issued for this client id audience')
+
+    @staticmethod
+    def _unauthorized(detail: str) -> AWSServicesException:
+        return AWSServicesException(recommended_status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+    @staticmethod
+    def _unavailable(detail: str) -> AWSServicesException:
+        return AWSServicesException(recommended_status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail)
+
+
+_jwt_verifier = None
+
+
+def get_jwt_verifier() -> JWKSVerifier:
+    global _jwt_verifier
+    settings = get_settings()
+    issuer = f'https://cognito-idp.{settings.aws_region}.amazonaws.com/{settings.cognito_user_pool_id}'
+    jwks_location = settings.cognito_jwks_path or f'{issuer}/.well-known/jwks.json'
+    verifier = _jwt_verifier
+    if verifier is None or (verifier.jwks_location, verifier.issuer, verifier.app_client_id) != \
+            (jwks_location, issuer, settings.cognito_client_id):
+        verifier = JWKSVerifier(jwks_location, issuer, settings.cognito_client_id,
+                                refresh_interval=settings.jwks_refresh_interval)
+        _jwt_verifier = verifier
+    return verifier
+
+
+@timed('jwt.verify')
+def verify_token(token: str) -> Dict:
+    return get_jwt_verifier().verify(token)
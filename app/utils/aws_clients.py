@@ -0,0 +1,56 @@
+import threading
+
+from app.settings import get_settings
+
+# boto3 and botocore are imported on first use to keep them out of the Lambda cold-start import path.
+
+# Calls to these services go through app.utils.throttling.call_aws, which owns rate limiting and retries, so botocore
+# makes a single attempt instead of multiplying the retries.
+APP_RETRIED_SERVICES = ('cognito-idp', 'cognito-identity')
+
+_clients = {}
+_session = None
+_lock = threading.Lock()
+
+
+def get_client(service_name: str):
+    client = _clients.get(service_name)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(service_name)
+        if client is None:
+            client = _get_session().client(service_name, config=get_client_config(service_name))
+            _clients[service_name] = client
+    return client
+
+
+def set_client(service_name: str, client):
+    with _lock:
+        _clients[service_name] = client
+
+
+def reset_clients():
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
+
+
+def get_client_config(service_name: str = None):
+    from botocore.config import Config
+    settings = get_settings()
+    return Config(max_pool_connections=settings.aws_client_max_pool_connections,
+                  tcp_keepalive=True,
+                  retries={
+                      'mode': 'adaptive',
+                      'max_attempts': 0 if service_name in APP_RETRIED_SERVICES else settings.aws_client_max_attempts
+                  })
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        import boto3.session
+        _session = boto3.session.Session()
+    return _session
@@ -0,0 +1,109 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+
+from app.settings import get_settings
+from app.utils import aws_clients
+
+
+class S3BlobStore:
+
+    def __init__(self, bucket: str, max_concurrency: int = 16):
+        self.bucket = bucket
+        self.max_concurrency = max_concurrency
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def client(self):
+        return aws_clients.get_client('s3')
+
+    def put(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def get(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def get_many(self, keys: List[str]) -> List[bytes]:
+        """Fetches several blobs concurrently, in the order of their keys."""
+        if len(keys) <= 1:
+            return [self.get(key) for key in keys]
+        return list(self._get_executor().map(self.get, keys))
+
+    def delete(self, keys: Iterable[str]):
+        keys = list(keys)
+        # DeleteObjects takes at most 1000 keys per request.
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket,
+                                       Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]],
+                                               'Quiet': True})
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                        thread_name_prefix='blob-store')
+        return self._executor
+
+
+class FileSystemBlobStore:
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_name(f'{path.name}.tmp')
+        temporary_path.write_bytes(data)
+        os.replace(temporary_path, path)
+
+    def get(self, key: str) -> bytes:
+        return self._path(key).read_bytes()
+
+    def get_many(self, keys: List[str]) -> List[bytes]:
+        return [self.get(key) for key in keys]
+
+    def delete(self, keys: Iterable[str]):
+        for key in keys:
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f'Blob key escapes the store root: {key}')
+        return path
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store() -> Optional[Union[S3BlobStore, FileSystemBlobStore]]:
+    global _blob_store
+    settings = get_settings()
+    if not settings.notes_blob_backend:
+        return None
+    if _blob_store is None:
+        with _blob_store_lock:
+            if _blob_store is None:
+                if settings.notes_blob_backend == 's3':
+                    _blob_store = S3BlobStore(settings.notes_blob_bucket,
+                                              max_concurrency=settings.notes_blob_max_concurrency)
+                elif settings.notes_blob_backend == 'filesystem':
+                    _blob_store = FileSystemBlobStore(settings.notes_blob_path)
+                else:
+                    raise ValueError(f'Unknown notes blob backend: {settings.notes_blob_backend}')
+    return _blob_store
+
+
+def reset_blob_store():
+    global _blob_store
+    with _blob_store_lock:
+        _blob_store = None
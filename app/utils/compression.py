@@ -0,0 +1,189 @@
+import base64
+import zlib
+from typing import Dict, Optional
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.utils.etags import get_encoded_etag
+from app.utils.metrics import is_running_in_lambda
+
+# Lambda CPU scales with the configured memory, so it gets cheaper levels: most of the size reduction of the
+# default levels at a fraction of their CPU time.
+GZIP_LEVEL = 6
+LAMBDA_GZIP_LEVEL = 4
+BROTLI_QUALITY = 5
+LAMBDA_BROTLI_QUALITY = 4
+
+
+class GzipCompressor:
+
+    def __init__(self, level: int):
+        # wbits=31 writes the gzip container around the deflate stream.
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies of at least minimum_size bytes with brotli or gzip, whichever the client prefers in
+    Accept-Encoding. Streamed bodies are compressed chunk by chunk and flushed after every chunk, so clients still
+    receive them incrementally. A compressed response's ETag gets the coding appended, and so does that of a 304
+    answering a tag which carried it. Levels left as None are picked for the environment: cheaper ones under Lambda.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = None, brotli_quality: int = None):
+        in_lambda = is_running_in_lambda()
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level if gzip_level is not None else LAMBDA_GZIP_LEVEL if in_lambda else GZIP_LEVEL
+        self.brotli_quality = (brotli_quality if brotli_quality is not None
+                               else LAMBDA_BROTLI_QUALITY if in_lambda else BROTLI_QUALITY)
+        self.encodings = ('br', 'gzip')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = select_encoding(Headers(scope=scope).get('accept-encoding', ''), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressionResponder(self.app, encoding, self._get_compressor, self.minimum_size)(scope, receive,
+                                                                                                 send)
+
+    def _get_compressor(self, encoding: str):
+        if encoding == 'br':
+            return BrotliCompressor(self.brotli_quality)
+        return GzipCompressor(self.gzip_level)
+
+
+class _CompressionResponder:
+
+    def __init__(self, app, encoding: str, get_compressor, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.get_compressor = get_compressor
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        self.compressor = None
+        self.started = False
+        self.encoded_etag_requested = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        self.encoded_etag_requested = f'-{self.encoding}"' in Headers(scope=scope).get('if-none-match', '')
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if message['type'] == 'http.response.start':
+            # Held back until the first body chunk shows whether the response is worth compressing.
+            self.start_message = message
+            return
+        if message['type'] != 'http.response.body':
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if not self.started:
+            self.started = True
+            headers = MutableHeaders(raw=self.start_message['headers'])
+            if self.start_message['status'] == 304 and 'etag' in headers and self.encoded_etag_requested:
+                headers['ETag'] = get_encoded_etag(headers['ETag'], self.encoding)
+            if 'content-encoding' in headers or (len(body) < self.minimum_size and not more_body):
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+            self.compressor = self.get_compressor(self.encoding)
+            headers['Content-Encoding'] = self.encoding
+            headers.add_vary_header('Accept-Encoding')
+            if 'etag' in headers:
+                headers['ETag'] = get_encoded_etag(headers['ETag'], self.encoding)
+            if more_body:
+                del headers['Content-Length']
+            else:
+                body = self.compressor.compress(body) + self.compressor.finish()
+                headers['Content-Length'] = str(len(body))
+                await self.send(self.start_message)
+                await self.send({'type': 'http.response.body', 'body': body})
+                return
+            await self.send(self.start_message)
+        elif self.compressor is None:
+            await self.send(message)
+            return
+
+        if more_body:
+            body = self.compressor.compress(body) + self.compressor.flush()
+        else:
+            body = self.compressor.compress(body) + self.compressor.finish()
+        await self.send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+
+
+def select_encoding(accept_encoding: str, encodings) -> Optional[str]:
+    """
+    Picks the supported encoding with the highest quality value in an Accept-Encoding header, preferring the
+    earlier one in encodings on ties. '*' stands for any encoding not listed explicitly.
+    """
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(','):
+        coding, _, parameters = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        name, _, value = parameters.strip().partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[coding] = quality
+
+    wildcard = qualities.get('*', 0.0)
+    best_encoding = None
+    best_quality = 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+    return best_encoding
+
+
+def encode_compressed_lambda_body(lambda_response: Dict) -> Dict:
+    """
+    Mangum sends JSON and text bodies as plain strings and only base64 encodes them when they fail to decode as
+    UTF-8, which a brotli stream may not. A compressed body has to reach API Gateway base64 encoded and flagged
+    with isBase64Encoded, so this re-encodes the original bytes of any compressed body Mangum left as text.
+    """
+    headers = {name.lower(): value for name, value in (lambda_response.get('headers') or {}).items()}
+    multi_value_headers = {name.lower() for name in (lambda_response.get('multiValueHeaders') or {})}
+    compressed = 'content-encoding' in headers or 'content-encoding' in multi_value_headers
+    if compressed and lambda_response.get('body') and not lambda_response.get('isBase64Encoded'):
+        lambda_response['body'] = base64.b64encode(lambda_response['body'].encode('utf-8')).decode('ascii')
+        lambda_response['isBase64Encoded'] = True
+    return lambda_response
@@ -0,0 +1,29 @@
+import functools
+
+import anyio
+from anyio import to_thread
+
+from app.settings import get_settings
+
+_limiter = None
+
+
+def get_limiter() -> anyio.CapacityLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(get_settings().blocking_io_max_threads)
+    return _limiter
+
+
+async def run_blocking(func, *args, **kwargs):
+    return await to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=get_limiter())
+
+
+async def iterate_blocking(iterator):
+    iterator = iter(iterator)
+    sentinel = object()
+    while True:
+        item = await run_blocking(next, iterator, sentinel)
+        if item is sentinel:
+            break
+        yield item
@@ -1,76 +1,593 @@
+import itertools
+import logging
+import threading
+import time
 import uuid
-from app.schemas import AWSIdentity
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Type
 from ..exceptions import AWSServicesException
+from pynamodb.constants import ALL_OLD, ATTRIBUTES, BATCH_WRITE_PAGE_LIMIT
+from pynamodb.exceptions import PynamoDBException, DeleteError, PutError, UpdateError, TransactWriteError
+from pynamodb.indexes import GlobalSecondaryIndex, AllProjection
 from pynamodb.models import Model
-from pynamodb.attributes import UnicodeAttribute
-from app.settings import Settings
-from app.schemas import Note, StoredNote
+from pynamodb.pagination import ResultIterator
+from pynamodb.transactions import TransactWrite
+from pynamodb.attributes import UnicodeAttribute, NumberAttribute, BinaryAttribute
+from app.settings import get_settings
+from app.schemas import AWSIdentity, AWSIdentityCredentials, Note, StoredNote, NotesPage, NoteSummary, \
+    NoteSummariesPage, BatchNote, BatchItemResult, BatchResult, NotesBatchGetResult, NoteDeletion, NoteChangesPage
+from app.utils.auth.identity_cache import CREDENTIALS_EXPIRATION_MARGIN
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.blob_store import get_blob_store
+from app.utils.metrics import instrument_dynamodb_connection
+from app.utils.notes_backends import NotesBackend
 from fastapi import status
 
-settings = Settings()
 
+class UpdatedAtIndex(GlobalSecondaryIndex):
+    user_id = UnicodeAttribute(hash_key=True)
+    updated_at = NumberAttribute(range_key=True)
+
+    class Meta:
+        index_name = 'updated_at_index'
+        projection = AllProjection()
+
+
+class NotesTableModel(Model):
+    """Base of the models kept in the notes table, which is looked up from the settings on first use."""
 
-class DynamoDBNote(Model):
+    class Meta:
+        table_name = None
+
+    @classmethod
+    def _get_connection(cls):
+        if cls.Meta.table_name is None:
+            settings = get_settings()
+            cls.Meta.table_name = settings.dynamo_db_notes_table
+            cls.Meta.region = settings.aws_region
+        connection = super()._get_connection()
+        instrument_dynamodb_connection(connection.connection)
+        return connection
+
+
+class DynamoDBNote(NotesTableModel):
     user_id = UnicodeAttribute(hash_key=True)
     contents = UnicodeAttribute(range_key=True)
-    title = UnicodeAttribute()
-    text = UnicodeAttribute()
+    # Tombstones left behind by deletes carry no title or text.
+    title = UnicodeAttribute(null=True)
+    # A note body is kept in exactly one of text, text_compressed (zlib) or text_blob (key of a zlib-compressed
+    # object in the blob store), depending on its size.
+    text = UnicodeAttribute(null=True)
+    text_compressed = BinaryAttribute(null=True)
+    text_blob = UnicodeAttribute(null=True)
+    # Microseconds since the epoch, refreshed on every write; notes stored before it existed have none and stay
+    # out of the sparse updated_at_index.
+    updated_at = NumberAttribute(null=True)
+    updated_at_index = UpdatedAtIndex()
+    # Seconds since the epoch after which DynamoDB's TTL removes a tombstone; the table's TTL attribute.
+    expires_at = NumberAttribute(null=True)
 
-    class Meta:
-        table_name = settings.dynamo_db_notes_table
-        region = settings.aws_region
+
+class IdentityIdMapping(NotesTableModel):
+    # Lives in the notes table: the sub is never an identity id, and the range key never starts with a note prefix,
+    # so mappings stay out of note queries and, having no updated_at, out of the updated_at_index.
+    user_id = UnicodeAttribute(hash_key=True)
+    contents = UnicodeAttribute(range_key=True)
+    identity_id = UnicodeAttribute()
+
+
+class DynamoDBIdentityIdStore:
+    """Keeps sub to identity id mappings as items of the notes table, under a range key reserved per identity pool."""
+
+    def get(self, sub: str) -> Optional[str]:
+        try:
+            return IdentityIdMapping.get(hash_key=sub, range_key=self._get_range_key()).identity_id
+        except IdentityIdMapping.DoesNotExist:
+            return None
+
+    def put(self, sub: str, identity_id: str):
+        IdentityIdMapping(sub, contents=self._get_range_key(), identity_id=identity_id).save()
+
+    @staticmethod
+    def _get_range_key() -> str:
+        return f'identity_id_{get_settings().cognito_identity_pool_id}'
+
+
+class IdentityModelCache:
+    """
+    DynamoDBNote subclasses signing their calls with an identity's temporary credentials, one per identity, so that
+    its connection and botocore client are reused across requests. Every credentials fetch returns a new key pair,
+    so an entry serves any token of its identity until its own credentials are about to expire, and is only
+    replaced by credentials that expire later.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, identity: AWSIdentity) -> Type[DynamoDBNote]:
+        with self._lock:
+            model = self._get_unexpired(identity.identity_id)
+        if model is not None:
+            return model
+        credentials = identity.credentials
+        expires_at = credentials.expiration.timestamp() - CREDENTIALS_EXPIRATION_MARGIN
+        model = self._create_model(credentials)
+        with self._lock:
+            entry = self._entries.get(identity.identity_id)
+            if entry is not None and entry[1] >= expires_at:
+                # Another request stored credentials that last at least as long in the meantime.
+                self._entries.move_to_end(identity.identity_id)
+                return entry[0]
+            self._entries[identity.identity_id] = (model, expires_at)
+            self._entries.move_to_end(identity.identity_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return model
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get_unexpired(self, identity_id: str) -> Optional[Type[DynamoDBNote]]:
+        entry = self._entries.get(identity_id)
+        if entry is None:
+            return None
+        model, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[identity_id]
+            return None
+        self._entries.move_to_end(identity_id)
+        return model
+
+    @staticmethod
+    def _create_model(credentials: AWSIdentityCredentials) -> Type[DynamoDBNote]:
+        settings = get_settings()
+        meta = type('Meta', (), {'table_name': settings.dynamo_db_notes_table,
+                                 'region': settings.aws_region,
+                                 'aws_access_key_id': credentials.access_key_id,
+                                 'aws_secret_access_key': credentials.secret_key,
+                                 'aws_session_token': credentials.session_token})
+        # _connection is reset because a subclass would otherwise pick up DynamoDBNote's connection, which PynamoDB
+        # reuses for any model on the same table.
+        return type('IdentityDynamoDBNote', (DynamoDBNote,), {'Meta': meta, '_connection': None,
+                                                              '__module__': __name__})
 
 
-class NotesDBService:
+_identity_model_cache = None
+
+
+def get_identity_model_cache() -> IdentityModelCache:
+    global _identity_model_cache
+    if _identity_model_cache is None:
+        _identity_model_cache = IdentityModelCache(max_size=get_settings().identity_connections_max_size)
+    return _identity_model_cache
+
+
+class DynamoDBNotesBackend(NotesBackend):
+    """
+    Keeps notes in the DynamoDB notes table, one item per note under the identity's partition. Large bodies are
+    compressed or offloaded to the blob store, and deletes leave tombstone items for the updated_at_index, which
+    expire through the table's TTL on expires_at (to be enabled on the table) after NOTES_TOMBSTONE_TTL seconds.
+    Identities resolved with temporary credentials (AWS_IDENTITY_MODE=credentials) reach the table with those,
+    the others with the service's own credentials.
+    """
 
     def __init__(self, identity: AWSIdentity):
-        self.identity = identity
+        super().__init__(identity)
+        self.model = get_identity_model_cache().get(identity) if identity.credentials is not None else DynamoDBNote
 
     def create_note(self, note: Note):
         note_id = f'{uuid.uuid4().hex}'
-        dynamodb_note = DynamoDBNote(self.identity.identity_id,
-                                     contents=self._get_range_key_from_note_id(note_id),
-                                     title=note.title, text=note.text)
-        dynamodb_note.save()
-        return self._get_stored_note_from_dynamodb_note(dynamodb_note)
+        dynamodb_note = self.model(self.identity.identity_id,
+                                   contents=self._get_range_key_from_note_id(note_id),
+                                   title=note.title, updated_at=self._get_timestamp())
+        self._set_text(dynamodb_note, note.text)
+        try:
+            dynamodb_note.save()
+        except PutError as ex:
+            self._delete_blobs([dynamodb_note.text_blob])
+            self._raise_for_item_too_large(ex)
+            logging.error(ex)
+            raise AWSServicesException(recommended_status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=repr(ex))
+        # Built from the request rather than the item, which would read an offloaded body back from the blob store.
+        stored_note = StoredNote.construct(title=note.title, text=note.text, note_id=note_id,
+                                           updated_at=dynamodb_note.updated_at)
+        self._index_note(stored_note)
+        return stored_note
 
-    def get_notes(self):
-        notes = DynamoDBNote.query(hash_key=self.identity.identity_id,
-                                   range_key_condition=DynamoDBNote.contents.startswith('note_'))
-        return [self._get_stored_note_from_dynamodb_note(note) for note in notes]
+    def get_notes(self, limit: int, cursor: str = None) -> NotesPage:
+        last_evaluated_key = decode_cursor(cursor, self.identity.identity_id, self._get_note_id_prefix())
+        notes = self._query_stored_notes(limit=limit, last_evaluated_key=last_evaluated_key)
+        stored_notes = self._load_blob_texts(list(notes))
+        return NotesPage.construct(notes=stored_notes, next_cursor=encode_cursor(notes.last_evaluated_key))
+
+    def get_note_summaries(self, limit: int, cursor: str = None, preview_length: int = None) -> NoteSummariesPage:
+        last_evaluated_key = decode_cursor(cursor, self.identity.identity_id, self._get_note_id_prefix())
+        attributes_to_get = [DynamoDBNote.contents.attr_name, DynamoDBNote.title.attr_name]
+        if preview_length:
+            attributes_to_get.extend([DynamoDBNote.text.attr_name, DynamoDBNote.text_compressed.attr_name,
+                                      DynamoDBNote.text_blob.attr_name])
+        notes = self.model.query(hash_key=self.identity.identity_id,
+                                 range_key_condition=DynamoDBNote.contents.startswith(self._get_note_id_prefix()),
+                                 limit=limit,
+                                 last_evaluated_key=last_evaluated_key,
+                                 attributes_to_get=attributes_to_get)
+        dynamodb_notes = list(notes)
+        texts = self._get_texts(dynamodb_notes) if preview_length else [None] * len(dynamodb_notes)
+        summaries = [NoteSummary(note_id=self._get_stored_note_id_from_range_key(note.contents), title=note.title,
+                                 preview=text[:preview_length] if preview_length else None)
+                     for note, text in zip(dynamodb_notes, texts)]
+        return NoteSummariesPage(notes=summaries, next_cursor=encode_cursor(notes.last_evaluated_key))
+
+    def export_notes(self, page_size: int):
+        notes = self._query_stored_notes(page_size=page_size)
+        while True:
+            page = list(itertools.islice(notes, page_size))
+            if not page:
+                return
+            yield from self._load_blob_texts(page)
+
+    def get_note_changes(self, since: int, limit: int, cursor: str = None) -> NoteChangesPage:
+        last_evaluated_key = decode_cursor(cursor, self.identity.identity_id,
+                                           (self._get_note_id_prefix(), self._get_tombstone_prefix()),
+                                           index_key_names=(DynamoDBNote.updated_at.attr_name,))
+        read_at = self._get_timestamp()
+        # Queried through the model rather than updated_at_index, which is bound to DynamoDBNote and its connection.
+        changes = self.model.query(self.identity.identity_id,
+                                   range_key_condition=DynamoDBNote.updated_at > since,
+                                   index_name=DynamoDBNote.updated_at_index.Meta.index_name,
+                                   limit=limit,
+                                   last_evaluated_key=last_evaluated_key)
+        upserts = []
+        deletions = []
+        for change in changes:
+            if change.contents.startswith(self._get_note_id_prefix()):
+                upserts.append(change)
+            elif change.contents.startswith(self._get_tombstone_prefix()):
+                deletions.append(NoteDeletion(note_id=change.contents[len(self._get_tombstone_prefix()):],
+                                              deleted_at=change.updated_at))
+        upserts = self._get_stored_notes_from_dynamodb_notes(upserts)
+        next_cursor = encode_cursor(changes.last_evaluated_key)
+        return NoteChangesPage.construct(upserts=upserts, deletions=deletions, next_cursor=next_cursor,
+                                         sync_token=None if next_cursor else self._get_sync_token(since, read_at))
 
     def get_note(self, note_id: str):
         note = self._get_dynamodb_note(note_id)
         return self._get_stored_note_from_dynamodb_note(note)
 
     def delete_note(self, note_id: str):
-        note = self._get_dynamodb_note(note_id)
-        note.delete()
+        if get_blob_store() is None:
+            self._delete_note_in_transaction(note_id)
+        else:
+            self._delete_note_and_blob(note_id)
+        self._unindex_note(note_id)
 
-    def update_note(self, note_id: str, title: str = None, text: str = None):
-        note = self._get_dynamodb_note(note_id)
+    def _delete_note_in_transaction(self, note_id: str):
+        note = self.model(self.identity.identity_id, contents=self._get_range_key_from_note_id(note_id))
+        try:
+            with TransactWrite(connection=self.model._get_connection().connection) as transaction:
+                transaction.delete(note, condition=DynamoDBNote.contents.exists())
+                transaction.save(self._get_tombstone(note_id, self._get_timestamp()))
+        except TransactWriteError as ex:
+            reasons = ex.cancellation_reasons
+            if reasons and reasons[0] is not None and reasons[0].code == 'ConditionalCheckFailed':
+                raise self._get_not_found_exception(note_id)
+            self._raise_for_failed_condition(ex, note_id)
+
+    def _delete_note_and_blob(self, note_id: str):
+        # With a blob store the note may own a blob. A transaction cannot return the deleted item, so the note is
+        # deleted on its own with ALL_OLD, which names the blob without reading the note first, and the tombstone
+        # follows.
+        try:
+            data = self.model._get_connection().delete_item(self.identity.identity_id,
+                                                            range_key=self._get_range_key_from_note_id(note_id),
+                                                            condition=DynamoDBNote.contents.exists(),
+                                                            return_values=ALL_OLD)
+        except DeleteError as ex:
+            self._raise_for_failed_condition(ex, note_id)
+        self._delete_blobs([self.model.from_raw_data(data[ATTRIBUTES]).text_blob])
+        try:
+            self._get_tombstone(note_id, self._get_timestamp()).save()
+        except PutError as ex:
+            # The note is gone, but the change feed won't tell; report it so the client can resynchronize.
+            logging.error(ex)
+            raise AWSServicesException(recommended_status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=repr(ex))
+
+    def update_note(self, note_id: str, title: str = None, text: str = None, expected_updated_at: int = None):
+        """
+        Updates the given fields of a note. When expected_updated_at is set, the update only goes through if the
+        stored note still has that updated_at (0 stands for a note that has never been written with one).
+        """
+        actions = []
         if title:
-            note.title = title
+            actions.append(DynamoDBNote.title.set(title))
+        note = self.model(self.identity.identity_id, contents=self._get_range_key_from_note_id(note_id))
         if text:
-            note.text = text
-        note.save()
-        return self._get_stored_note_from_dynamodb_note(note)
+            self._set_text(note, text)
+            for attribute in (DynamoDBNote.text, DynamoDBNote.text_compressed, DynamoDBNote.text_blob):
+                value = getattr(note, attribute.attr_name)
+                actions.append(attribute.set(value) if value is not None else attribute.remove())
+        if not actions:
+            stored_note = self.get_note(note_id)
+            if expected_updated_at is not None and (stored_note.updated_at or 0) != expected_updated_at:
+                raise self._get_precondition_failed_exception(note_id)
+            return stored_note
+
+        updated_at = self._get_timestamp()
+        actions.append(DynamoDBNote.updated_at.set(updated_at))
+        condition = DynamoDBNote.contents.exists()
+        if expected_updated_at:
+            condition &= DynamoDBNote.updated_at == expected_updated_at
+        elif expected_updated_at is not None:
+            condition &= DynamoDBNote.updated_at.does_not_exist()
+
+        try:
+            # The item as it was before the update carries the key of the blob being replaced, and together with
+            # the actions it gives the updated note.
+            data = self.model._get_connection().update_item(self.identity.identity_id, range_key=note.contents,
+                                                            actions=actions, condition=condition,
+                                                            return_values=ALL_OLD)
+        except UpdateError as ex:
+            self._delete_blobs([note.text_blob])
+            if expected_updated_at is not None and ex.cause_response_code == 'ConditionalCheckFailedException':
+                # Tell a missing note apart from a stale one.
+                self._get_dynamodb_note(note_id)
+                raise self._get_precondition_failed_exception(note_id)
+            self._raise_for_item_too_large(ex)
+            self._raise_for_failed_condition(ex, note_id)
+        old_note = self.model.from_raw_data(data[ATTRIBUTES])
+        if text:
+            self._delete_blobs([old_note.text_blob])
+        stored_note = StoredNote.construct(title=title or old_note.title, text=text or self._get_text(old_note),
+                                           note_id=note_id, updated_at=updated_at)
+        self._index_note(stored_note)
+        return stored_note
+
+    def batch_save_notes(self, notes: List[BatchNote]) -> BatchResult:
+        self._validate_batch(len(notes), [note.note_id for note in notes if note.note_id is not None])
+        blob_keys = self._get_blob_keys([note.note_id for note in notes if note.note_id is not None])
+        updated_at = self._get_timestamp()
+        dynamodb_notes = []
+        for note in notes:
+            dynamodb_note = self.model(self.identity.identity_id,
+                                       contents=self._get_range_key_from_note_id(note.note_id or uuid.uuid4().hex),
+                                       title=note.title, updated_at=updated_at)
+            self._set_text(dynamodb_note, note.text)
+            dynamodb_notes.append(dynamodb_note)
+        result = self._batch_write(dynamodb_notes, delete=False)
+        stale_blob_keys = []
+        for dynamodb_note, item in zip(dynamodb_notes, result.results):
+            if item.status == 'succeeded':
+                stale_blob_keys.append(blob_keys.get(item.note_id))
+            else:
+                stale_blob_keys.append(dynamodb_note.text_blob)
+        self._delete_blobs(stale_blob_keys)
+        return result
+
+    def batch_delete_notes(self, note_ids: List[str]) -> BatchResult:
+        self._validate_batch(len(note_ids), note_ids)
+        blob_keys = self._get_blob_keys(note_ids)
+        dynamodb_notes = [self.model(self.identity.identity_id, contents=self._get_range_key_from_note_id(note_id))
+                          for note_id in note_ids]
+        result = self._batch_write(dynamodb_notes, delete=True)
+        self._delete_blobs(blob_keys.get(item.note_id) for item in result.results if item.status == 'succeeded')
+        return result
+
+    def batch_get_notes(self, note_ids: List[str]) -> NotesBatchGetResult:
+        note_ids = list(dict.fromkeys(note_ids))
+        self._validate_batch(len(note_ids), note_ids)
+        keys = [(self.identity.identity_id, self._get_range_key_from_note_id(note_id)) for note_id in note_ids]
+        found_notes = {stored_note.note_id: stored_note
+                       for stored_note in self._get_stored_notes_from_dynamodb_notes(list(self.model.batch_get(keys)))}
+        return NotesBatchGetResult.construct(notes=[found_notes[note_id] for note_id in note_ids
+                                                    if note_id in found_notes],
+                                             missing_ids=[note_id for note_id in note_ids
+                                                          if note_id not in found_notes])
+
+    def _batch_write(self, dynamodb_notes: List[DynamoDBNote], delete: bool) -> BatchResult:
+        results = []
+        # Every delete also writes a tombstone and every save removes the one a re-created note may have left, so
+        # each note takes up two of the batch's operations.
+        chunk_size = BATCH_WRITE_PAGE_LIMIT // 2
+        updated_at = self._get_timestamp()
+        for start in range(0, len(dynamodb_notes), chunk_size):
+            chunk = dynamodb_notes[start:start + chunk_size]
+            batch = self.model.batch_write(auto_commit=False)
+            for dynamodb_note in chunk:
+                tombstone = self._get_tombstone(self._get_stored_note_id_from_range_key(dynamodb_note.contents),
+                                                updated_at)
+                if delete:
+                    batch.delete(dynamodb_note)
+                    batch.save(tombstone)
+                else:
+                    batch.save(dynamodb_note)
+                    batch.delete(tombstone)
+            failed_note_ids = {}
+            try:
+                batch.commit()
+            except PutError as ex:
+                logging.error(ex)
+                if ex.cause is None and batch.failed_operations:
+                    for operation in batch.failed_operations:
+                        request = (operation.get('PutRequest', {}).get('Item')
+                                   or operation.get('DeleteRequest', {}).get('Key'))
+                        note_id = self._get_note_id_from_note_or_tombstone_range_key(request['contents']['S'])
+                        failed_note_ids[note_id] = 'Unprocessed after retries'
+                else:
+                    # The request itself failed, so nothing tells which of the chunk's writes were applied.
+                    failed_note_ids = {self._get_stored_note_id_from_range_key(dynamodb_note.contents): repr(ex)
+                                       for dynamodb_note in chunk}
+            except PynamoDBException as ex:
+                logging.error(ex)
+                failed_note_ids = {self._get_stored_note_id_from_range_key(dynamodb_note.contents): repr(ex)
+                                   for dynamodb_note in chunk}
+            for dynamodb_note in chunk:
+                note_id = self._get_stored_note_id_from_range_key(dynamodb_note.contents)
+                if note_id in failed_note_ids:
+                    results.append(BatchItemResult(note_id=note_id, status='failed', detail=failed_note_ids[note_id]))
+                else:
+                    results.append(BatchItemResult(note_id=note_id, status='succeeded'))
+                    if delete:
+                        self._unindex_note(note_id)
+                    else:
+                        self._index_note(self._get_stored_note_from_dynamodb_note(dynamodb_note))
+        return BatchResult(results=results)
 
     def _get_dynamodb_note(self, note_id: str):
         try:
-            note = DynamoDBNote.get(hash_key=self.identity.identity_id, range_key=f'note_{note_id}')
-        except DynamoDBNote.DoesNotExist:
-            raise AWSServicesException(recommended_status_code=status.HTTP_404_NOT_FOUND,
-                                       detail=f'Note with id {note_id} not found')
+            note = self.model.get(hash_key=self.identity.identity_id, range_key=f'note_{note_id}')
+        except self.model.DoesNotExist:
+            raise self._get_not_found_exception(note_id)
         return note
 
+    @staticmethod
+    def _raise_for_item_too_large(ex: PynamoDBException):
+        if ex.cause_response_code == 'ValidationException' and 'size' in (ex.cause_response_message or ''):
+            logging.error(ex)
+            raise AWSServicesException(recommended_status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                       detail='Note is too large to store')
+
+    def _raise_for_failed_condition(self, ex: PynamoDBException, note_id: str):
+        if ex.cause_response_code == 'ConditionalCheckFailedException':
+            raise self._get_not_found_exception(note_id)
+        logging.error(ex)
+        raise AWSServicesException(recommended_status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=repr(ex))
+
+    def _set_text(self, dynamodb_note: DynamoDBNote, text: str):
+        settings = get_settings()
+        dynamodb_note.text = dynamodb_note.text_compressed = dynamodb_note.text_blob = None
+        encoded_text = text.encode('utf-8')
+        if len(encoded_text) <= settings.notes_compression_threshold:
+            dynamodb_note.text = text
+            return
+        compressed_text = zlib.compress(encoded_text)
+        blob_store = get_blob_store()
+        if blob_store is not None and len(compressed_text) > settings.notes_blob_threshold:
+            note_id = self._get_stored_note_id_from_range_key(dynamodb_note.contents)
+            blob_key = f'{self.identity.identity_id}/{note_id}/{uuid.uuid4().hex}'
+            blob_store.put(blob_key, compressed_text)
+            dynamodb_note.text_blob = blob_key
+        elif len(compressed_text) < len(encoded_text):
+            dynamodb_note.text_compressed = compressed_text
+        else:
+            dynamodb_note.text = text
+
+    @staticmethod
+    def _get_text(dynamodb_note: DynamoDBNote):
+        return DynamoDBNotesBackend._decode_text(dynamodb_note.text, dynamodb_note.text_compressed,
+                                                 dynamodb_note.text_blob)
+
+    def _get_texts(self, dynamodb_notes: List[DynamoDBNote]) -> List[str]:
+        """Decodes the bodies of several notes, fetching those offloaded to the blob store concurrently."""
+        blob_keys = [note.text_blob if note.text_compressed is None else None for note in dynamodb_notes]
+        blob_texts = iter(self._get_blob_texts([blob_key for blob_key in blob_keys if blob_key is not None]))
+        return [next(blob_texts) if blob_key is not None else self._decode_text(note.text, note.text_compressed, None)
+                for note, blob_key in zip(dynamodb_notes, blob_keys)]
+
+    @staticmethod
+    def _decode_text(text: str, text_compressed: bytes, text_blob: str):
+        if text_compressed is not None:
+            return zlib.decompress(text_compressed).decode('utf-8')
+        if text_blob is not None:
+            return DynamoDBNotesBackend._get_blob_texts([text_blob])[0]
+        return text
+
+    @staticmethod
+    def _get_blob_texts(blob_keys: List[str]) -> List[str]:
+        if not blob_keys:
+            return []
+        blob_store = get_blob_store()
+        if blob_store is None:
+            raise AWSServicesException(recommended_status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                       detail='Note body is in the blob store, but no blob store is configured')
+        return [zlib.decompress(data).decode('utf-8') for data in blob_store.get_many(blob_keys)]
+
+    def _get_blob_keys(self, note_ids: List[str]) -> Dict[str, str]:
+        """
+        Looks up the blob keys currently stored for the given notes, so they can be removed once replaced. Only
+        batches need it: BatchWriteItem, unlike UpdateItem and DeleteItem, cannot return the items it overwrote.
+        """
+        if get_blob_store() is None or not note_ids:
+            return {}
+        keys = [(self.identity.identity_id, self._get_range_key_from_note_id(note_id)) for note_id in note_ids]
+        dynamodb_notes = self.model.batch_get(keys, attributes_to_get=[DynamoDBNote.contents.attr_name,
+                                                                       DynamoDBNote.text_blob.attr_name])
+        return {self._get_stored_note_id_from_range_key(dynamodb_note.contents): dynamodb_note.text_blob
+                for dynamodb_note in dynamodb_notes if dynamodb_note.text_blob is not None}
+
+    @staticmethod
+    def _delete_blobs(blob_keys):
+        blob_keys = [blob_key for blob_key in blob_keys if blob_key is not None]
+        blob_store = get_blob_store()
+        if blob_store is None or not blob_keys:
+            return
+        try:
+            blob_store.delete(blob_keys)
+        except Exception as ex:
+            # An orphaned blob wastes storage but is never read again.
+            logging.error(ex)
+
+    def _query_stored_notes(self, limit: int = None, last_evaluated_key: Dict = None, page_size: int = None):
+        """
+        Queries the identity's notes like DynamoDBNote.query, but maps the returned attribute maps straight to
+        StoredNote records instead of instantiating a DynamoDBNote per item first. Bodies offloaded to the blob store
+        are left to _load_blob_texts, which fetches a page's worth at once.
+        """
+        query_kwargs = dict(range_key_condition=DynamoDBNote.contents.startswith(self._get_note_id_prefix()),
+                            exclusive_start_key=last_evaluated_key,
+                            limit=page_size or limit)
+        return ResultIterator(self.model._get_connection().query, (self.identity.identity_id,), query_kwargs,
+                              map_fn=self._get_stored_note_from_item, limit=limit)
+
+    def _get_stored_note_from_item(self, item: Dict[str, Dict]) -> Tuple[StoredNote, Optional[str]]:
+        text_compressed = item.get(DynamoDBNote.text_compressed.attr_name)
+        text_blob = item.get(DynamoDBNote.text_blob.attr_name)
+        text = item.get(DynamoDBNote.text.attr_name)
+        title = item.get(DynamoDBNote.title.attr_name)
+        updated_at = item.get(DynamoDBNote.updated_at.attr_name)
+        blob_key = text_blob['S'] if text_blob and not text_compressed else None
+        stored_note = StoredNote.construct(
+            title=title['S'] if title else None,
+            text=self._decode_text(text['S'] if text else None,
+                                   DynamoDBNote.text_compressed.deserialize(text_compressed['B'])
+                                   if text_compressed else None,
+                                   None),
+            note_id=self._get_stored_note_id_from_range_key(item[DynamoDBNote.contents.attr_name]['S']),
+            updated_at=int(updated_at['N']) if updated_at else None)
+        return stored_note, blob_key
+
+    def _load_blob_texts(self, notes_and_blob_keys: List[Tuple[StoredNote, Optional[str]]]) -> List[StoredNote]:
+        offloaded = [(stored_note, blob_key) for stored_note, blob_key in notes_and_blob_keys if blob_key is not None]
+        for (stored_note, _), text in zip(offloaded, self._get_blob_texts([blob_key for _, blob_key in offloaded])):
+            stored_note.text = text
+        return [stored_note for stored_note, _ in notes_and_blob_keys]
+
+    def _get_stored_notes_from_dynamodb_notes(self, dynamodb_notes: List[DynamoDBNote]) -> List[StoredNote]:
+        return [StoredNote.construct(title=note.title, text=text,
+                                     note_id=self._get_stored_note_id_from_range_key(note.contents),
+                                     updated_at=note.updated_at)
+                for note, text in zip(dynamodb_notes, self._get_texts(dynamodb_notes))]
+
     def _get_stored_note_from_dynamodb_note(self, note):
-        return StoredNote(title=note.title, text=note.text,
-                          note_id=self._get_stored_note_id_from_range_key(note.contents))
+        # The attributes are typed by the model already, so the record is built without validating it again.
+        return StoredNote.construct(title=note.title, text=self._get_text(note),
+                                    note_id=self._get_stored_note_id_from_range_key(note.contents),
+                                    updated_at=note.updated_at)
 
     def _get_stored_note_id_from_range_key(self, range_key):
         return range_key[len(self._get_note_id_prefix()):]
 
+    def _get_note_id_from_note_or_tombstone_range_key(self, range_key):
+        if range_key.startswith(self._get_tombstone_prefix()):
+            return range_key[len(self._get_tombstone_prefix()):]
+        return self._get_stored_note_id_from_range_key(range_key)
+
     @staticmethod
     def _get_range_key_from_note_id(note_id):
         return f'note_{note_id}'
@@ -78,3 +595,12 @@ class NotesDBService:
     @staticmethod
     def _get_note_id_prefix():
         return 'note_'
+
+    def _get_tombstone(self, note_id: str, updated_at: int):
+        return self.model(self.identity.identity_id, contents=f'{self._get_tombstone_prefix()}{note_id}',
+                          updated_at=updated_at,
+                          expires_at=updated_at // 1_000_000 + get_settings().notes_tombstone_ttl)
+
+    @staticmethod
+    def _get_tombstone_prefix():
+        return 'tomb_'
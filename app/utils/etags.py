@@ -0,0 +1,72 @@
+import hashlib
+from typing import List, Optional
+from fastapi import status
+from app.exceptions import AWSServicesException
+from app.schemas import StoredNote, NotesPage
+
+# Content codings CompressionMiddleware may append to an entity tag, see get_encoded_etag.
+CONTENT_CODINGS = ('br', 'gzip')
+
+
+def get_note_etag(note: StoredNote) -> str:
+    return f'"{note.updated_at or 0}"'
+
+
+def get_notes_page_etag(page: NotesPage) -> str:
+    digest = hashlib.sha256()
+    for note in page.notes:
+        digest.update(f'{note.note_id}:{note.updated_at or 0}\n'.encode())
+    digest.update((page.next_cursor or '').encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def get_encoded_etag(etag: str, encoding: str) -> str:
+    """
+    The entity tag of a representation compressed with the given content coding. A compressed body differs from
+    the identity one byte for byte, so it must not share its strong tag; the coding is appended inside the quotes.
+    """
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison as required for If-None-Match (RFC 9110, section 13.1.2), across content codings."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(_strip_content_coding(_strip_weak_prefix(candidate.strip())) == etag
+               for candidate in if_none_match.split(','))
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[List[int]]:
+    """
+    Returns the updated_at values a note may have for an If-Match precondition to hold, or None when there is
+    nothing to check. The precondition holds if any of the listed entity tags matches; weak tags and tags this API
+    never issues cannot match under the strong comparison If-Match requires. Tags of compressed representations
+    name the same version of the note as the identity one and are accepted too.
+    """
+    if not if_match or if_match.strip() == '*':
+        return None
+    versions = []
+    for candidate in if_match.split(','):
+        etag = _strip_content_coding(candidate.strip())
+        if len(etag) > 2 and etag[0] == etag[-1] == '"' and etag[1:-1].isdigit():
+            versions.append(int(etag[1:-1]))
+    if not versions:
+        raise AWSServicesException(recommended_status_code=status.HTTP_412_PRECONDITION_FAILED,
+                                   detail='If-Match must list a strong entity tag returned by this API')
+    return versions
+
+
+def _strip_weak_prefix(etag: str) -> str:
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def _strip_content_coding(etag: str) -> str:
+    for encoding in CONTENT_CODINGS:
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return f'{etag[:-len(suffix)]}"'
+    return etag
@@ -0,0 +1,376 @@
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.label_names), 0.0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{_format_labels(zip(self.label_names, key))} {_format_value(value)}'
+
+
+class Histogram:
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        # Per label set: non-cumulative bucket counts (the last one is +Inf), sum and count.
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    break
+            else:
+                index = len(self.buckets)
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def get_count(self, **labels) -> int:
+        entry = self._values.get(tuple(str(labels[name]) for name in self.label_names))
+        return entry[2] if entry else 0
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            values = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in values:
+            labels = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(labels + [('le', '+Inf' if bound == float('inf') else repr(bound))])
+                yield f'{self.name}_bucket{bucket_labels} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(labels)} {count}'
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+
+REGISTRY = MetricsRegistry()
+REQUEST_DURATION = REGISTRY.register(Histogram('fastnote_request_duration_seconds', 'HTTP request duration.',
+                                               ('handler', 'method', 'status')))
+STAGE_DURATION = REGISTRY.register(Histogram('fastnote_stage_duration_seconds', 'Duration of an instrumented stage.',
+                                             ('stage',)))
+STAGE_ERRORS = REGISTRY.register(Counter('fastnote_stage_errors_total', 'Instrumented stages that raised.',
+                                         ('stage', 'error')))
+AWS_RETRIES = REGISTRY.register(Counter('fastnote_aws_retries_total', 'Retried AWS calls.', ('operation',)))
+DYNAMODB_CONSUMED_CAPACITY = REGISTRY.register(Counter('fastnote_dynamodb_consumed_capacity_units_total',
+                                                       'DynamoDB capacity units consumed.', ('operation',)))
+
+
+class RequestTimings:
+    """Stage timings of the request being served, for the Server-Timing header and EMF."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.endpoint_finished_at: Optional[float] = None
+        self.consumed_capacity = 0.0
+        self.stages: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def server_timing_header(self) -> str:
+        with self._lock:
+            stages = list(self.stages.items())
+        entries = [f'{stage};dur={seconds * 1000:.2f}' + (f';desc="{count} calls"' if count > 1 else '')
+                   for stage, (seconds, count) in stages]
+        entries.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.2f}')
+        return ', '.join(entries)
+
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar('request_timings', default=None)
+
+
+def get_request_timings() -> Optional[RequestTimings]:
+    return _request_timings.get()
+
+
+def record_stage(stage: str, seconds: float, error: BaseException = None):
+    STAGE_DURATION.observe(seconds, stage=stage)
+    if error is not None:
+        STAGE_ERRORS.inc(stage=stage, error=type(error).__name__)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+def record_consumed_capacity(operation: str, capacity_units: float):
+    DYNAMODB_CONSUMED_CAPACITY.inc(capacity_units, operation=operation)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.consumed_capacity += capacity_units
+
+
+class timed:
+    """
+    Times a stage, either as a context manager (with timed('stage'): ...) or as a decorator of plain, async and
+    generator functions. Generators are timed only while producing items, not while the consumer holds them.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        record_stage(self.stage, time.perf_counter() - self._started, exc)
+        return False
+
+    def __call__(self, func):
+        stage = self.stage
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                elapsed = 0.0
+                error = None
+                iterator = func(*args, **kwargs)
+                try:
+                    while True:
+                        started = time.perf_counter()
+                        try:
+                            item = next(iterator)
+                        except StopIteration:
+                            return
+                        finally:
+                            elapsed += time.perf_counter() - started
+                        yield item
+                except Exception as ex:
+                    error = ex
+                    raise
+                finally:
+                    record_stage(stage, elapsed, error)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def instrument_methods(prefix: str):
+    """Class decorator timing every public method as the stage '<prefix>.<method>'."""
+    def decorate(cls):
+        for name, attribute in list(vars(cls).items()):
+            if not name.startswith('_') and inspect.isfunction(attribute):
+                setattr(cls, name, timed(f'{prefix}.{name}')(attribute))
+        return cls
+    return decorate
+
+
+def instrument_dynamodb_connection(connection):
+    """
+    Wraps a PynamoDB Connection's dispatch to time every DynamoDB call and count the capacity it consumed. PynamoDB
+    already asks for TOTAL consumed capacity on every data operation.
+    """
+    if getattr(connection, '_metrics_instrumented', False):
+        return
+    dispatch = connection.dispatch
+
+    def instrumented_dispatch(operation_name, operation_kwargs, *args, **kwargs):
+        with timed(f'dynamodb.{operation_name}'):
+            data = dispatch(operation_name, operation_kwargs, *args, **kwargs)
+        capacity = (data or {}).get('ConsumedCapacity')
+        if capacity:
+            capacities = capacity if isinstance(capacity, list) else [capacity]
+            record_consumed_capacity(operation_name, sum(item.get('CapacityUnits', 0.0) for item in capacities))
+        return data
+
+    connection.dispatch = instrumented_dispatch
+    connection._metrics_instrumented = True
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    Times the endpoint function as the 'endpoint' stage and what FastAPI does with its result afterwards (response
+    validation, jsonable_encoder and rendering) as the 'serialize' stage.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _time_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def instrumented_handler(request):
+            response = await handler(request)
+            timings = _request_timings.get()
+            if timings is not None and timings.endpoint_finished_at is not None:
+                record_stage('serialize', time.perf_counter() - timings.endpoint_finished_at)
+            return response
+
+        return instrumented_handler
+
+
+def _time_endpoint(endpoint):
+    if not inspect.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def timed_endpoint(*args, **kwargs):
+        try:
+            with timed('endpoint'):
+                return await endpoint(*args, **kwargs)
+        finally:
+            timings = _request_timings.get()
+            if timings is not None:
+                timings.endpoint_finished_at = time.perf_counter()
+
+    return timed_endpoint
+
+
+class MetricsMiddleware:
+    """
+    Collects per-request stage timings, records the request duration, adds a Server-Timing header and, when
+    enabled, writes one CloudWatch embedded metric format (EMF) line per request to stdout.
+    """
+
+    def __init__(self, app, emit_emf: bool = False, namespace: str = 'FastNote'):
+        self.app = app
+        self.emit_emf = emit_emf
+        self.namespace = namespace
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+        status_code = 500
+
+        async def send_with_server_timing(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                MutableHeaders(raw=message.setdefault('headers', [])).append('Server-Timing',
+                                                                            timings.server_timing_header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            duration = time.perf_counter() - timings.started
+            handler = getattr(scope.get('endpoint'), '__name__', 'unmatched')
+            REQUEST_DURATION.observe(duration, handler=handler, method=scope['method'], status=status_code)
+            if self.emit_emf:
+                _write_emf_line(self.namespace, handler, status_code, duration, timings)
+            _request_timings.reset(token)
+
+
+def is_running_in_lambda() -> bool:
+    return 'AWS_LAMBDA_FUNCTION_NAME' in os.environ
+
+
+def _write_emf_line(namespace: str, handler: str, status_code: int, duration: float, timings: RequestTimings):
+    values = {'duration': duration * 1000}
+    values.update({stage: seconds * 1000 for stage, (seconds, count) in timings.stages.items()})
+    metrics = [{'Name': name, 'Unit': 'Milliseconds'} for name in values]
+    if timings.consumed_capacity:
+        values['dynamodb_capacity_units'] = timings.consumed_capacity
+        metrics.append({'Name': 'dynamodb_capacity_units', 'Unit': 'Count'})
+    line = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{'Namespace': namespace, 'Dimensions': [['handler']], 'Metrics': metrics}]
+        },
+        'handler': handler,
+        'status': status_code,
+        **values
+    }
+    sys.stdout.write(json.dumps(line) + '\n')
+    sys.stdout.flush()
+
+
+def _format_labels(labels) -> str:
+    labels = list(labels)
+    if not labels:
+        return ''
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value))
@@ -0,0 +1,499 @@
+import bisect
+import contextlib
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from fastapi import status
+
+from app.exceptions import AWSServicesException
+from app.schemas import AWSIdentity, Note, StoredNote, NotesPage, NoteSummary, NoteSummariesPage, BatchNote, \
+    BatchItemResult, BatchResult, NotesBatchGetResult, NoteDeletion, NoteChangesPage, NoteSearchResults
+from app.settings import get_settings
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.search import SYNC_OVERLAP_MICROSECONDS, get_note_search_indexes
+
+NOTE_ID_PREFIX = 'note_'
+TOMBSTONE_PREFIX = 'tomb_'
+
+
+class NotesBackend(ABC):
+    """
+    Stores the notes of one identity. NotesDBService hands every operation to the backend chosen by
+    NOTES_STORAGE_BACKEND; a backend raises AWSServicesException with the status code the API should answer with.
+
+    Semantics every backend keeps: updated_at is the microsecond timestamp of the last write and the note's
+    version for If-Match, deletes leave a deletion behind for get_note_changes for at least NOTES_TOMBSTONE_TTL
+    seconds, and cursors are opaque strings that only the backend that issued them understands. The last page of
+    changes carries a sync_token to pass as since on the next sync; a client whose last sync is older than
+    NOTES_TOMBSTONE_TTL may have missed deletions and has to fetch all of its notes again.
+    """
+
+    def __init__(self, identity: AWSIdentity):
+        self.identity = identity
+
+    @abstractmethod
+    def create_note(self, note: Note) -> StoredNote:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_notes(self, limit: int, cursor: str = None) -> NotesPage:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_note_summaries(self, limit: int, cursor: str = None, preview_length: int = None) -> NoteSummariesPage:
+        raise NotImplementedError
+
+    @abstractmethod
+    def export_notes(self, page_size: int) -> Iterable[StoredNote]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_note_changes(self, since: int, limit: int, cursor: str = None) -> NoteChangesPage:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_note(self, note_id: str) -> StoredNote:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_note(self, note_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_note(self, note_id: str, title: str = None, text: str = None,
+                    expected_updated_at: int = None) -> StoredNote:
+        raise NotImplementedError
+
+    @abstractmethod
+    def batch_save_notes(self, notes: List[BatchNote]) -> BatchResult:
+        raise NotImplementedError
+
+    @abstractmethod
+    def batch_delete_notes(self, note_ids: List[str]) -> BatchResult:
+        raise NotImplementedError
+
+    @abstractmethod
+    def batch_get_notes(self, note_ids: List[str]) -> NotesBatchGetResult:
+        raise NotImplementedError
+
+    def search_notes(self, query: str, limit: int) -> NoteSearchResults:
+        search_index = get_note_search_indexes().get(self.identity.identity_id)
+        search_index.sync(self, get_settings().notes_export_page_size)
+        return NoteSearchResults(hits=search_index.search(query, limit))
+
+    @staticmethod
+    def _validate_batch(batch_size: int, note_ids: List[str]):
+        settings = get_settings()
+        if batch_size > settings.notes_batch_max_size:
+            raise AWSServicesException(recommended_status_code=status.HTTP_400_BAD_REQUEST,
+                                       detail=f'A batch may contain at most {settings.notes_batch_max_size} notes')
+        if any(not note_id for note_id in note_ids):
+            raise AWSServicesException(recommended_status_code=status.HTTP_400_BAD_REQUEST,
+                                       detail='Note ids must not be empty')
+        if len(set(note_ids)) != len(note_ids):
+            raise AWSServicesException(recommended_status_code=status.HTTP_400_BAD_REQUEST,
+                                       detail='Note ids in a batch must be unique')
+
+    def _index_note(self, stored_note: StoredNote):
+        # Only indexes already loaded in this process are kept current here; the rest catch up from the change
+        # feed the next time they are searched.
+        search_index = get_note_search_indexes().peek(self.identity.identity_id)
+        if search_index is not None:
+            search_index.upsert(stored_note)
+
+    def _unindex_note(self, note_id: str):
+        search_index = get_note_search_indexes().peek(self.identity.identity_id)
+        if search_index is not None:
+            search_index.remove(note_id)
+
+    @staticmethod
+    def _get_sync_token(since: int, read_at: int) -> int:
+        # Writes from other instances may still land with an updated_at a little behind the read, so the next sync
+        # re-reads that margin; re-applying a change is a no-op for clients.
+        return max(since, read_at - SYNC_OVERLAP_MICROSECONDS)
+
+    @staticmethod
+    def _get_not_found_exception(note_id: str):
+        return AWSServicesException(recommended_status_code=status.HTTP_404_NOT_FOUND,
+                                    detail=f'Note with id {note_id} not found')
+
+    @staticmethod
+    def _get_precondition_failed_exception(note_id: str):
+        return AWSServicesException(recommended_status_code=status.HTTP_412_PRECONDITION_FAILED,
+                                    detail=f'Note with id {note_id} has been modified')
+
+    @staticmethod
+    def _get_timestamp():
+        return time.time_ns() // 1000
+
+
+class NoteRow(NamedTuple):
+    note_id: str
+    title: Optional[str]
+    text: Optional[str]
+    updated_at: Optional[int]
+    # A deleted note stays behind as a row without title and text, so that get_note_changes can report it.
+    deleted: bool = False
+
+
+class LocalNotesBackend(NotesBackend):
+    """Note operations over the row primitives of a backend local to this host; bodies are stored uncompressed."""
+
+    def create_note(self, note: Note) -> StoredNote:
+        row = NoteRow(uuid.uuid4().hex, note.title, note.text, self._get_timestamp())
+        with self._transaction():
+            self._put_rows([row])
+        stored_note = self._get_stored_note(row)
+        self._index_note(stored_note)
+        return stored_note
+
+    def get_notes(self, limit: int, cursor: str = None) -> NotesPage:
+        rows, next_cursor = self._get_page(limit, cursor)
+        return NotesPage.construct(notes=[self._get_stored_note(row) for row in rows], next_cursor=next_cursor)
+
+    def get_note_summaries(self, limit: int, cursor: str = None, preview_length: int = None) -> NoteSummariesPage:
+        rows, next_cursor = self._get_page(limit, cursor)
+        summaries = [NoteSummary(note_id=row.note_id, title=row.title,
+                                 preview=row.text[:preview_length] if preview_length else None)
+                     for row in rows]
+        return NoteSummariesPage(notes=summaries, next_cursor=next_cursor)
+
+    def export_notes(self, page_size: int):
+        after = None
+        while True:
+            rows = self._list_rows(after, page_size)
+            for row in rows:
+                yield self._get_stored_note(row)
+            if len(rows) < page_size:
+                return
+            after = rows[-1].note_id
+
+    def get_note_changes(self, since: int, limit: int, cursor: str = None) -> NoteChangesPage:
+        after = None
+        payload = decode_cursor(cursor, self.identity.identity_id, (NOTE_ID_PREFIX, TOMBSTONE_PREFIX),
+                                index_key_names=('updated_at',))
+        if payload is not None:
+            after = (int(payload['updated_at']['N']), payload['contents']['S'].split('_', 1)[1])
+        read_at = self._get_timestamp()
+        rows = self._list_changes(since, after, limit + 1)
+        upserts = []
+        deletions = []
+        for row in rows[:limit]:
+            if row.deleted:
+                deletions.append(NoteDeletion(note_id=row.note_id, deleted_at=row.updated_at))
+            else:
+                upserts.append(self._get_stored_note(row))
+        if len(rows) > limit:
+            last_row = rows[limit - 1]
+            prefix = TOMBSTONE_PREFIX if last_row.deleted else NOTE_ID_PREFIX
+            next_cursor = encode_cursor({'contents': {'S': f'{prefix}{last_row.note_id}'},
+                                         'updated_at': {'N': str(last_row.updated_at)}})
+            return NoteChangesPage.construct(upserts=upserts, deletions=deletions, next_cursor=next_cursor)
+        return NoteChangesPage.construct(upserts=upserts, deletions=deletions,
+                                         sync_token=self._get_sync_token(since, read_at))
+
+    def get_note(self, note_id: str) -> StoredNote:
+        row = self._get_row(note_id)
+        if row is None:
+            raise self._get_not_found_exception(note_id)
+        return self._get_stored_note(row)
+
+    def delete_note(self, note_id: str):
+        with self._transaction():
+            if self._get_row(note_id) is None:
+                raise self._get_not_found_exception(note_id)
+            self._put_rows([self._get_deleted_row(note_id, self._get_timestamp())])
+        self._unindex_note(note_id)
+
+    def update_note(self, note_id: str, title: str = None, text: str = None,
+                    expected_updated_at: int = None) -> StoredNote:
+        with self._transaction():
+            row = self._get_row(note_id)
+            if row is None:
+                raise self._get_not_found_exception(note_id)
+            if expected_updated_at is not None and (row.updated_at or 0) != expected_updated_at:
+                raise self._get_precondition_failed_exception(note_id)
+            if not title and not text:
+                return self._get_stored_note(row)
+            row = row._replace(title=title or row.title, text=text or row.text, updated_at=self._get_timestamp())
+            self._put_rows([row])
+        stored_note = self._get_stored_note(row)
+        self._index_note(stored_note)
+        return stored_note
+
+    def batch_save_notes(self, notes: List[BatchNote]) -> BatchResult:
+        self._validate_batch(len(notes), [note.note_id for note in notes if note.note_id is not None])
+        updated_at = self._get_timestamp()
+        rows = [NoteRow(note.note_id or uuid.uuid4().hex, note.title, note.text, updated_at) for note in notes]
+        with self._transaction():
+            self._put_rows(rows)
+        for row in rows:
+            self._index_note(self._get_stored_note(row))
+        return BatchResult(results=[BatchItemResult(note_id=row.note_id, status='succeeded') for row in rows])
+
+    def batch_delete_notes(self, note_ids: List[str]) -> BatchResult:
+        self._validate_batch(len(note_ids), note_ids)
+        deleted_at = self._get_timestamp()
+        with self._transaction():
+            self._put_rows([self._get_deleted_row(note_id, deleted_at) for note_id in note_ids])
+        for note_id in note_ids:
+            self._unindex_note(note_id)
+        return BatchResult(results=[BatchItemResult(note_id=note_id, status='succeeded') for note_id in note_ids])
+
+    def batch_get_notes(self, note_ids: List[str]) -> NotesBatchGetResult:
+        note_ids = list(dict.fromkeys(note_ids))
+        self._validate_batch(len(note_ids), note_ids)
+        found_notes = {row.note_id: self._get_stored_note(row) for row in self._get_rows(note_ids)}
+        return NotesBatchGetResult.construct(notes=[found_notes[note_id] for note_id in note_ids
+                                                    if note_id in found_notes],
+                                             missing_ids=[note_id for note_id in note_ids
+                                                          if note_id not in found_notes])
+
+    def _get_page(self, limit: int, cursor: Optional[str]) -> Tuple[List[NoteRow], Optional[str]]:
+        payload = decode_cursor(cursor, self.identity.identity_id, NOTE_ID_PREFIX)
+        after = payload['contents']['S'][len(NOTE_ID_PREFIX):] if payload is not None else None
+        # One row more than asked for tells whether there is a next page.
+        rows = self._list_rows(after, limit + 1)
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor({'contents': {'S': f'{NOTE_ID_PREFIX}{rows[-1].note_id}'}})
+
+    def _get_row(self, note_id: str) -> Optional[NoteRow]:
+        rows = self._get_rows([note_id])
+        return rows[0] if rows else None
+
+    @staticmethod
+    def _get_stored_note(row: NoteRow) -> StoredNote:
+        return StoredNote.construct(title=row.title, text=row.text, note_id=row.note_id, updated_at=row.updated_at)
+
+    @staticmethod
+    def _get_deleted_row(note_id: str, deleted_at: int) -> NoteRow:
+        return NoteRow(note_id, None, None, deleted_at, deleted=True)
+
+    @abstractmethod
+    def _transaction(self):
+        """Context manager making the row primitives called inside it one atomic unit."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _get_rows(self, note_ids: List[str]) -> List[NoteRow]:
+        """The notes with the given ids that exist and are not deleted."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _list_rows(self, after: Optional[str], limit: int) -> List[NoteRow]:
+        """Up to limit notes that are not deleted, ordered by id, starting after the given id."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _list_changes(self, since: int, after: Optional[Tuple[int, str]], limit: int) -> List[NoteRow]:
+        """Up to limit rows, deleted ones included, written after since, ordered by (updated_at, note_id)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _put_rows(self, rows: List[NoteRow]):
+        raise NotImplementedError
+
+
+class InMemoryNotesStore:
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.rows: Dict[str, Dict[str, NoteRow]] = {}
+        # Note ids of every identity in sorted order, deleted ones included, for paging by id.
+        self.note_ids: Dict[str, List[str]] = {}
+
+
+class InMemoryNotesBackend(LocalNotesBackend):
+    """Keeps notes in a dict shared by the process; for local development, tests and load tests."""
+
+    def __init__(self, identity: AWSIdentity, store: InMemoryNotesStore):
+        super().__init__(identity)
+        self.store = store
+
+    def _transaction(self):
+        return self.store.lock
+
+    def _get_rows(self, note_ids: List[str]) -> List[NoteRow]:
+        with self.store.lock:
+            rows = self.store.rows.get(self.identity.identity_id, {})
+            return [row for row in (rows.get(note_id) for note_id in note_ids) if row is not None and not row.deleted]
+
+    def _list_rows(self, after: Optional[str], limit: int) -> List[NoteRow]:
+        with self.store.lock:
+            rows = self.store.rows.get(self.identity.identity_id, {})
+            note_ids = self.store.note_ids.get(self.identity.identity_id, [])
+            start = bisect.bisect_right(note_ids, after) if after is not None else 0
+            result = []
+            for note_id in note_ids[start:]:
+                row = rows[note_id]
+                if not row.deleted:
+                    result.append(row)
+                    if len(result) >= limit:
+                        break
+            return result
+
+    def _list_changes(self, since: int, after: Optional[Tuple[int, str]], limit: int) -> List[NoteRow]:
+        with self.store.lock:
+            rows = [row for row in self.store.rows.get(self.identity.identity_id, {}).values()
+                    if row.updated_at is not None and row.updated_at > since
+                    and (after is None or (row.updated_at, row.note_id) > after)]
+        rows.sort(key=lambda row: (row.updated_at, row.note_id))
+        return rows[:limit]
+
+    def _put_rows(self, rows: List[NoteRow]):
+        with self.store.lock:
+            stored_rows = self.store.rows.setdefault(self.identity.identity_id, {})
+            note_ids = self.store.note_ids.setdefault(self.identity.identity_id, [])
+            for row in rows:
+                if row.note_id not in stored_rows:
+                    bisect.insort(note_ids, row.note_id)
+                stored_rows[row.note_id] = row
+
+
+class SQLiteNotesDatabase:
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS notes ('
+        ' user_id TEXT NOT NULL,'
+        ' note_id TEXT NOT NULL,'
+        ' title TEXT,'
+        ' text TEXT,'
+        ' updated_at INTEGER,'
+        ' deleted INTEGER NOT NULL DEFAULT 0,'
+        ' PRIMARY KEY (user_id, note_id)'
+        ') WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS notes_user_id_updated_at ON notes (user_id, updated_at, note_id)',
+    )
+
+    def __init__(self, path: str):
+        # One connection shared by the blocking I/O threads, serialized by the lock. It runs in autocommit mode so
+        # that transactions are opened explicitly, covering the reads they depend on.
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.RLock()
+        self._transaction_depth = 0
+        with self.lock:
+            if path != ':memory:':
+                self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.transaction():
+            for statement in self.SCHEMA:
+                self.connection.execute(statement)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Runs the statements inside it as one transaction. BEGIN IMMEDIATE takes the database's write lock up front,
+        so a read-check-write cannot interleave with writers in other processes using the same file. Nested calls
+        join the outer transaction.
+        """
+        with self.lock:
+            if self._transaction_depth:
+                self._transaction_depth += 1
+                try:
+                    yield self.connection
+                finally:
+                    self._transaction_depth -= 1
+                return
+            self.connection.execute('BEGIN IMMEDIATE')
+            self._transaction_depth = 1
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            else:
+                self.connection.execute('COMMIT')
+            finally:
+                self._transaction_depth = 0
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class SQLiteNotesBackend(LocalNotesBackend):
+    """Keeps notes in a SQLite database, for running without DynamoDB on a single host."""
+
+    COLUMNS = 'note_id, title, text, updated_at, deleted'
+    # Stays below SQLITE_MAX_VARIABLE_NUMBER of older SQLite builds.
+    MAX_VARIABLES = 900
+
+    def __init__(self, identity: AWSIdentity, database: SQLiteNotesDatabase):
+        super().__init__(identity)
+        self.database = database
+
+    def _transaction(self):
+        return self.database.transaction()
+
+    def _get_rows(self, note_ids: List[str]) -> List[NoteRow]:
+        rows = []
+        with self.database.lock:
+            for start in range(0, len(note_ids), self.MAX_VARIABLES):
+                chunk = note_ids[start:start + self.MAX_VARIABLES]
+                rows.extend(self._fetch(f'SELECT {self.COLUMNS} FROM notes WHERE user_id = ? AND deleted = 0 '
+                                        f'AND note_id IN ({", ".join("?" * len(chunk))})',
+                                        (self.identity.identity_id, *chunk)))
+        return rows
+
+    def _list_rows(self, after: Optional[str], limit: int) -> List[NoteRow]:
+        return self._fetch(f'SELECT {self.COLUMNS} FROM notes WHERE user_id = ? AND note_id > ? AND deleted = 0 '
+                           f'ORDER BY note_id LIMIT ?',
+                           (self.identity.identity_id, after if after is not None else '', limit))
+
+    def _list_changes(self, since: int, after: Optional[Tuple[int, str]], limit: int) -> List[NoteRow]:
+        after_updated_at, after_note_id = after if after is not None else (since, '')
+        return self._fetch(f'SELECT {self.COLUMNS} FROM notes WHERE user_id = ? AND updated_at > ? '
+                           f'AND (updated_at, note_id) > (?, ?) ORDER BY updated_at, note_id LIMIT ?',
+                           (self.identity.identity_id, since, after_updated_at, after_note_id, limit))
+
+    def _put_rows(self, rows: List[NoteRow]):
+        with self.database.transaction() as connection:
+            connection.executemany('INSERT OR REPLACE INTO notes (user_id, note_id, title, text, updated_at, deleted) '
+                                   'VALUES (?, ?, ?, ?, ?, ?)',
+                                   [(self.identity.identity_id, row.note_id, row.title, row.text, row.updated_at,
+                                     int(row.deleted)) for row in rows])
+
+    def _fetch(self, query: str, parameters: tuple) -> List[NoteRow]:
+        with self.database.lock:
+            return [NoteRow(note_id, title, text, updated_at, bool(deleted))
+                    for note_id, title, text, updated_at, deleted in self.database.connection.execute(query,
+                                                                                                    parameters)]
+
+
+_in_memory_notes_store = None
+_sqlite_notes_database = None
+_notes_backends_lock = threading.Lock()
+
+
+def get_notes_backend(identity: AWSIdentity) -> NotesBackend:
+    global _in_memory_notes_store, _sqlite_notes_database
+    settings = get_settings()
+    backend = settings.notes_storage_backend
+    if backend == 'dynamodb':
+        # Imported here so that the other backends never load PynamoDB.
+        from app.utils.dynamodb_service import DynamoDBNotesBackend
+        return DynamoDBNotesBackend(identity)
+    with _notes_backends_lock:
+        if backend == 'memory':
+            if _in_memory_notes_store is None:
+                _in_memory_notes_store = InMemoryNotesStore()
+            return InMemoryNotesBackend(identity, _in_memory_notes_store)
+        if backend == 'sqlite':
+            if _sqlite_notes_database is None:
+                _sqlite_notes_database = SQLiteNotesDatabase(settings.notes_sqlite_path)
+            return SQLiteNotesBackend(identity, _sqlite_notes_database)
+    raise ValueError(f'Unknown notes storage backend: {backend}')
+
+
+def reset_notes_backends():
+    global _in_memory_notes_store, _sqlite_notes_database
+    with _notes_backends_lock:
+        if _sqlite_notes_database is not None:
+            _sqlite_notes_database.close()
+        _in_memory_notes_store = None
+        _sqlite_notes_database = None
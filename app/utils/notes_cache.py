@@ -0,0 +1,268 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from app.schemas import AWSIdentity, Note, StoredNote, NotesPage, NoteSummariesPage, BatchNote, BatchResult
+from app.settings import get_settings
+from app.utils.notes_service import NotesDBService
+from app.utils.metrics import instrument_methods
+
+
+class InMemoryCacheBackend:
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def add(self, key: str, value: str, ttl: Optional[int] = None) -> bool:
+        """Sets the key only if it holds no live value and returns whether it did."""
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                return False
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return True
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCacheBackend:
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str):
+        import redis
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(key)
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        self.client.set(key, value, ex=ttl)
+
+    def add(self, key: str, value: str, ttl: Optional[int] = None) -> bool:
+        return bool(self.client.set(key, value, ex=ttl, nx=True))
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*keys)
+
+
+class NotesCache:
+
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate}
+
+    def get_note(self, identity_id: str, note_id: str) -> Tuple[Optional[StoredNote], str]:
+        """Returns the cached note, if any, with the generation to pass to fill_note after a miss.
+
+        Notes are stored under a per-note generation that every write replaces, so a reader that loaded
+        the note before a concurrent write fills a key that nobody reads any more.
+        """
+        generation_key = self._note_generation_key(identity_id, note_id)
+        generation = self.backend.get(generation_key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            if not self.backend.add(generation_key, generation, self.ttl):
+                generation = self.backend.get(generation_key) or generation
+        value = self._get(self._note_key(identity_id, note_id, generation))
+        return (StoredNote.parse_raw(value) if value is not None else None), generation
+
+    def fill_note(self, identity_id: str, note: StoredNote, generation: str):
+        self.backend.set(self._note_key(identity_id, note.note_id, generation), note.json(), self.ttl)
+
+    def set_note(self, identity_id: str, note: StoredNote):
+        generation = uuid.uuid4().hex
+        self.backend.set(self._note_generation_key(identity_id, note.note_id), generation, self.ttl)
+        self.fill_note(identity_id, note, generation)
+
+    def delete_notes(self, identity_id: str, note_ids: List[str]):
+        self.backend.delete(*[self._note_generation_key(identity_id, note_id) for note_id in note_ids])
+
+    def get_listing(self, identity_id: str, listing_key: str, model) -> Tuple[Optional[object], str]:
+        """Returns the cached listing, if any, with the generation to pass to set_listing after a miss."""
+        generation_key = self._generation_key(identity_id)
+        generation = self.backend.get(generation_key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            if not self.backend.add(generation_key, generation):
+                generation = self.backend.get(generation_key) or generation
+        value = self._get(self._listing_key(identity_id, listing_key, generation))
+        return (model.parse_raw(value) if value is not None else None), generation
+
+    def set_listing(self, identity_id: str, listing_key: str, listing, generation: str):
+        self.backend.set(self._listing_key(identity_id, listing_key, generation), listing.json(), self.ttl)
+
+    def invalidate_listings(self, identity_id: str):
+        # Listings are stored under a per-user generation; replacing it orphans every cached page at once
+        # and the orphans age out through the TTL.
+        self.backend.set(self._generation_key(identity_id), uuid.uuid4().hex)
+
+    def _get(self, key: str) -> Optional[str]:
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    @staticmethod
+    def _listing_key(identity_id: str, listing_key: str, generation: str) -> str:
+        return f'notes:{identity_id}:listing:{generation}:{listing_key}'
+
+    @staticmethod
+    def _note_key(identity_id: str, note_id: str, generation: str) -> str:
+        return f'notes:{identity_id}:note:{note_id}:{generation}'
+
+    @staticmethod
+    def _note_generation_key(identity_id: str, note_id: str) -> str:
+        return f'notes:{identity_id}:note_generation:{note_id}'
+
+    @staticmethod
+    def _generation_key(identity_id: str) -> str:
+        return f'notes:{identity_id}:generation'
+
+
+@instrument_methods('notes_cache')
+class CachedNotesDBService(NotesDBService):
+
+    def __init__(self, identity: AWSIdentity, cache: NotesCache):
+        super().__init__(identity)
+        self.cache = cache
+
+    def create_note(self, note: Note):
+        stored_note = super().create_note(note)
+        self.cache.set_note(self.identity.identity_id, stored_note)
+        self.cache.invalidate_listings(self.identity.identity_id)
+        return stored_note
+
+    def get_notes(self, limit: int, cursor: str = None) -> NotesPage:
+        listing_key = f'notes:{limit}:{cursor or ""}'
+        page, generation = self.cache.get_listing(self.identity.identity_id, listing_key, NotesPage)
+        if page is None:
+            page = super().get_notes(limit, cursor)
+            self.cache.set_listing(self.identity.identity_id, listing_key, page, generation)
+        return page
+
+    def get_note_summaries(self, limit: int, cursor: str = None, preview_length: int = None) -> NoteSummariesPage:
+        listing_key = f'summaries:{limit}:{cursor or ""}:{preview_length or ""}'
+        page, generation = self.cache.get_listing(self.identity.identity_id, listing_key, NoteSummariesPage)
+        if page is None:
+            page = super().get_note_summaries(limit, cursor, preview_length)
+            self.cache.set_listing(self.identity.identity_id, listing_key, page, generation)
+        return page
+
+    def get_note(self, note_id: str):
+        stored_note, generation = self.cache.get_note(self.identity.identity_id, note_id)
+        if stored_note is None:
+            stored_note = super().get_note(note_id)
+            self.cache.fill_note(self.identity.identity_id, stored_note, generation)
+        return stored_note
+
+    def delete_note(self, note_id: str):
+        try:
+            super().delete_note(note_id)
+        finally:
+            self.cache.delete_notes(self.identity.identity_id, [note_id])
+            self.cache.invalidate_listings(self.identity.identity_id)
+
+    def update_note(self, note_id: str, title: str = None, text: str = None, expected_updated_at: int = None):
+        try:
+            stored_note = super().update_note(note_id, title, text, expected_updated_at)
+        except Exception:
+            self.cache.delete_notes(self.identity.identity_id, [note_id])
+            raise
+        self.cache.set_note(self.identity.identity_id, stored_note)
+        self.cache.invalidate_listings(self.identity.identity_id)
+        return stored_note
+
+    def batch_save_notes(self, notes: List[BatchNote]) -> BatchResult:
+        return self._invalidate_batch(super().batch_save_notes(notes))
+
+    def batch_delete_notes(self, note_ids: List[str]) -> BatchResult:
+        return self._invalidate_batch(super().batch_delete_notes(note_ids))
+
+    def _invalidate_batch(self, result: BatchResult) -> BatchResult:
+        self.cache.delete_notes(self.identity.identity_id, [item.note_id for item in result.results])
+        self.cache.invalidate_listings(self.identity.identity_id)
+        return result
+
+
+_notes_cache = None
+_notes_cache_lock = threading.Lock()
+
+
+def get_notes_cache() -> Optional[NotesCache]:
+    global _notes_cache
+    settings = get_settings()
+    if not settings.notes_cache_backend:
+        return None
+    if _notes_cache is None:
+        with _notes_cache_lock:
+            if _notes_cache is None:
+                if settings.notes_cache_backend == 'redis':
+                    backend = RedisCacheBackend.from_url(settings.notes_cache_redis_url)
+                elif settings.notes_cache_backend == 'memory':
+                    backend = InMemoryCacheBackend(max_size=settings.notes_cache_max_size)
+                else:
+                    raise ValueError(f'Unknown notes cache backend: {settings.notes_cache_backend}')
+                _notes_cache = NotesCache(backend, ttl=settings.notes_cache_ttl)
+    return _notes_cache
+
+
+def reset_notes_cache():
+    global _notes_cache
+    with _notes_cache_lock:
+        _notes_cache = None
@@ -0,0 +1,52 @@
+from typing import List
+
+from app.schemas import AWSIdentity, Note, StoredNote, NotesPage, NoteSummariesPage, BatchNote, BatchResult, \
+    NotesBatchGetResult, NoteChangesPage, NoteSearchResults
+from app.utils.metrics import instrument_methods
+from app.utils.notes_backends import NotesBackend, get_notes_backend
+
+
+@instrument_methods('notes_db')
+class NotesDBService:
+    """The notes of one identity, kept by the storage backend chosen through NOTES_STORAGE_BACKEND."""
+
+    def __init__(self, identity: AWSIdentity, backend: NotesBackend = None):
+        self.identity = identity
+        self.backend = backend if backend is not None else get_notes_backend(identity)
+
+    def create_note(self, note: Note) -> StoredNote:
+        return self.backend.create_note(note)
+
+    def get_notes(self, limit: int, cursor: str = None) -> NotesPage:
+        return self.backend.get_notes(limit, cursor)
+
+    def get_note_summaries(self, limit: int, cursor: str = None, preview_length: int = None) -> NoteSummariesPage:
+        return self.backend.get_note_summaries(limit, cursor, preview_length)
+
+    def export_notes(self, page_size: int):
+        yield from self.backend.export_notes(page_size)
+
+    def get_note_changes(self, since: int, limit: int, cursor: str = None) -> NoteChangesPage:
+        return self.backend.get_note_changes(since, limit, cursor)
+
+    def search_notes(self, query: str, limit: int) -> NoteSearchResults:
+        return self.backend.search_notes(query, limit)
+
+    def get_note(self, note_id: str) -> StoredNote:
+        return self.backend.get_note(note_id)
+
+    def delete_note(self, note_id: str):
+        self.backend.delete_note(note_id)
+
+    def update_note(self, note_id: str, title: str = None, text: str = None,
+                    expected_updated_at: int = None) -> StoredNote:
+        return self.backend.update_note(note_id, title, text, expected_updated_at)
+
+    def batch_save_notes(self, notes: List[BatchNote]) -> BatchResult:
+        return self.backend.batch_save_notes(notes)
+
+    def batch_delete_notes(self, note_ids: List[str]) -> BatchResult:
+        return self.backend.batch_delete_notes(note_ids)
+
+    def batch_get_notes(self, note_ids: List[str]) -> NotesBatchGetResult:
+        return self.backend.batch_get_notes(note_ids)
@@ -0,0 +1,39 @@
+import base64
+import binascii
+import json
+from typing import Dict, Optional, Tuple, Union
+
+from fastapi import status
+
+from app.exceptions import AWSServicesException
+
+HASH_KEY_NAME = 'user_id'
+
+
+def encode_cursor(last_evaluated_key: Optional[Dict]) -> Optional[str]:
+    if not last_evaluated_key:
+        return None
+    payload = {name: value for name, value in last_evaluated_key.items() if name != HASH_KEY_NAME}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: Optional[str], hash_key: str, range_key_prefix: Union[str, Tuple[str, ...]],
+                  index_key_names: Tuple[str, ...] = ()) -> Optional[Dict]:
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        range_key = payload['contents']['S']
+        index_keys = [payload[name]['N'] for name in index_key_names]
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise _invalid_cursor()
+    if not isinstance(range_key, str) or not range_key.startswith(range_key_prefix):
+        raise _invalid_cursor()
+    if not all(isinstance(index_key, str) and index_key.lstrip('-').isdigit() for index_key in index_keys):
+        raise _invalid_cursor()
+    payload[HASH_KEY_NAME] = {'S': hash_key}
+    return payload
+
+
+def _invalid_cursor() -> AWSServicesException:
+    return AWSServicesException(recommended_status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
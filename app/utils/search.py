@@ -0,0 +1,266 @@
+import heapq
+import math
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import status
+
+from app.exceptions import AWSServicesException
+from app.schemas import StoredNote, NoteSearchHit
+from app.settings import get_settings
+
+TOKEN_PATTERN = re.compile(r'\w+')
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_PREFIX_EXPANSIONS = 64
+# Writes from other Lambda instances may land with a slightly older updated_at than changes already seen, so every
+# catch-up re-reads this much of the change feed. Re-applying a change is a no-op.
+SYNC_OVERLAP_MICROSECONDS = 5_000_000
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class InvertedIndex:
+    """BM25-ranked inverted index with prefix matching on query terms. Not thread-safe."""
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._terms: List[str] = []
+        self._doc_ids: Dict[str, int] = {}
+        self._keys: Dict[int, str] = {}
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self._doc_lengths: Dict[int, int] = {}
+        self._total_length = 0
+        self._next_doc_id = 0
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    def __contains__(self, key: str):
+        return key in self._doc_ids
+
+    def add(self, key: str, text: str):
+        self.remove(key)
+        term_frequencies = Counter(tokenize(text))
+        doc_id = self._next_doc_id
+        self._next_doc_id += 1
+        self._doc_ids[key] = doc_id
+        self._keys[doc_id] = key
+        self._doc_terms[doc_id] = tuple(term_frequencies)
+        doc_length = sum(term_frequencies.values())
+        self._doc_lengths[doc_id] = doc_length
+        self._total_length += doc_length
+        for term, frequency in term_frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                insort(self._terms, term)
+            postings[doc_id] = frequency
+
+    def remove(self, key: str):
+        doc_id = self._doc_ids.pop(key, None)
+        if doc_id is None:
+            return
+        del self._keys[doc_id]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        for term in self._doc_terms.pop(doc_id):
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect_left(self._terms, term)]
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, float]]:
+        """
+        Scores every document containing a term that starts with one of the query tokens. A token contributes the
+        score of its best matching term in the document, so a prefix that expands to several terms is not counted
+        more than once.
+        """
+        doc_count = len(self._doc_ids)
+        if not doc_count:
+            return []
+        norm_base = BM25_K1 * (1 - BM25_B)
+        norm_scale = BM25_K1 * BM25_B * doc_count / self._total_length if self._total_length else 0.0
+        doc_lengths = self._doc_lengths
+        scores: Dict[int, float] = {}
+        for token in set(tokenize(query)):
+            token_scores: Dict[int, float] = {}
+            for term in self._expand(token):
+                postings = self._postings[term]
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                numerator = idf * (BM25_K1 + 1)
+                term_scores = {
+                    doc_id: numerator * frequency / (frequency + norm_base + norm_scale * doc_lengths[doc_id])
+                    for doc_id, frequency in postings.items()
+                }
+                if token_scores:
+                    for doc_id, score in term_scores.items():
+                        if score > token_scores.get(doc_id, 0.0):
+                            token_scores[doc_id] = score
+                else:
+                    token_scores = term_scores
+            if scores:
+                for doc_id, score in token_scores.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score
+            else:
+                scores = token_scores
+        top = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        return [(self._keys[doc_id], score) for doc_id, score in top]
+
+    def _expand(self, prefix: str) -> List[str]:
+        terms = []
+        position = bisect_left(self._terms, prefix)
+        while position < len(self._terms) and len(terms) < MAX_PREFIX_EXPANSIONS:
+            term = self._terms[position]
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+            position += 1
+        return terms
+
+
+class NoteSearchIndex:
+    """
+    Search index over one user's notes. It is built from a full export the first time it is searched and then kept
+    current from the change feed, plus direct updates for writes made by this process.
+
+    The export runs outside the lock, so writes are not held up by it; they are buffered meanwhile and replayed onto
+    the new index before it is swapped in. Searches arriving while the index is being built are answered with 503
+    instead of queueing behind the export.
+    """
+
+    def __init__(self):
+        self._index = InvertedIndex()
+        self._titles: Dict[str, str] = {}
+        self._synced_until: Optional[int] = None
+        self._pending: Optional[List[Tuple[Optional[StoredNote], Optional[str]]]] = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def upsert(self, note: StoredNote):
+        with self._lock:
+            self._upsert(note)
+            if self._pending is not None:
+                self._pending.append((note, None))
+
+    def remove(self, note_id: str):
+        with self._lock:
+            self._remove(note_id)
+            if self._pending is not None:
+                self._pending.append((None, note_id))
+
+    def sync(self, notes_service, page_size: int):
+        if self._synced_until is None:
+            self._build(notes_service, page_size)
+        with self._lock:
+            since = max(self._synced_until - SYNC_OVERLAP_MICROSECONDS, 0)
+        # Pages are fetched outside the lock so searches and writes don't wait behind the change feed; each one is
+        # applied under it, and a slower concurrent sync never moves the token backwards.
+        cursor = None
+        while True:
+            page = notes_service.get_note_changes(since, page_size, cursor)
+            changes = [(note.updated_at, note, None) for note in page.upserts] + \
+                      [(deletion.deleted_at, None, deletion.note_id) for deletion in page.deletions]
+            with self._lock:
+                for updated_at, note, deleted_id in sorted(changes, key=itemgetter(0)):
+                    if note is not None:
+                        self._upsert(note)
+                    else:
+                        self._remove(deleted_id)
+                    self._synced_until = max(self._synced_until, updated_at)
+            cursor = page.next_cursor
+            if not cursor:
+                break
+
+    def _build(self, notes_service, page_size: int):
+        if not self._build_lock.acquire(blocking=False):
+            raise AWSServicesException(recommended_status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                       detail='The search index is warming up, retry shortly')
+        try:
+            if self._synced_until is not None:
+                return
+            with self._lock:
+                self._pending = []
+            started = time.time_ns() // 1000
+            built = NoteSearchIndex()
+            for note in notes_service.export_notes(page_size):
+                built._upsert(note)
+            with self._lock:
+                for note, deleted_id in self._pending:
+                    if note is not None:
+                        built._upsert(note)
+                    else:
+                        built._remove(deleted_id)
+                self._index, self._titles = built._index, built._titles
+                self._synced_until = started
+        finally:
+            with self._lock:
+                self._pending = None
+            self._build_lock.release()
+
+    def search(self, query: str, limit: int) -> List[NoteSearchHit]:
+        with self._lock:
+            return [NoteSearchHit(note_id=note_id, title=self._titles[note_id], score=score)
+                    for note_id, score in self._index.search(query, limit)]
+
+    def _upsert(self, note: StoredNote):
+        self._index.add(note.note_id, f'{note.title}\n{note.text}')
+        self._titles[note.note_id] = note.title
+
+    def _remove(self, note_id: str):
+        self._index.remove(note_id)
+        self._titles.pop(note_id, None)
+
+
+class NoteSearchIndexes:
+    """LRU of per-user search indexes, so only recently searched users are held in memory."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._indexes: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, identity_id: str) -> NoteSearchIndex:
+        with self._lock:
+            index = self._indexes.get(identity_id)
+            if index is None:
+                index = self._indexes[identity_id] = NoteSearchIndex()
+                if len(self._indexes) > self.max_size:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(identity_id)
+            return index
+
+    def peek(self, identity_id: str) -> Optional[NoteSearchIndex]:
+        with self._lock:
+            return self._indexes.get(identity_id)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+_note_search_indexes = None
+_note_search_indexes_lock = threading.Lock()
+
+
+def get_note_search_indexes() -> NoteSearchIndexes:
+    global _note_search_indexes
+    if _note_search_indexes is None:
+        with _note_search_indexes_lock:
+            if _note_search_indexes is None:
+                _note_search_indexes = NoteSearchIndexes(max_size=get_settings().notes_search_max_indexes)
+    return _note_search_indexes
+
+
+def reset_note_search_indexes():
+    global _note_search_indexes
+    with _note_search_indexes_lock:
+        _note_search_indexes = None
@@ -0,0 +1,175 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from fastapi import status
+
+from app.exceptions import AWSServicesException
+from app.settings import get_settings
+from app.utils.metrics import AWS_RETRIES, timed
+
+THROTTLING_ERROR_CODES = {
+    'TooManyRequestsException',
+    'LimitExceededException',
+    'ThrottlingException',
+}
+TRANSIENT_ERROR_CODES = {
+    'InternalErrorException',
+    'ServiceUnavailable',
+}
+# A transient error or a dropped connection leaves it unknown whether the call took effect, so only these operations,
+# which can safely be repeated, are retried after one. Other operations are retried on throttling only, which AWS
+# answers before doing any work.
+IDEMPOTENT_OPERATIONS = {
+    'initiate_auth',
+    'admin_add_user_to_group',
+    'get_id',
+    'get_credentials_for_identity',
+}
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        """Takes a token, waiting up to timeout seconds for one to become available."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """One token bucket per operation; operations without a configured rate are not limited."""
+
+    def __init__(self, rates: Dict[str, float], timeout: float):
+        self.timeout = timeout
+        self._buckets = {operation: TokenBucket(rate) for operation, rate in rates.items() if rate > 0}
+
+    def acquire(self, operation: str):
+        bucket = self._buckets.get(operation)
+        if bucket is not None and not bucket.acquire(self.timeout):
+            raise AWSServicesException(recommended_status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                       detail='Too many requests, try again later')
+
+
+class SingleFlight:
+    """
+    Runs concurrent calls with the same key once and hands the outcome to every caller. With a timeout, callers that
+    join a running call give up once it has run that long, so they wait no longer than the caller that started it.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, '_Call'] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, func: Callable, *args, timeout: float = None, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            remaining = None if timeout is None else max(call.started_at + timeout - time.monotonic(), 0)
+            if not call.done.wait(remaining):
+                raise AWSServicesException(recommended_status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                           detail='Timed out waiting for AWS, try again later')
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.started_at = time.monotonic()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+def is_retryable_error(ex: Exception, operation: str) -> bool:
+    from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+    idempotent = operation in IDEMPOTENT_OPERATIONS
+    if isinstance(ex, ClientError):
+        error_code = ex.response.get('Error', {}).get('Code')
+        return error_code in THROTTLING_ERROR_CODES or (idempotent and error_code in TRANSIENT_ERROR_CODES)
+    return idempotent and isinstance(ex, (ConnectionError, HTTPClientError))
+
+
+def get_backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Full jitter: a uniform delay up to the capped exponential backoff for the given (zero-based) attempt."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def call_aws(method, **kwargs):
+    """
+    Calls a boto3 client method under the per-operation rate limit, retrying throttling (and, for idempotent
+    operations, transient errors) with jittered exponential backoff until AWS_CALL_TIMEOUT runs out. Every attempt
+    takes a token, so retries are rate limited too.
+    """
+    settings = get_settings()
+    operation = method.__name__
+    limiter = get_rate_limiter()
+    deadline = time.monotonic() + settings.aws_call_timeout
+    attempt = 0
+    while True:
+        limiter.acquire(operation)
+        try:
+            with timed(f'aws.{operation}'):
+                return method(**kwargs)
+        except Exception as ex:
+            attempt += 1
+            if attempt >= settings.aws_retry_max_attempts or not is_retryable_error(ex, operation):
+                raise
+            delay = get_backoff_delay(attempt - 1, settings.aws_retry_base_delay, settings.aws_retry_max_delay)
+            if time.monotonic() + delay >= deadline:
+                raise
+        AWS_RETRIES.inc(operation=operation)
+        time.sleep(delay)
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                settings = get_settings()
+                _rate_limiter = RateLimiter(settings.aws_rate_limits, timeout=settings.aws_rate_limit_timeout)
+    return _rate_limiter
+
+
+def reset_rate_limiter():
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = None
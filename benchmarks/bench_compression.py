@@ -0,0 +1,77 @@
+"""Measure bytes on the wire and CPU time of response compression for typical note lists.
+
+Pages of 100, 1k and 10k notes with word-like titles and texts are rendered the
+way GET /v1/notes renders them, then compressed with gzip at several levels and,
+when the brotli package is installed, brotli at several qualities. The Lambda
+column is the size after the base64 encoding Mangum applies to compressed
+bodies.
+
+Run from the repository root: python -m benchmarks.bench_compression [iterations]
+"""
+import itertools
+import random
+import statistics
+import sys
+import time
+
+from benchmarks.moto_env import load_test_env
+
+PAGE_SIZES = (100, 1000, 10000)
+GZIP_LEVELS = (1, 4, 6, 9)
+BROTLI_QUALITIES = (1, 4, 5, 11)
+
+
+def _page(count, rng):
+    from app.schemas import NotesPage, StoredNote
+    from app.utils.serialization import NotesJSONResponse
+
+    vocabulary = [''.join(rng.choice('etaoinshrdlucmfwypvbgkjqxz') for _ in range(rng.randint(2, 10)))
+                  for _ in range(5000)]
+    # Zipf-like word frequencies, as in natural text.
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+    def words(k):
+        return ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=k))
+
+    notes = [StoredNote(title=words(rng.randint(2, 6)), text=words(rng.randint(10, 300)),
+                        note_id=f'{rng.getrandbits(128):032x}', updated_at=1700000000000000 + index)
+             for index in range(count)]
+    return NotesJSONResponse(NotesPage(notes=notes)).body
+
+
+def _measure(compressor_factory, body, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        compressor = compressor_factory()
+        compressed = compressor.compress(body) + compressor.finish()
+        timings.append(time.perf_counter() - started)
+    return len(compressed), statistics.median(timings) * 1000
+
+
+def main(iterations=5):
+    load_test_env()
+    from app.utils.compression import BrotliCompressor, GzipCompressor, _import_brotli
+
+    brotli = _import_brotli()
+    candidates = [(f'gzip {level}', lambda level=level: GzipCompressor(level)) for level in GZIP_LEVELS]
+    if brotli is not None:
+        candidates += [(f'br {quality}', lambda quality=quality: BrotliCompressor(brotli, quality))
+                       for quality in BROTLI_QUALITIES]
+    else:
+        print('brotli is not installed, only gzip is measured')
+
+    rng = random.Random(0)
+    for count in PAGE_SIZES:
+        body = _page(count, rng)
+        print(f'{count} notes: {len(body) / 1024:.0f} KiB uncompressed, '
+              f'{len(body) * 4 / 3 / 1024:.0f} KiB if base64 encoded')
+        for name, factory in candidates:
+            size, elapsed_ms = _measure(factory, body, iterations)
+            print(f'  {name:<8} {size / 1024:8.1f} KiB  ratio {len(body) / size:5.2f}  '
+                  f'Lambda {size * 4 / 3 / 1024:8.1f} KiB  {elapsed_ms:8.2f} ms  '
+                  f'{len(body) / 1024 / 1024 / (elapsed_ms / 1000):7.1f} MiB/s')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,85 @@
+"""Measure search latency on a synthetic corpus (100k notes by default).
+
+Words are drawn from a Zipf-like distribution over a fixed vocabulary so that
+common terms have long posting lists and rare ones short lists, as in real
+notes. Reported are the index build time, query latency percentiles for exact,
+multi-term and prefix queries, and the cost of the incremental update done on
+every create, update and delete.
+
+Run from the repository root: python -m benchmarks.bench_search [notes] [queries]
+"""
+import itertools
+import random
+import statistics
+import sys
+import time
+
+from benchmarks.moto_env import load_test_env
+
+VOCABULARY_SIZE = 50000
+WORDS_PER_NOTE = (20, 120)
+
+
+def _vocabulary(rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add(''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    return sorted(words, key=lambda word: rng.random())
+
+
+def _corpus(rng, vocabulary, note_count):
+    cumulative_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    for i in range(note_count):
+        words = rng.choices(vocabulary, cum_weights=cumulative_weights, k=rng.randint(*WORDS_PER_NOTE))
+        yield f'note_{i}', ' '.join(words)
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return {name: samples[min(int(len(samples) * q), len(samples) - 1)] * 1000
+            for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))}
+
+
+def _time_queries(index, queries, limit=20):
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, limit)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main(note_count=100000, query_count=200):
+    load_test_env()
+    from app.utils.search import InvertedIndex
+
+    rng = random.Random(42)
+    vocabulary = _vocabulary(rng)
+    index = InvertedIndex()
+    started = time.perf_counter()
+    for key, text in _corpus(rng, vocabulary, note_count):
+        index.add(key, text)
+    print(f'indexed {note_count} notes in {time.perf_counter() - started:.1f} s')
+
+    common, rare = vocabulary[:100], vocabulary[-10000:]
+    query_sets = {
+        'rare term': [rng.choice(rare) for _ in range(query_count)],
+        'common term': [rng.choice(common) for _ in range(query_count)],
+        'two terms': [f'{rng.choice(common)} {rng.choice(rare)}' for _ in range(query_count)],
+        'prefix (3 chars)': [rng.choice(vocabulary)[:3] for _ in range(query_count)],
+    }
+    for name, queries in query_sets.items():
+        latency = _percentiles(_time_queries(index, queries))
+        print(f'{name:<18} ' + '  '.join(f'{key} {value:7.2f} ms' for key, value in latency.items()))
+
+    updates = []
+    for key, text in _corpus(rng, vocabulary, query_count):
+        started = time.perf_counter()
+        index.add(key, text)
+        updates.append(time.perf_counter() - started)
+    print(f'{"incremental update":<18} {statistics.mean(updates) * 1e6:7.1f} us mean')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
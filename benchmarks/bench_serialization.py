@@ -0,0 +1,70 @@
+"""Compare building and encoding a page of notes the validated way against the direct path.
+
+The validated path is what listing did before: a DynamoDBNote per item, a
+validated StoredNote per note, a validated NotesPage, then jsonable_encoder and
+JSONResponse. The direct path maps the attribute maps straight to StoredNote
+records and renders the page with NotesJSONResponse. Both must produce the same
+bytes; the script checks that before reporting.
+
+Run from the repository root: python -m benchmarks.bench_serialization [iterations]
+"""
+import statistics
+import sys
+import time
+
+from benchmarks.moto_env import load_test_env
+
+PAGE_SIZES = (1000, 10000)
+
+
+def _items(count):
+    return [{
+        'user_id': {'S': 'identity'},
+        'contents': {'S': f'note_{index:032x}'},
+        'title': {'S': f'note {index}'},
+        'text': {'S': 'benchmark note text ' * 10},
+        'updated_at': {'N': str(1700000000000000 + index)},
+    } for index in range(count)]
+
+
+def _time(func, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        body = func()
+        timings.append(time.perf_counter() - started)
+    return body, statistics.median(timings) * 1000
+
+
+def main(iterations=5):
+    load_test_env()
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from app.schemas import AWSIdentity, NotesPage, StoredNote
+    from app.utils.dynamodb_service import DynamoDBNote, DynamoDBNotesBackend
+    from app.utils.serialization import NotesJSONResponse
+
+    notes_backend = DynamoDBNotesBackend(AWSIdentity.construct(identity_id='identity', credentials=None))
+
+    def validated(items):
+        notes = [DynamoDBNote.from_raw_data(item) for item in items]
+        page = NotesPage(notes=[StoredNote(title=note.title, text=note.text, note_id=note.contents[len('note_'):],
+                                           updated_at=note.updated_at) for note in notes])
+        return JSONResponse(jsonable_encoder(page)).body
+
+    def direct(items):
+        notes = notes_backend._load_blob_texts([notes_backend._get_stored_note_from_item(item) for item in items])
+        page = NotesPage.construct(notes=notes, next_cursor=None)
+        return NotesJSONResponse(page).body
+
+    for size in PAGE_SIZES:
+        items = _items(size)
+        validated_body, validated_ms = _time(lambda: validated(items), iterations)
+        direct_body, direct_ms = _time(lambda: direct(items), iterations)
+        assert validated_body == direct_body, 'the direct path must render the same bytes'
+        print(f'{size:>6} notes   validated {validated_ms:8.1f} ms   direct {direct_ms:8.1f} ms   '
+              f'{validated_ms / direct_ms:5.1f}x   ({len(direct_body) / 1024:.0f} KiB)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,38 @@
+"""Measure the per-request cost of building Settings against the cached provider.
+
+Before the provider, sign-up built Settings three times (sign_up,
+_generate_secret_hash and add_user_to_default_group), sign-in twice
+(initiate_auth and _generate_secret_hash) and identity resolution on the notes
+path twice (get_aws_identity and the JWT verifier lookup).
+
+Run from the repository root: python -m benchmarks.bench_settings [iterations]
+"""
+import sys
+import timeit
+
+from benchmarks.moto_env import load_test_env
+
+CONSTRUCTIONS_PER_REQUEST = {
+    '/auth/sign_up': 3,
+    '/auth/sign_in': 2,
+    '/v1/notes (identity miss)': 2,
+}
+
+
+def main(iterations=20000):
+    load_test_env()
+    from app.settings import Settings, get_settings
+
+    get_settings()
+    construct = timeit.timeit(Settings, number=iterations) / iterations
+    cached = timeit.timeit(get_settings, number=iterations) / iterations
+
+    print(f'Settings()       {construct * 1e6:8.2f} us per call')
+    print(f'get_settings()   {cached * 1e6:8.2f} us per call')
+    for path, constructions in CONSTRUCTIONS_PER_REQUEST.items():
+        saved = (construct - cached) * constructions
+        print(f'{path:<28} {saved * 1e6:8.2f} us saved per request')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
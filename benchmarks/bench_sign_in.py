@@ -0,0 +1,56 @@
+"""Compare /auth/sign_in latency with shared boto3 clients against one client per call.
+
+Run from the repository root: python -m benchmarks.bench_sign_in [iterations]
+"""
+import statistics
+import sys
+import time
+
+import boto3
+
+from benchmarks.moto_env import mocked_aws, USERNAME, PASSWORD
+
+
+def _time_sign_in(client, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = client.post('/auth/sign_in', data={'username': USERNAME, 'password': PASSWORD})
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.content
+    return timings
+
+
+def _report(name, timings):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p95 = timings_ms[int(len(timings_ms) * 0.95) - 1]
+    print(f'{name:<20} mean {statistics.mean(timings_ms):8.2f} ms   '
+          f'p50 {statistics.median(timings_ms):8.2f} ms   p95 {p95:8.2f} ms')
+
+
+def main(iterations=200):
+    with mocked_aws():
+        from fastapi.testclient import TestClient
+        from app.main import app
+        from app.utils import aws_clients
+
+        client = TestClient(app)
+        get_client = aws_clients.get_client
+
+        aws_clients.get_client = lambda service_name: boto3.client(service_name)
+        try:
+            _time_sign_in(client, 5)
+            before = _time_sign_in(client, iterations)
+        finally:
+            aws_clients.get_client = get_client
+
+        aws_clients.reset_clients()
+        _time_sign_in(client, 5)
+        after = _time_sign_in(client, iterations)
+
+    _report('client per call', before)
+    _report('shared clients', after)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
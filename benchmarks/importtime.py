@@ -0,0 +1,61 @@
+"""Report `python -X importtime` totals for the Lambda handler module.
+
+Prints the total import time of the target module, the slowest modules by
+cumulative time and the self time grouped by top-level package. With --max-ms
+the script exits non-zero when the total exceeds the budget, so it can guard
+cold-start regressions in CI.
+
+Run from the repository root: python -m benchmarks.importtime [--module app.main] [--top 15] [--max-ms 400]
+"""
+import argparse
+import collections
+import os
+import subprocess
+import sys
+
+from benchmarks.moto_env import load_test_env
+
+
+def measure(module: str):
+    env = dict(os.environ)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            env=env, capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='app.main')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--max-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    load_test_env()
+    imports = measure(args.module)
+    total_ms = next(cumulative for name, _, cumulative in imports if name == args.module) / 1000
+
+    by_package = collections.Counter()
+    for name, self_us, _ in imports:
+        by_package[name.split('.')[0]] += self_us
+
+    print(f'{args.module}: {total_ms:.1f} ms total, {len(imports)} modules imported')
+    print('\nslowest modules (cumulative):')
+    for name, _, cumulative_us in sorted(imports, key=lambda item: item[2], reverse=True)[:args.top]:
+        print(f'  {cumulative_us / 1000:8.1f} ms  {name}')
+    print('\nself time by top-level package:')
+    for package, self_us in by_package.most_common(args.top):
+        print(f'  {self_us / 1000:8.1f} ms  {package}')
+
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f'\nimport time {total_ms:.1f} ms exceeds budget of {args.max_ms:.1f} ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
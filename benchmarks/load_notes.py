@@ -0,0 +1,52 @@
+"""Load test GET /v1/notes against moto at increasing client concurrency.
+
+moto answers in-process, so every AWS call is delayed by a simulated network
+round trip to make blocking I/O visible. With handlers running on the bounded
+thread pool, throughput should grow with the number of concurrent clients.
+
+Run from the repository root: python -m benchmarks.load_notes [requests_per_level] [latency_ms]
+"""
+import asyncio
+import sys
+import time
+
+import httpx
+
+from benchmarks.moto_env import mocked_aws, add_network_latency, USERNAME, PASSWORD
+
+CONCURRENCY_LEVELS = (1, 4, 16, 32)
+
+
+async def _run_level(app, headers, concurrency, total_requests):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+        async def request():
+            async with semaphore:
+                response = await client.get('/v1/notes', headers=headers)
+                assert response.status_code == 200, response.content
+
+        started = time.perf_counter()
+        await asyncio.gather(*[request() for _ in range(total_requests)])
+        return time.perf_counter() - started
+
+
+def main(total_requests=64, latency_ms=50):
+    with mocked_aws():
+        from fastapi.testclient import TestClient
+        from app.main import app
+
+        sign_in = TestClient(app).post('/auth/sign_in', data={'username': USERNAME, 'password': PASSWORD})
+        headers = {'Authorization': f"Bearer {sign_in.json()['access_token']}"}
+        restore = add_network_latency(latency_ms / 1000)
+        try:
+            for concurrency in CONCURRENCY_LEVELS:
+                elapsed = asyncio.run(_run_level(app, headers, concurrency, total_requests))
+                print(f'concurrency {concurrency:>3}: {total_requests / elapsed:8.1f} req/s '
+                      f'({elapsed:.2f} s for {total_requests} requests)')
+        finally:
+            restore()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
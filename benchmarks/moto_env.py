@@ -0,0 +1,83 @@
+import contextlib
+import os
+import time
+from pathlib import Path
+
+import boto3
+from dotenv import load_dotenv
+from moto import mock_cognitoidp, mock_dynamodb, mock_cognitoidentity
+from moto.core.models import botocore_stubber
+
+TEST_ENV_PATH = Path(__file__).resolve().parent.parent / 'tests' / '.test.env'
+
+USERNAME = 'Bench'
+PASSWORD = 'Passw0rd!'
+
+
+def load_test_env():
+    load_dotenv(dotenv_path=TEST_ENV_PATH)
+    os.environ.setdefault('AWS_DEFAULT_REGION', os.environ['AWS_REGION'])
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+
+@contextlib.contextmanager
+def mocked_aws():
+    load_test_env()
+    with mock_cognitoidp(), mock_cognitoidentity(), mock_dynamodb():
+        cognito_service = boto3.client('cognito-idp')
+        user_pool_id = cognito_service.create_user_pool(PoolName='bench_pool')['UserPool']['Id']
+        client_id = cognito_service.create_user_pool_client(
+            UserPoolId=user_pool_id, ClientName='bench_client', CallbackURLs=['bench_callback']
+        )['UserPoolClient']['ClientId']
+        cognito_service.create_group(GroupName=os.environ['COGNITO_REGULAR_USER_GROUP_NAME'],
+                                     UserPoolId=user_pool_id)
+        os.environ['COGNITO_USER_POOL_ID'] = user_pool_id
+        os.environ['COGNITO_CLIENT_ID'] = client_id
+
+        identity_pool = boto3.client('cognito-identity').create_identity_pool(
+            IdentityPoolName='bench_identity_pool', AllowUnauthenticatedIdentities=False)
+        os.environ['COGNITO_IDENTITY_POOL_ID'] = identity_pool['IdentityPoolId']
+
+        create_user(USERNAME, PASSWORD)
+
+        boto3.resource('dynamodb').create_table(
+            TableName=os.environ['DYNAMO_DB_NOTES_TABLE'],
+            AttributeDefinitions=[
+                {'AttributeName': 'user_id', 'AttributeType': 'S'},
+                {'AttributeName': 'contents', 'AttributeType': 'S'},
+                {'AttributeName': 'updated_at', 'AttributeType': 'N'}
+            ],
+            KeySchema=[
+                {'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                {'AttributeName': 'contents', 'KeyType': 'RANGE'}
+            ],
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'updated_at_index',
+                'KeySchema': [
+                    {'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                    {'AttributeName': 'updated_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }],
+            BillingMode='PAY_PER_REQUEST')
+        yield
+
+
+def create_user(username, password):
+    """Signs up and confirms a user in the mocked user pool of mocked_aws()."""
+    cognito_service = boto3.client('cognito-idp')
+    cognito_service.sign_up(ClientId=os.environ['COGNITO_CLIENT_ID'], Username=username, Password=password)
+    cognito_service.admin_confirm_sign_up(UserPoolId=os.environ['COGNITO_USER_POOL_ID'], Username=username)
+
+
+def add_network_latency(latency):
+    """Delays every mocked AWS call by latency seconds; returns a function that removes the delay."""
+    stub = type(botocore_stubber).__call__
+
+    def delayed(self, event_name, request, **kwargs):
+        time.sleep(latency)
+        return stub(self, event_name, request, **kwargs)
+
+    type(botocore_stubber).__call__ = delayed
+    return lambda: setattr(type(botocore_stubber), '__call__', stub)
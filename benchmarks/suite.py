@@ -0,0 +1,312 @@
+"""Per-endpoint latency and throughput benchmarks against moto, with JSON results and baseline comparison.
+
+Latency runs issue requests one at a time through TestClient and report
+percentiles per scenario: sign-in, note create/read/update/delete, listing all
+notes of users holding 10, 1k and 10k notes, and identity resolution (cold,
+with the identity cache cleared, and cached). Throughput runs send a fixed
+number of requests through an async httpx client at several concurrency levels.
+
+moto answers in-process; --latency-ms delays every AWS call by a simulated
+network round trip so that blocking I/O and concurrency show up in the numbers.
+
+Results are written as JSON (--output). With --baseline the run is compared to
+a saved result file and the process exits non-zero when a scenario regressed by
+more than --threshold; --results compares an existing file instead of running.
+
+Run from the repository root:
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --output current.json --baseline baseline.json
+    python -m benchmarks.suite --results current.json --baseline baseline.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.moto_env import mocked_aws, add_network_latency, create_user, USERNAME, PASSWORD
+
+LIST_SIZES = (10, 1000, 10000)
+CONCURRENCY_LEVELS = (1, 4, 16, 32)
+THROUGHPUT_SCENARIOS = ('sign_in', 'get_note', 'list_notes_10')
+BATCH_SIZE = 1000
+
+
+def _summarize(timings):
+    timings_ms = sorted(timing * 1000 for timing in timings)
+
+    def percentile(fraction):
+        return timings_ms[min(len(timings_ms) - 1, int(len(timings_ms) * fraction))]
+
+    return {
+        'iterations': len(timings_ms),
+        'mean_ms': statistics.mean(timings_ms),
+        'min_ms': timings_ms[0],
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': timings_ms[-1],
+    }
+
+
+def _measure(func, iterations, warmup=2):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return _summarize(timings)
+
+
+def _check(response, expected_status=200):
+    assert response.status_code == expected_status, (response.status_code, response.content)
+    return response
+
+
+def _sign_in(client, username, password):
+    response = _check(client.post('/auth/sign_in', data={'username': username, 'password': password}))
+    return response.json()['access_token']
+
+
+def _create_notes(client, headers, count):
+    for start in range(0, count, BATCH_SIZE):
+        notes = [{'note_id': f'bench_{index:06d}', 'title': f'note {index}', 'text': 'benchmark note text ' * 10}
+                 for index in range(start, min(count, start + BATCH_SIZE))]
+        _check(client.post('/v1/notes:batch', json={'notes': notes}, headers=headers))
+
+
+def _list_all_notes(client, headers, page_size):
+    params = {'limit': page_size}
+    count = 0
+    while True:
+        page = _check(client.get('/v1/notes', params=params, headers=headers)).json()
+        count += len(page['notes'])
+        if not page.get('next_cursor'):
+            return count
+        params['cursor'] = page['next_cursor']
+
+
+class _Requests:
+    """Request factories shared by the latency and throughput runs; each returns (method, url, kwargs)."""
+
+    def __init__(self, headers, note_id, list_headers):
+        self.headers = headers
+        self.note_id = note_id
+        self.list_headers = list_headers
+
+    def sign_in(self):
+        return 'POST', '/auth/sign_in', {'data': {'username': USERNAME, 'password': PASSWORD}}
+
+    def get_note(self):
+        return 'GET', f'/v1/notes/{self.note_id}', {'headers': self.headers}
+
+    def list_notes_10(self):
+        return 'GET', '/v1/notes', {'headers': self.list_headers[10], 'params': {'limit': 10}}
+
+
+def run_latency(client, app_requests, iterations, list_iterations, list_sizes):
+    from app.utils.auth.aws_jwt import get_aws_identity, get_identity_cache, get_identity_id_cache
+    from app.settings import get_settings
+
+    headers = app_requests.headers
+    results = {}
+
+    def send(factory):
+        method, url, kwargs = factory()
+        return lambda: _check(client.request(method, url, **kwargs))
+
+    results['sign_in'] = _measure(send(app_requests.sign_in), iterations)
+
+    created = []
+    results['create_note'] = _measure(
+        lambda: created.append(_check(client.post('/v1/notes', json={'title': 'bench', 'text': 'bench text'},
+                                                  headers=headers), 201).json()['note_id']),
+        iterations)
+    results['get_note'] = _measure(send(app_requests.get_note), iterations)
+    results['update_note'] = _measure(
+        lambda: _check(client.patch(f'/v1/notes/{app_requests.note_id}', json={'text': 'updated bench text'},
+                                    headers=headers)),
+        iterations)
+    results['delete_note'] = _measure(
+        lambda: _check(client.delete(f'/v1/notes/{created.pop()}', headers=headers), 204),
+        min(iterations, len(created) - 2))
+
+    page_size = get_settings().notes_page_max_limit
+    for size in list_sizes:
+        list_headers = app_requests.list_headers[size]
+        results[f'list_notes_{size}'] = _measure(lambda: _list_all_notes(client, list_headers, page_size),
+                                                 list_iterations if size > 10 else iterations, warmup=1)
+
+    token = headers['Authorization'].split(' ', 1)[1]
+
+    def resolve_cold():
+        get_identity_cache().clear()
+        get_identity_id_cache().clear()
+        get_aws_identity(token)
+
+    results['identity_resolution_cold'] = _measure(resolve_cold, iterations)
+    results['identity_resolution_cached'] = _measure(lambda: get_aws_identity(token), iterations * 10)
+    return results
+
+
+async def _run_throughput_level(app, factory, concurrency, total_requests):
+    import httpx
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+
+    async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+        async def request():
+            method, url, kwargs = factory()
+            async with semaphore:
+                started = time.perf_counter()
+                _check(await client.request(method, url, **kwargs))
+                timings.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[request() for _ in range(total_requests)])
+        elapsed = time.perf_counter() - started
+
+    return {'concurrency': concurrency, 'requests_per_second': total_requests / elapsed, **_summarize(timings)}
+
+
+def run_throughput(app, app_requests, total_requests, concurrency_levels):
+    results = {}
+    for scenario in THROUGHPUT_SCENARIOS:
+        factory = getattr(app_requests, scenario)
+        for concurrency in concurrency_levels:
+            results[f'{scenario}@{concurrency}'] = asyncio.run(
+                _run_throughput_level(app, factory, concurrency, total_requests))
+    return results
+
+
+def run(args):
+    with mocked_aws():
+        from fastapi.testclient import TestClient
+        from app.main import app
+
+        client = TestClient(app)
+        headers = {'Authorization': f'Bearer {_sign_in(client, USERNAME, PASSWORD)}'}
+        note_id = _check(client.post('/v1/notes', json={'title': 'bench', 'text': 'bench text'}, headers=headers),
+                         201).json()['note_id']
+
+        list_sizes = sorted(set(args.list_sizes) | {10})
+        list_headers = {}
+        for size in list_sizes:
+            username = f'{USERNAME}List{size}'
+            create_user(username, PASSWORD)
+            list_headers[size] = {'Authorization': f'Bearer {_sign_in(client, username, PASSWORD)}'}
+            _create_notes(client, list_headers[size], size)
+
+        app_requests = _Requests(headers, note_id, list_headers)
+        restore = add_network_latency(args.latency_ms / 1000)
+        try:
+            latency = run_latency(client, app_requests, args.iterations, args.list_iterations, args.list_sizes)
+            throughput = run_throughput(app, app_requests, args.requests, args.concurrency)
+        finally:
+            restore()
+
+    return {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'list_iterations': args.list_iterations,
+            'requests': args.requests,
+            'latency_ms': args.latency_ms,
+        },
+        'latency': latency,
+        'throughput': throughput,
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Prints the change of every scenario present in both result sets and returns the regressed ones: latency runs
+    are judged on p50, throughput runs on requests per second.
+    """
+    regressions = []
+    rows = []
+    for group, metric, higher_is_better in (('latency', 'p50_ms', False),
+                                            ('throughput', 'requests_per_second', True)):
+        for scenario, result in current.get(group, {}).items():
+            base = baseline.get(group, {}).get(scenario)
+            if base is None or not base[metric]:
+                continue
+            change = (result[metric] - base[metric]) / base[metric]
+            regressed = (-change if higher_is_better else change) > threshold
+            if regressed:
+                regressions.append(f'{group}/{scenario}')
+            rows.append((f'{group}/{scenario}', metric, base[metric], result[metric], change, regressed))
+
+    for name, metric, base_value, value, change, regressed in rows:
+        print(f'{name:<42} {metric:<20} {base_value:10.2f} -> {value:10.2f}  {change:+7.1%}'
+              f'{"  REGRESSION" if regressed else ""}')
+    return regressions
+
+
+def print_results(results):
+    for scenario, result in results['latency'].items():
+        print(f'{scenario:<32} p50 {result["p50_ms"]:9.2f} ms   p95 {result["p95_ms"]:9.2f} ms   '
+              f'p99 {result["p99_ms"]:9.2f} ms   ({result["iterations"]} runs)')
+    for scenario, result in results['throughput'].items():
+        print(f'{scenario:<32} {result["requests_per_second"]:9.1f} req/s   p50 {result["p50_ms"]:9.2f} ms   '
+              f'p95 {result["p95_ms"]:9.2f} ms')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against this saved JSON result file')
+    parser.add_argument('--results', help='compare this saved JSON result file instead of running the suite')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change counted as a regression')
+    parser.add_argument('--iterations', type=int, default=50, help='requests per latency scenario')
+    parser.add_argument('--list-iterations', type=int, default=5, help='listings per size above 10 notes')
+    parser.add_argument('--list-sizes', type=_int_list, default=list(LIST_SIZES))
+    parser.add_argument('--requests', type=int, default=64, help='requests per throughput level')
+    parser.add_argument('--concurrency', type=_int_list, default=list(CONCURRENCY_LEVELS))
+    parser.add_argument('--latency-ms', type=float, default=0, help='simulated round trip added to AWS calls')
+    args = parser.parse_args(argv)
+
+    if args.results:
+        with open(args.results) as results_file:
+            results = json.load(results_file)
+    else:
+        results = run(args)
+        print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} scenario(s) regressed by more than {args.threshold:.0%}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,21 +6,49 @@ import json
 from pathlib import Path
 from dotenv import load_dotenv
 from moto import mock_cognitoidp, mock_dynamodb, mock_cognitoidentity
-from app.settings import Settings
+from app.settings import get_settings
 from fastapi.testclient import TestClient
 
 
+@pytest.fixture(scope="function", autouse=True)
+def identity_cache(aws_credentials):
+    from app.utils.auth.aws_jwt import get_identity_cache, get_identity_id_cache
+    get_identity_cache().clear()
+    get_identity_id_cache().clear()
+    yield get_identity_cache()
+    get_identity_cache().clear()
+    get_identity_id_cache().clear()
+
+
+@pytest.fixture(scope="function", autouse=True)
+def aws_clients():
+    from app.utils import aws_clients
+    aws_clients.reset_clients()
+    yield aws_clients
+    aws_clients.reset_clients()
+
+
+@pytest.fixture(scope="function", autouse=True)
+def note_search_indexes(aws_credentials):
+    from app.utils.search import reset_note_search_indexes, get_note_search_indexes
+    reset_note_search_indexes()
+    yield get_note_search_indexes()
+    reset_note_search_indexes()
+
+
 @pytest.fixture(scope="function")
 def aws_credentials():
     success = load_dotenv(dotenv_path=Path('.test.env'))
-    return success
+    get_settings.cache_clear()
+    yield success
+    get_settings.cache_clear()
 
 
 @pytest.fixture(scope="function")
 def cognito_idp(aws_credentials):
     with mock_cognitoidp():
         with mock_cognitoidentity():
-            settings = Settings()
+            settings = get_settings()
             cognito_service = boto3.client('cognito-idp')
             user_pool_id = cognito_service.create_user_pool(PoolName='test_pool')["UserPool"]["Id"]
             user_pool_client_id = cognito_service.create_user_pool_client(
@@ -35,6 +63,7 @@ def cognito_idp(aws_credentials):
             response = cognito_identity_service.create_identity_pool(IdentityPoolName='test_identity_pool',
                                                                      AllowUnauthenticatedIdentities=False)
             os.environ['COGNITO_IDENTITY_POOL_ID'] = response['IdentityPoolId']
+            get_settings.cache_clear()
 
             yield cognito_service, user_pool_id
 
@@ -49,7 +78,7 @@ def client(aws_credentials):
 @pytest.fixture(scope="function")
 def cognito_idp_with_new_user(cognito_idp):
     cognito_service, user_pool_id = cognito_idp
-    settings = Settings()
+    settings = get_settings()
 
     username = "Test"
     password = "Passw0rd!"
@@ -80,7 +109,7 @@ def logged_in_client(client, cognito_idp_with_confirmed_user):
 @pytest.fixture(scope="function")
 def dynamo_db_table(aws_credentials):
     with mock_dynamodb():
-        settings = Settings()
+        settings = get_settings()
         dynamodb_resource = boto3.resource('dynamodb')
         dynamodb_resource.create_table(TableName=settings.dynamo_db_notes_table,
                                        AttributeDefinitions=[
@@ -91,6 +120,10 @@ def dynamo_db_table(aws_credentials):
                                            {
                                                'AttributeName': 'contents',
                                                'AttributeType': 'S'
+                                           },
+                                           {
+                                               'AttributeName': 'updated_at',
+                                               'AttributeType': 'N'
                                            }
                                        ],
                                        KeySchema=[
@@ -103,6 +136,29 @@ def dynamo_db_table(aws_credentials):
                                                'KeyType': 'RANGE'
                                            }
                                        ],
+                                       GlobalSecondaryIndexes=[
+                                           {
+                                               'IndexName': 'updated_at_index',
+                                               'KeySchema': [
+                                                   {
+                                                       'AttributeName': 'user_id',
+                                                       'KeyType': 'HASH'
+                                                   },
+                                                   {
+                                                       'AttributeName': 'updated_at',
+                                                       'KeyType': 'RANGE'
+                                                   }
+                                               ],
+                                               'Projection': {
+                                                   'ProjectionType': 'ALL'
+                                               }
+                                           }
+                                       ],
                                        BillingMode='PAY_PER_REQUEST')
+        dynamodb_resource.meta.client.update_time_to_live(TableName=settings.dynamo_db_notes_table,
+                                                          TimeToLiveSpecification={
+                                                              'Enabled': True,
+                                                              'AttributeName': 'expires_at'
+                                                          })
         table = dynamodb_resource.Table(settings.dynamo_db_notes_table)
         yield table
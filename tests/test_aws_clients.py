@@ -0,0 +1,34 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+from fastapi import status
+
+from app.exceptions import AWSServicesException
+
+
+class TestAWSClients:
+
+    @staticmethod
+    def test_client_reused(aws_clients, aws_credentials):
+        client = aws_clients.get_client('cognito-idp')
+        assert aws_clients.get_client('cognito-idp') is client
+        assert aws_clients.get_client('cognito-identity') is not client
+
+    @staticmethod
+    def test_client_config(aws_clients, aws_credentials):
+        config = aws_clients.get_client('cognito-idp').meta.config
+        assert config.max_pool_connections == 50
+        assert config.tcp_keepalive
+        assert config.retries['mode'] == 'adaptive'
+
+    @staticmethod
+    def test_client_override(aws_clients, aws_credentials):
+        from app.utils.auth import cognito_service
+        client = boto3.client('cognito-idp')
+        aws_clients.set_client('cognito-idp', client)
+        with Stubber(client) as stubber:
+            stubber.add_client_error('initiate_auth', service_error_code='NotAuthorizedException')
+            with pytest.raises(AWSServicesException) as exc_info:
+                cognito_service.initiate_auth('test', 'password')
+            stubber.assert_no_pending_responses()
+        assert exc_info.value.recommended_status_code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,128 @@
+import json
+from fastapi import status
+
+
+class TestBatch:
+
+    batch_url = '/v1/notes:batch'
+    batch_delete_url = '/v1/notes:batchDelete'
+    batch_get_url = '/v1/notes:batchGet'
+
+    def test_batch_save_unauthenticated(self, client):
+        response = client.post(self.batch_url, json={'notes': [{'title': 'test', 'text': 'test_text'}]})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_batch_save_notes(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        DynamoDBNote(identity.identity_id, contents='note_existing', title='test_title', text='test_text').save()
+
+        notes = [{'title': f'title_{i}', 'text': f'text_{i}'} for i in range(60)]
+        notes.append({'note_id': 'existing', 'title': 'title-2', 'text': 'text-2'})
+        response = client.post(self.batch_url, json={'notes': notes}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+
+        results = json.loads(response.content)['results']
+        assert len(results) == 61
+        assert all(result['status'] == 'succeeded' for result in results)
+        assert results[-1]['note_id'] == 'existing'
+
+        stored_notes = list(DynamoDBNote.query(hash_key=identity.identity_id))
+        assert len(stored_notes) == 61
+        existing_note = DynamoDBNote.get(identity.identity_id, 'note_existing')
+        assert existing_note.title == 'title-2' and existing_note.text == 'text-2'
+
+    def test_batch_save_duplicate_ids(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        notes = [{'note_id': 'same', 'title': 'test', 'text': 'test_text'}] * 2
+        response = client.post(self.batch_url, json={'notes': notes}, headers=headers)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_batch_save_too_large(self, logged_in_client, dynamo_db_table, monkeypatch):
+        from app.settings import get_settings
+        client, headers, identity = logged_in_client
+        monkeypatch.setattr(get_settings(), 'notes_batch_max_size', 2)
+        notes = [{'title': 'test', 'text': 'test_text'}] * 3
+        response = client.post(self.batch_url, json={'notes': notes}, headers=headers)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_batch_save_unprocessed_items(self, logged_in_client, dynamo_db_table, monkeypatch):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        connection = DynamoDBNote._get_connection()
+        batch_write_item = connection.batch_write_item
+        monkeypatch.setattr(DynamoDBNote.Meta, 'base_backoff_ms', 1)
+
+        def batch_write_item_leaving_first_unprocessed(put_items=None, delete_items=None, **kwargs):
+            data = batch_write_item(put_items=put_items[1:], delete_items=delete_items, **kwargs)
+            data['UnprocessedItems'] = {DynamoDBNote.Meta.table_name: [{'PutRequest': {'Item': put_items[0]}}]}
+            return data
+
+        monkeypatch.setattr(connection, 'batch_write_item', batch_write_item_leaving_first_unprocessed)
+        notes = [{'note_id': f'test_{i}', 'title': 'test', 'text': 'test_text'} for i in range(3)]
+        response = client.post(self.batch_url, json={'notes': notes}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+
+        results = json.loads(response.content)['results']
+        assert [result['status'] for result in results] == ['failed', 'succeeded', 'succeeded']
+        assert results[0]['note_id'] == 'test_0'
+
+    def test_batch_save_request_failure(self, logged_in_client, dynamo_db_table, monkeypatch):
+        from botocore.exceptions import ClientError
+        from pynamodb.exceptions import PutError
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        connection = DynamoDBNote._get_connection()
+
+        def failing_batch_write_item(**kwargs):
+            cause = ClientError({'Error': {'Code': 'InternalServerError', 'Message': 'failed'}}, 'BatchWriteItem')
+            raise PutError('Failed to batch write items', cause)
+
+        monkeypatch.setattr(connection, 'batch_write_item', failing_batch_write_item)
+        notes = [{'note_id': f'test_{i}', 'title': 'test', 'text': 'test_text'} for i in range(3)]
+        response = client.post(self.batch_url, json={'notes': notes}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+
+        results = json.loads(response.content)['results']
+        assert [result['status'] for result in results] == ['failed'] * 3
+        assert all(result['detail'].startswith('PutError') for result in results)
+
+    def test_batch_delete_notes(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        for i in range(30):
+            DynamoDBNote(identity.identity_id, contents=f'note_test_{i}', title='test_title', text='test_text').save()
+
+        note_ids = [f'test_{i}' for i in range(28)]
+        response = client.post(self.batch_delete_url, json={'note_ids': note_ids}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+
+        results = json.loads(response.content)['results']
+        assert [result['note_id'] for result in results] == note_ids
+        assert all(result['status'] == 'succeeded' for result in results)
+
+        remaining = [note.contents for note in DynamoDBNote.query(hash_key=identity.identity_id)]
+        assert sorted(content for content in remaining if content.startswith('note_')) == ['note_test_28',
+                                                                                          'note_test_29']
+        assert sorted(content for content in remaining if content.startswith('tomb_')) == \
+            sorted(f'tomb_{note_id}' for note_id in note_ids)
+
+    def test_batch_get_unauthenticated(self, client):
+        response = client.post(self.batch_get_url, json={'note_ids': ['test']})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_batch_get_notes(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        for i in range(150):
+            DynamoDBNote(identity.identity_id, contents=f'note_test_{i}', title=f'title_{i}', text='test_text').save()
+        DynamoDBNote('other_identity', contents='note_other', title='test_title', text='test_text').save()
+
+        note_ids = [f'test_{i}' for i in range(0, 150, 2)] + ['missing', 'other', 'test_0']
+        response = client.post(self.batch_get_url, json={'note_ids': note_ids}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+
+        body = json.loads(response.content)
+        assert [note['note_id'] for note in body['notes']] == [f'test_{i}' for i in range(0, 150, 2)]
+        assert body['notes'][1] == {'title': 'title_2', 'text': 'test_text', 'note_id': 'test_2', 'updated_at': None}
+        assert body['missing_ids'] == ['missing', 'other']
@@ -0,0 +1,104 @@
+import json
+import time
+
+from fastapi import status
+
+
+class TestChanges:
+
+    notes_base_url = '/v1/notes'
+    changes_url = '/v1/notes/changes'
+
+    def _get_all_changes(self, client, headers, since, limit=None):
+        upserts = []
+        deletions = []
+        params = {'since': since}
+        if limit:
+            params['limit'] = limit
+        while True:
+            response = client.get(self.changes_url, params=params, headers=headers)
+            assert response.status_code == status.HTTP_200_OK
+            body = json.loads(response.content)
+            upserts.extend(body['upserts'])
+            deletions.extend(body['deletions'])
+            if not body['next_cursor']:
+                return upserts, deletions
+            params['cursor'] = body['next_cursor']
+
+    def test_get_changes_unauthenticated(self, client):
+        response = client.get(self.changes_url, params={'since': 0})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_get_changes_requires_since(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        response = client.get(self.changes_url, headers=headers)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_get_changes(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        DynamoDBNote(identity.identity_id, contents='note_legacy', title='test_title', text='test_text').save()
+        note_ids = []
+        for i in range(4):
+            response = client.post(self.notes_base_url, json={'title': f'title_{i}', 'text': 'test_text'},
+                                   headers=headers)
+            note_ids.append(json.loads(response.content)['note_id'])
+
+        upserts, deletions = self._get_all_changes(client, headers, since=0)
+        assert [note['note_id'] for note in upserts] == note_ids
+        assert deletions == []
+        checkpoint = max(note['updated_at'] for note in upserts)
+
+        client.patch(f'{self.notes_base_url}/{note_ids[1]}', json={'title': 'title-2'}, headers=headers)
+        client.delete(f'{self.notes_base_url}/{note_ids[2]}', headers=headers)
+        client.post(f'{self.notes_base_url}:batchDelete', json={'note_ids': [note_ids[3]]}, headers=headers)
+
+        upserts, deletions = self._get_all_changes(client, headers, since=checkpoint, limit=1)
+        assert [(note['note_id'], note['title']) for note in upserts] == [(note_ids[1], 'title-2')]
+        assert [deletion['note_id'] for deletion in deletions] == [note_ids[2], note_ids[3]]
+        assert all(deletion['deleted_at'] > checkpoint for deletion in deletions)
+
+        response = client.get(self.notes_base_url, headers=headers)
+        assert sorted(note['note_id'] for note in json.loads(response.content)['notes']) == \
+            sorted([note_ids[0], note_ids[1], 'legacy'])
+
+    def test_get_changes_scoped_to_identity(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        DynamoDBNote('other_identity', contents='note_other', title='test_title', text='test_text',
+                     updated_at=1).save()
+
+        upserts, deletions = self._get_all_changes(client, headers, since=0)
+        assert upserts == [] and deletions == []
+
+    def test_get_changes_invalid_cursor(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        for i in range(2):
+            DynamoDBNote(identity.identity_id, contents=f'note_test_{i}', title='test_title', text='test_text').save()
+
+        notes_cursor = json.loads(client.get(self.notes_base_url, params={'limit': 1}, headers=headers).content)[
+            'next_cursor']
+        response = client.get(self.changes_url, params={'since': 0, 'cursor': notes_cursor}, headers=headers)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_sync_token_and_tombstone_expiry(self, logged_in_client, dynamo_db_table):
+        from app.settings import get_settings
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        for i in range(2):
+            client.post(self.notes_base_url, json={'title': f'title_{i}', 'text': 'test_text'}, headers=headers)
+
+        first_page = json.loads(client.get(self.changes_url, params={'since': 0, 'limit': 1}, headers=headers).content)
+        assert first_page['next_cursor'] and first_page['sync_token'] is None
+        read_at = time.time_ns() // 1000
+        last_page = json.loads(client.get(self.changes_url, params={'since': 0, 'cursor': first_page['next_cursor']},
+                                          headers=headers).content)
+        assert last_page['next_cursor'] is None
+        # The token trails the read, so writes landing late from skewed clocks are read again on the next sync.
+        assert 0 < last_page['sync_token'] < read_at
+
+        note_id = last_page['upserts'][0]['note_id']
+        client.delete(f'{self.notes_base_url}/{note_id}', headers=headers)
+        tombstone = DynamoDBNote.get(identity.identity_id, f'tomb_{note_id}')
+        assert tombstone.expires_at == tombstone.updated_at // 1_000_000 + get_settings().notes_tombstone_ttl
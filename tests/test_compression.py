@@ -0,0 +1,160 @@
+import base64
+import json
+
+import brotli
+import pytest
+from fastapi import FastAPI, Header, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+from mangum import Mangum
+
+from app.utils.compression import BrotliCompressor, CompressionMiddleware, select_encoding, \
+    encode_compressed_lambda_body
+from app.utils.etags import etag_matches
+
+LARGE_TEXT = 'a compressible line of note text\n' * 200
+
+
+def _test_app():
+    app = FastAPI()
+
+    @app.get('/large')
+    async def large():
+        return {'text': LARGE_TEXT}
+
+    @app.get('/tagged')
+    async def tagged(if_none_match: str = Header(None)):
+        if etag_matches(if_none_match, '"1"'):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': '"1"'})
+        return JSONResponse({'text': LARGE_TEXT}, headers={'ETag': '"1"'})
+
+    @app.get('/small')
+    async def small():
+        return {'text': 'small'}
+
+    @app.get('/stream')
+    async def stream():
+        return StreamingResponse(iter([LARGE_TEXT.encode()] * 3), media_type='text/plain')
+
+    return CompressionMiddleware(app, minimum_size=1024)
+
+
+def _get(client, url, accept_encoding, headers=None):
+    # The test client decodes gzip and brotli bodies itself, leaving only the headers to show what was sent.
+    response = client.get(url, headers={**(headers or {}), 'Accept-Encoding': accept_encoding})
+    return response, response.content
+
+
+class TestCompression:
+
+    @staticmethod
+    @pytest.mark.parametrize('accept_encoding, expected', [
+        ('gzip, deflate', 'gzip'),
+        ('br;q=1.0, gzip;q=0.8', 'br'),
+        ('gzip;q=1.0, br;q=0.5', 'gzip'),
+        ('br, gzip', 'br'),
+        ('*', 'br'),
+        ('*;q=0.5, br;q=0', 'gzip'),
+        ('identity', None),
+        ('gzip;q=0', None),
+        ('', None),
+        ('GZIP;Q=0.5', 'gzip'),
+    ])
+    def test_select_encoding(accept_encoding, expected):
+        assert select_encoding(accept_encoding, ('br', 'gzip')) == expected
+
+    @staticmethod
+    def test_gzip_above_minimum_size():
+        client = TestClient(_test_app())
+        response, body = _get(client, '/large', 'gzip')
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert int(response.headers['Content-Length']) < len(LARGE_TEXT) // 10
+        assert json.loads(body) == {'text': LARGE_TEXT}
+
+        response, body = _get(client, '/small', 'gzip')
+        assert 'Content-Encoding' not in response.headers
+        assert json.loads(body) == {'text': 'small'}
+
+        response, body = _get(client, '/large', 'identity')
+        assert 'Content-Encoding' not in response.headers
+        assert json.loads(body) == {'text': LARGE_TEXT}
+
+    @staticmethod
+    def test_streamed_response_compressed():
+        response, body = _get(TestClient(_test_app()), '/stream', 'gzip')
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Content-Length' not in response.headers
+        assert body.decode() == LARGE_TEXT * 3
+
+    @staticmethod
+    def test_brotli_preferred_when_available():
+        client = TestClient(_test_app())
+        response, body = _get(client, '/large', 'gzip, br')
+        assert response.headers['Content-Encoding'] == 'br'
+        assert int(response.headers['Content-Length']) < len(LARGE_TEXT) // 10
+        assert json.loads(body) == {'text': LARGE_TEXT}
+
+    @staticmethod
+    def test_brotli_flush_emits_whole_chunks():
+        compressor = BrotliCompressor(quality=5)
+        decompressor = brotli.Decompressor()
+        for chunk in [LARGE_TEXT.encode()] * 3:
+            assert decompressor.process(compressor.compress(chunk) + compressor.flush()) == chunk
+        assert decompressor.process(compressor.finish()) == b''
+
+    @staticmethod
+    def test_etag_carries_content_coding():
+        client = TestClient(_test_app())
+        assert _get(client, '/tagged', 'identity')[0].headers['ETag'] == '"1"'
+        assert _get(client, '/tagged', 'gzip')[0].headers['ETag'] == '"1-gzip"'
+        response, body = _get(client, '/tagged', 'br')
+        assert response.headers['ETag'] == '"1-br"'
+
+        response, body = _get(client, '/tagged', 'br', {'If-None-Match': '"1-br"'})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers['ETag'] == '"1-br"'
+        response, body = _get(client, '/tagged', 'identity', {'If-None-Match': '"1"'})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers['ETag'] == '"1"'
+
+    @staticmethod
+    def test_lambda_body_base64_encoded():
+        handler = Mangum(_test_app(), lifespan='off')
+        event = {
+            'version': '2.0',
+            'routeKey': '$default',
+            'rawPath': '/large',
+            'rawQueryString': '',
+            'headers': {'accept-encoding': 'br', 'host': 'example.com'},
+            'requestContext': {'http': {'method': 'GET', 'path': '/large', 'protocol': 'HTTP/1.1',
+                                        'sourceIp': '127.0.0.1'}, 'stage': '$default'},
+            'isBase64Encoded': False,
+        }
+        response = encode_compressed_lambda_body(handler(event, None))
+        assert response['isBase64Encoded'] is True
+        assert json.loads(brotli.decompress(base64.b64decode(response['body']))) == {'text': LARGE_TEXT}
+
+    @staticmethod
+    def test_text_body_left_alone():
+        response = {'statusCode': 200, 'headers': {'content-type': 'application/json'}, 'body': '{}',
+                    'isBase64Encoded': False}
+        assert encode_compressed_lambda_body(dict(response)) == response
+
+    @staticmethod
+    def test_compressed_bytes_that_decode_as_text_re_encoded():
+        response = encode_compressed_lambda_body({'statusCode': 200, 'headers': {'Content-Encoding': 'br'},
+                                                  'body': 'abc', 'isBase64Encoded': False})
+        assert response['isBase64Encoded'] is True
+        assert base64.b64decode(response['body']) == b'abc'
+
+    def test_notes_listing_compressed(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        notes = [{'note_id': f'test_{i}', 'title': 'test', 'text': 'test_text'} for i in range(50)]
+        client.post('/v1/notes:batch', json={'notes': notes}, headers=headers)
+
+        response, body = _get(client, '/v1/notes', 'gzip', headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Server-Timing' in response.headers and 'ETag' in response.headers
+        assert len(json.loads(body)['notes']) == 50
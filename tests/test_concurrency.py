@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import httpx
+from fastapi import status
+
+
+class TestConcurrency:
+
+    notes_base_url = '/v1/notes'
+
+    def test_blocking_calls_run_concurrently(self, logged_in_client, dynamo_db_table, monkeypatch):
+        from app.main import app
+        from app.schemas import NotesPage
+        from app.utils.notes_service import NotesDBService
+        client, headers, identity = logged_in_client
+        delay = 0.2
+        concurrent_requests = 8
+
+        def slow_get_notes(*args, **kwargs):
+            time.sleep(delay)
+            return NotesPage(notes=[])
+
+        monkeypatch.setattr(NotesDBService, 'get_notes', slow_get_notes)
+
+        async def run_requests():
+            async with httpx.AsyncClient(app=app, base_url='http://test') as async_client:
+                return await asyncio.gather(*[async_client.get(self.notes_base_url, headers=headers)
+                                              for _ in range(concurrent_requests)])
+
+        started = time.perf_counter()
+        responses = asyncio.run(run_requests())
+        elapsed = time.perf_counter() - started
+
+        assert all(response.status_code == status.HTTP_200_OK for response in responses)
+        assert elapsed < delay * concurrent_requests / 2
+
+    def test_thread_pool_is_bounded(self, aws_credentials, monkeypatch):
+        from app.settings import get_settings
+        from app.utils import concurrency
+        monkeypatch.setenv('BLOCKING_IO_MAX_THREADS', '2')
+        get_settings.cache_clear()
+        monkeypatch.setattr(concurrency, '_limiter', None)
+        delay = 0.1
+
+        async def run_calls():
+            return await asyncio.gather(*[concurrency.run_blocking(time.sleep, delay) for _ in range(4)])
+
+        started = time.perf_counter()
+        asyncio.run(run_calls())
+        elapsed = time.perf_counter() - started
+
+        assert concurrency.get_limiter().total_tokens == 2
+        assert elapsed >= delay * 2
+        monkeypatch.setattr(concurrency, '_limiter', None)
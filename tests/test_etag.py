@@ -0,0 +1,132 @@
+import json
+from fastapi import status
+
+
+class TestETag:
+
+    notes_base_url = '/v1/notes'
+
+    def test_get_note_not_modified(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        response = client.post(self.notes_base_url, json={'title': 'test', 'text': 'test_text'}, headers=headers)
+        note_id = json.loads(response.content)['note_id']
+        etag = response.headers['ETag']
+
+        response = client.get(f'{self.notes_base_url}/{note_id}', headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['ETag'] == etag
+
+        response = client.get(f'{self.notes_base_url}/{note_id}', headers={**headers, 'If-None-Match': etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b''
+        assert response.headers['ETag'] == etag
+
+        client.patch(f'{self.notes_base_url}/{note_id}', json={'text': 'test_text-2'}, headers=headers)
+        response = client.get(f'{self.notes_base_url}/{note_id}', headers={**headers, 'If-None-Match': etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['ETag'] != etag
+        assert json.loads(response.content)['text'] == 'test_text-2'
+
+    def test_get_notes_not_modified(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        client.post(self.notes_base_url, json={'title': 'test', 'text': 'test_text'}, headers=headers)
+
+        response = client.get(self.notes_base_url, headers=headers)
+        etag = response.headers['ETag']
+        response = client.get(self.notes_base_url, headers={**headers, 'If-None-Match': f'"other", W/{etag}'})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        client.post(self.notes_base_url, json={'title': 'test-2', 'text': 'test_text'}, headers=headers)
+        response = client.get(self.notes_base_url, headers={**headers, 'If-None-Match': etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(json.loads(response.content)['notes']) == 2
+
+    def test_update_note_if_match(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        response = client.post(self.notes_base_url, json={'title': 'test', 'text': 'test_text'}, headers=headers)
+        note_id = json.loads(response.content)['note_id']
+        etag = response.headers['ETag']
+
+        response = client.put(f'{self.notes_base_url}/{note_id}', json={'title': 'test-2', 'text': 'test_text'},
+                              headers={**headers, 'If-Match': etag})
+        assert response.status_code == status.HTTP_200_OK
+        new_etag = response.headers['ETag']
+        assert new_etag != etag
+
+        response = client.patch(f'{self.notes_base_url}/{note_id}', json={'title': 'test-3'},
+                                headers={**headers, 'If-Match': etag})
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+        response = client.patch(f'{self.notes_base_url}/{note_id}', json={},
+                                headers={**headers, 'If-Match': etag})
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+        response = client.get(f'{self.notes_base_url}/{note_id}', headers=headers)
+        assert json.loads(response.content)['title'] == 'test-2'
+        assert response.headers['ETag'] == new_etag
+
+    def test_update_legacy_note_if_match(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        DynamoDBNote(identity.identity_id, contents='note_test', title='test_title', text='test_text').save()
+
+        etag = client.get(f'{self.notes_base_url}/test', headers=headers).headers['ETag']
+        response = client.patch(f'{self.notes_base_url}/test', json={'title': 'test-2'},
+                                headers={**headers, 'If-Match': etag})
+        assert response.status_code == status.HTTP_200_OK
+
+        response = client.patch(f'{self.notes_base_url}/test', json={'title': 'test-3'},
+                                headers={**headers, 'If-Match': etag})
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+    def test_update_note_if_match_not_found(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        response = client.patch(f'{self.notes_base_url}/missing', json={'title': 'test'},
+                                headers={**headers, 'If-Match': '"1"'})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_update_note_if_match_weak_etag(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        response = client.post(self.notes_base_url, json={'title': 'test', 'text': 'test_text'}, headers=headers)
+        note_id = json.loads(response.content)['note_id']
+        response = client.patch(f'{self.notes_base_url}/{note_id}', json={'title': 'test-2'},
+                                headers={**headers, 'If-Match': f'W/{response.headers["ETag"]}'})
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+    def test_update_note_if_match_any_listed_etag(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        response = client.post(self.notes_base_url, json={'title': 'test', 'text': 'test_text'}, headers=headers)
+        note_id = json.loads(response.content)['note_id']
+        etag = response.headers['ETag']
+
+        response = client.patch(f'{self.notes_base_url}/{note_id}', json={'title': 'test-2'},
+                                headers={**headers, 'If-Match': f'"1", W/"2", {etag}'})
+        assert response.status_code == status.HTTP_200_OK
+
+        response = client.patch(f'{self.notes_base_url}/{note_id}', json={'title': 'test-3'},
+                                headers={**headers, 'If-Match': f'"1", {etag}'})
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+        response = client.patch(f'{self.notes_base_url}/missing', json={'title': 'test-3'},
+                                headers={**headers, 'If-Match': f'"1", {etag}'})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_compressed_note_etags(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        response = client.post(self.notes_base_url, json={'title': 'test', 'text': 'test_text ' * 500},
+                               headers={**headers, 'Accept-Encoding': 'identity'})
+        note_id = json.loads(response.content)['note_id']
+        etag = response.headers['ETag']
+
+        response = client.get(f'{self.notes_base_url}/{note_id}', headers={**headers, 'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        gzip_etag = response.headers['ETag']
+        assert gzip_etag == f'{etag[:-1]}-gzip"'
+
+        response = client.get(f'{self.notes_base_url}/{note_id}',
+                              headers={**headers, 'Accept-Encoding': 'gzip', 'If-None-Match': gzip_etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        response = client.patch(f'{self.notes_base_url}/{note_id}', json={'title': 'test-2'},
+                                headers={**headers, 'If-Match': gzip_etag})
+        assert response.status_code == status.HTTP_200_OK
@@ -0,0 +1,64 @@
+import gc
+import json
+import os
+
+from fastapi import status
+
+EXPORT_TEST_NOTE_COUNT = int(os.environ.get('EXPORT_TEST_NOTE_COUNT', 2000))
+EXPORT_TEST_PAGE_SIZE = 250
+
+
+def _seed_notes(identity_id, count, text='test_text'):
+    from app.utils.dynamodb_service import DynamoDBNote
+    with DynamoDBNote.batch_write() as batch:
+        for i in range(count):
+            batch.save(DynamoDBNote(identity_id, contents=f'note_{i:06d}', title=f'title_{i}', text=text))
+
+
+def _export_live_notes(notes_service):
+    # moto deep-copies and keeps the whole partition on every Query, which swamps RSS and tracemalloc
+    # readings, so the export is checked for how many note objects it keeps alive at each page boundary.
+    from app.schemas import StoredNote
+    from app.utils.dynamodb_service import DynamoDBNote
+    exported = 0
+    max_live_notes = 0
+    for _ in notes_service.export_notes(EXPORT_TEST_PAGE_SIZE):
+        exported += 1
+        if exported % EXPORT_TEST_PAGE_SIZE == 0:
+            gc.collect()
+            live_notes = sum(1 for obj in gc.get_objects() if isinstance(obj, (DynamoDBNote, StoredNote)))
+            max_live_notes = max(max_live_notes, live_notes)
+    return exported, max_live_notes
+
+
+class TestExport:
+
+    notes_base_url = '/v1/notes/export'
+
+    def test_export_unauthenticated(self, client):
+        response = client.get(self.notes_base_url)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_export_notes(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        _seed_notes(identity.identity_id, 3)
+        _seed_notes('other_identity', 2)
+
+        response = client.get(self.notes_base_url, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['content-type'] == 'application/x-ndjson'
+
+        notes = [json.loads(line) for line in response.text.splitlines()]
+        assert notes == [{'title': f'title_{i}', 'text': 'test_text', 'note_id': f'{i:06d}', 'updated_at': None}
+                         for i in range(3)]
+
+    def test_export_memory_stays_flat(self, logged_in_client, dynamo_db_table):
+        from app.utils.notes_service import NotesDBService
+        client, headers, identity = logged_in_client
+        notes_service = NotesDBService(identity)
+
+        _seed_notes(identity.identity_id, EXPORT_TEST_NOTE_COUNT, 'x' * 200)
+        exported, max_live_notes = _export_live_notes(notes_service)
+
+        assert exported == EXPORT_TEST_NOTE_COUNT
+        assert max_live_notes <= EXPORT_TEST_PAGE_SIZE + 1
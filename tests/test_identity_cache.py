@@ -0,0 +1,210 @@
+import datetime
+import time
+
+import pytest
+from fastapi import status
+
+from app.schemas import AWSIdentity
+from app.utils.auth.identity_cache import CREDENTIALS_EXPIRATION_MARGIN, IdentityCache, IdentityIdCache
+
+
+def _build_identity(identity_id='us-east-1:identity', credentials_ttl=3600, token_ttl=3600):
+    expiration = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(seconds=credentials_ttl)
+    identity = AWSIdentity.parse_obj({
+        'IdentityId': identity_id,
+        'Credentials': {
+            'AccessKeyId': 'access_key_id',
+            'SecretKey': 'secret_key',
+            'SessionToken': 'session_token',
+            'Expiration': expiration
+        }
+    })
+    identity.cognito_claims = {'exp': int(time.time()) + token_ttl}
+    return identity
+
+
+class TestIdentityCache:
+
+    @staticmethod
+    def test_get_put():
+        cache = IdentityCache(max_size=10)
+        identity = _build_identity()
+        assert cache.get('token') is None
+        cache.put('token', identity)
+        assert cache.get('token') is identity
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    @staticmethod
+    def test_expired_token_not_returned():
+        cache = IdentityCache(max_size=10)
+        cache.put('token', _build_identity(token_ttl=-1))
+        assert cache.get('token') is None
+        assert len(cache) == 0
+
+    @staticmethod
+    def test_expired_credentials_not_returned():
+        cache = IdentityCache(max_size=10)
+        cache.put('token', _build_identity(credentials_ttl=-1))
+        assert cache.get('token') is None
+
+    @staticmethod
+    def test_least_recently_used_evicted():
+        cache = IdentityCache(max_size=2)
+        cache.put('token_1', _build_identity('id_1'))
+        cache.put('token_2', _build_identity('id_2'))
+        cache.get('token_1')
+        cache.put('token_3', _build_identity('id_3'))
+
+        assert len(cache) == 2
+        assert cache.get('token_2') is None
+        assert cache.get('token_1').identity_id == 'id_1'
+        assert cache.get('token_3').identity_id == 'id_3'
+
+    @staticmethod
+    def test_get_aws_identity_cached(logged_in_client, identity_cache, monkeypatch):
+        from app.utils.auth import aws_jwt
+        client, headers, identity = logged_in_client
+        token = headers['Authorization'].split(' ', 1)[1]
+
+        def fail(token):
+            raise AssertionError('identity should be served from cache')
+
+        monkeypatch.setattr(aws_jwt, '_resolve_aws_identity', fail)
+        assert aws_jwt.get_aws_identity(token) is identity
+        assert identity_cache.hits == 1
+
+    @staticmethod
+    def test_identity_without_credentials_expires_with_token():
+        cache = IdentityCache(max_size=10)
+        identity = AWSIdentity.parse_obj({'IdentityId': 'us-east-1:identity'})
+        identity.cognito_claims = {'exp': int(time.time()) - 1}
+        cache.put('token', identity)
+        assert cache.get('token') is None
+
+        identity.cognito_claims = {'exp': int(time.time()) + 3600}
+        cache.put('token', identity)
+        assert cache.get('token') is identity
+
+    @staticmethod
+    def test_identity_id_cache_evicts_least_recently_used():
+        cache = IdentityIdCache(max_size=2)
+        cache.put('sub_1', 'id_1')
+        cache.put('sub_2', 'id_2')
+        cache.get('sub_1')
+        cache.put('sub_3', 'id_3')
+
+        assert cache.get('sub_2') is None
+        assert cache.get('sub_1') == 'id_1'
+        assert cache.get('sub_3') == 'id_3'
+
+
+@pytest.fixture(scope="function")
+def identity_calls(logged_in_client, identity_cache, monkeypatch):
+    from app.settings import get_settings
+    from app.utils.auth import aws_jwt
+    calls = []
+    call_identity_pool = aws_jwt._call_identity_pool
+
+    def record(operation, **kwargs):
+        calls.append(operation)
+        return call_identity_pool(operation, **kwargs)
+
+    def use(mode):
+        monkeypatch.setenv('AWS_IDENTITY_MODE', mode)
+        get_settings.cache_clear()
+        identity_cache.clear()
+        aws_jwt.get_identity_id_cache().clear()
+        calls.clear()
+
+    monkeypatch.setattr(aws_jwt, '_call_identity_pool', record)
+    client, headers, identity = logged_in_client
+    return use, calls, client, headers, identity
+
+
+class TestIdentityModes:
+
+    @staticmethod
+    def test_local_mode_calls_get_id_once_per_sub(identity_calls, identity_cache):
+        from app.utils.auth import aws_jwt
+        use, calls, client, headers, logged_in_identity = identity_calls
+        token = headers['Authorization'].split(' ', 1)[1]
+        use('local')
+
+        identity = aws_jwt.get_aws_identity(token)
+        identity_cache.clear()
+        assert aws_jwt.get_aws_identity(token).identity_id == identity.identity_id == logged_in_identity.identity_id
+        assert identity.credentials is None
+        assert calls == ['get_id']
+
+    @staticmethod
+    def test_get_id_mode_skips_credentials(identity_calls, identity_cache):
+        from app.utils.auth import aws_jwt
+        use, calls, client, headers, logged_in_identity = identity_calls
+        token = headers['Authorization'].split(' ', 1)[1]
+        use('get_id')
+
+        identity = aws_jwt.get_aws_identity(token)
+        identity_cache.clear()
+        aws_jwt.get_aws_identity(token)
+        assert identity.credentials is None
+        assert calls == ['get_id', 'get_id']
+
+    @staticmethod
+    def test_credentials_mode_signs_dynamodb_calls_with_identity(identity_calls, dynamo_db_table):
+        from app.utils.auth import aws_jwt
+        from app.utils.dynamodb_service import DynamoDBNote, DynamoDBNotesBackend, get_identity_model_cache
+        use, calls, client, headers, logged_in_identity = identity_calls
+        token = headers['Authorization'].split(' ', 1)[1]
+        use('credentials')
+        get_identity_model_cache().clear()
+
+        identity = aws_jwt.get_aws_identity(token)
+        assert calls == ['get_id', 'get_credentials_for_identity']
+        backend = DynamoDBNotesBackend(identity)
+        connection = backend.model._get_connection()
+        assert backend.model is not DynamoDBNote
+        assert connection is not DynamoDBNote._get_connection()
+        assert connection.connection._aws_access_key_id == identity.credentials.access_key_id
+        assert DynamoDBNotesBackend(identity).model is backend.model
+
+        response = client.post('/v1/notes', json={'title': 'title', 'text': 'text'}, headers=headers)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert backend.get_note(response.json()['note_id']).title == 'title'
+        get_identity_model_cache().clear()
+
+    @staticmethod
+    def test_identity_models_expire_with_credentials(identity_cache, monkeypatch):
+        from app.utils.auth import aws_jwt
+        from app.utils.dynamodb_service import IdentityModelCache
+        cache = IdentityModelCache(max_size=1)
+        expiring = _build_identity(credentials_ttl=CREDENTIALS_EXPIRATION_MARGIN - 1)
+        model = cache.get(expiring)
+        assert cache.get(expiring) is not model
+
+        identity = _build_identity()
+        model = cache.get(identity)
+        assert cache.get(identity) is model
+        assert len(cache) == 1
+
+        # Near-expiry credentials are not served from the identity cache either, so requests fetch fresh ones
+        # instead of each building a model for credentials the model cache rejects.
+        cache.clear()
+        resolved = [expiring, _build_identity()]
+        monkeypatch.setattr(aws_jwt, '_resolve_aws_identity', lambda token: resolved.pop(0))
+        cache.get(aws_jwt.get_aws_identity('token'))
+        models = {cache.get(aws_jwt.get_aws_identity('token')) for _ in range(5)}
+        assert len(models) == 1 and not resolved
+
+    @staticmethod
+    def test_identity_models_shared_by_tokens_of_one_identity(aws_credentials):
+        from app.utils.dynamodb_service import IdentityModelCache
+        cache = IdentityModelCache(max_size=10)
+        first_device = _build_identity(credentials_ttl=3600)
+        second_device = _build_identity(credentials_ttl=1800)
+        second_device.credentials.access_key_id = 'other_access_key_id'
+
+        model = cache.get(first_device)
+        assert cache.get(second_device) is model
+        assert cache.get(first_device) is model
+        assert model.Meta.aws_access_key_id == first_device.credentials.access_key_id
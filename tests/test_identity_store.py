@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture(scope="function")
+def identity_id_store(aws_credentials, tmp_path, monkeypatch):
+    from app.settings import get_settings
+    from app.utils.auth.identity_store import get_identity_id_store, reset_identity_id_store
+
+    def use(store):
+        monkeypatch.setenv('IDENTITY_ID_STORE', store)
+        monkeypatch.setenv('IDENTITY_ID_SQLITE_PATH', str(tmp_path / 'identity_ids.db'))
+        get_settings.cache_clear()
+        reset_identity_id_store()
+        return get_identity_id_store()
+
+    yield use
+    reset_identity_id_store()
+
+
+@pytest.fixture(scope="function")
+def get_id_calls(monkeypatch):
+    from app.utils.auth import aws_jwt
+    calls = []
+    get_identity_id = aws_jwt._get_identity_id
+
+    def record(token):
+        calls.append(token)
+        return get_identity_id(token)
+
+    monkeypatch.setattr(aws_jwt, '_get_identity_id', record)
+    return calls
+
+
+class TestIdentityIdStore:
+
+    @staticmethod
+    @pytest.mark.parametrize('backend', ['sqlite', 'dynamodb'])
+    def test_round_trip(request, identity_id_store, backend):
+        if backend == 'dynamodb':
+            request.getfixturevalue('dynamo_db_table')
+        identity_id_store(backend).put('sub', 'us-east-1:identity')
+        # A fresh store stands for a new Lambda container.
+        store = identity_id_store(backend)
+        assert store.get('sub') == 'us-east-1:identity'
+        assert store.get('other_sub') is None
+
+    @staticmethod
+    def test_mapping_stays_out_of_notes(logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBIdentityIdStore
+        client, headers, identity = logged_in_client
+        DynamoDBIdentityIdStore().put(identity.identity_id, identity.identity_id)
+
+        response = client.get('/v1/notes', headers=headers)
+        assert response.json()['notes'] == []
+        response = client.get('/v1/notes/changes', params={'since': 0}, headers=headers)
+        assert response.json()['upserts'] == [] and response.json()['deletions'] == []
+
+    @staticmethod
+    def test_resolution_skips_get_id_after_first_login(logged_in_client, dynamo_db_table, identity_id_store,
+                                                       identity_cache, get_id_calls):
+        from app.utils.auth import aws_jwt
+        client, headers, logged_in_identity = logged_in_client
+        token = headers['Authorization'].split(' ', 1)[1]
+        identity_id_store('dynamodb')
+        identity_cache.clear()
+        aws_jwt.get_identity_id_cache().clear()
+
+        assert aws_jwt.get_aws_identity(token).identity_id == logged_in_identity.identity_id
+        assert len(get_id_calls) == 1
+
+        # A cold container starts with empty in-process caches.
+        identity_cache.clear()
+        aws_jwt.get_identity_id_cache().clear()
+        assert aws_jwt.get_aws_identity(token).identity_id == logged_in_identity.identity_id
+        assert len(get_id_calls) == 1
+
+    @staticmethod
+    def test_store_failure_falls_back_to_get_id(logged_in_client, identity_id_store, identity_cache, get_id_calls,
+                                                monkeypatch):
+        from app.utils.auth import aws_jwt
+        client, headers, logged_in_identity = logged_in_client
+        token = headers['Authorization'].split(' ', 1)[1]
+        store = identity_id_store('sqlite')
+        identity_cache.clear()
+        aws_jwt.get_identity_id_cache().clear()
+
+        def fail(*args):
+            raise RuntimeError('store unavailable')
+
+        monkeypatch.setattr(store, 'get', fail)
+        monkeypatch.setattr(store, 'put', fail)
+        assert aws_jwt.get_aws_identity(token).identity_id == logged_in_identity.identity_id
+        assert len(get_id_calls) == 1
+
+    @staticmethod
+    def test_sqlite_store_does_not_load_pynamodb(aws_credentials, tmp_path):
+        repository_root = Path(__file__).resolve().parent.parent
+        env = dict(os.environ, PYTHONPATH=str(repository_root), IDENTITY_ID_STORE='sqlite',
+                   IDENTITY_ID_SQLITE_PATH=str(tmp_path / 'identity_ids.db'))
+        code = ('import sys\n'
+                'from app.utils.auth import aws_jwt\n'
+                'from app.utils.auth.identity_store import get_identity_id_store\n'
+                'get_identity_id_store().put("sub", "identity")\n'
+                'print("pynamodb" in sys.modules)')
+        result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == 'False'
@@ -0,0 +1,165 @@
+import json
+import os
+import time
+
+import moto.cognitoidp
+import pytest
+from fastapi import status
+from jose import jws
+
+from app.exceptions import AWSServicesException
+from app.utils.auth.jwks import JWKSVerifier
+
+ISSUER = 'https://cognito-idp.us-east-1.amazonaws.com/us-east-1_test'
+CLIENT_ID = 'test_client_id'
+MOTO_RESOURCES = os.path.join(os.path.dirname(moto.cognitoidp.__file__), 'resources')
+
+
+def _load_moto_key(name):
+    with open(os.path.join(MOTO_RESOURCES, name)) as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="function")
+def jwks_file(tmp_path):
+    path = tmp_path / 'jwks.json'
+    path.write_text(json.dumps(_load_moto_key('jwks-public.json')))
+    return path
+
+
+def _sign(claims=None, kid='dummy'):
+    payload = {
+        'iss': ISSUER,
+        'aud': CLIENT_ID,
+        'token_use': 'id',
+        'sub': 'user-sub',
+        'exp': int(time.time()) + 3600
+    }
+    payload.update(claims or {})
+    return jws.sign(payload, _load_moto_key('jwks-private.json'), headers={'kid': kid}, algorithm='RS256')
+
+
+class TestJWKSVerifier:
+
+    @staticmethod
+    def test_verify_from_file(jwks_file):
+        verifier = JWKSVerifier(str(jwks_file), ISSUER, CLIENT_ID)
+        claims = verifier.verify(_sign())
+        assert claims['sub'] == 'user-sub'
+
+    @staticmethod
+    def test_keys_loaded_once(jwks_file):
+        verifier = JWKSVerifier(str(jwks_file), ISSUER, CLIENT_ID)
+        verifier.verify(_sign())
+        jwks_file.unlink()
+        assert verifier.verify(_sign())['sub'] == 'user-sub'
+
+    @staticmethod
+    def test_unknown_kid_reloads_keys(jwks_file):
+        verifier = JWKSVerifier(str(jwks_file), ISSUER, CLIENT_ID, unknown_kid_reload_interval=0)
+        verifier.verify(_sign())
+
+        rotated_key = _load_moto_key('jwks-public.json')
+        rotated_key['keys'][0]['kid'] = 'rotated'
+        jwks_file.write_text(json.dumps(rotated_key))
+
+        assert verifier.verify(_sign(kid='rotated'))['sub'] == 'user-sub'
+
+    @staticmethod
+    def test_keys_refreshed_after_interval(jwks_file):
+        verifier = JWKSVerifier(str(jwks_file), ISSUER, CLIENT_ID, refresh_interval=0)
+        verifier.verify(_sign())
+        jwks_file.write_text(json.dumps({'keys': []}))
+
+        with pytest.raises(AWSServicesException) as exc_info:
+            verifier.verify(_sign())
+        assert exc_info.value.recommended_status_code == status.HTTP_401_UNAUTHORIZED
+
+    @staticmethod
+    def test_failed_reload_backs_off(jwks_file, monkeypatch):
+        verifier = JWKSVerifier(str(jwks_file), ISSUER, CLIENT_ID, refresh_interval=0, failed_reload_interval=60)
+        verifier.verify(_sign())
+        reads = []
+
+        def fail():
+            reads.append(1)
+            raise OSError('JWKS unavailable')
+
+        monkeypatch.setattr(verifier, '_read_jwks', fail)
+        for _ in range(3):
+            assert verifier.verify(_sign())['sub'] == 'user-sub'
+        assert len(reads) == 1
+
+    @staticmethod
+    def test_unavailable_jwks_is_not_unauthorized(jwks_file, monkeypatch):
+        verifier = JWKSVerifier(str(jwks_file), ISSUER, CLIENT_ID, failed_reload_interval=60)
+        reads = []
+
+        def fail():
+            reads.append(1)
+            raise OSError('JWKS unavailable')
+
+        monkeypatch.setattr(verifier, '_read_jwks', fail)
+        # Both the request that fetched and the requests arriving during the backoff get a 503, not a 401.
+        for _ in range(3):
+            with pytest.raises(AWSServicesException) as exc_info:
+                verifier.verify(_sign())
+            assert exc_info.value.recommended_status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert len(reads) == 1
+
+    @staticmethod
+    def test_concurrent_reloads_fetch_once(jwks_file, monkeypatch):
+        import threading
+        verifier = JWKSVerifier(str(jwks_file), ISSUER, CLIENT_ID)
+        read_jwks = verifier._read_jwks
+        reads = []
+
+        def slow_read():
+            reads.append(1)
+            time.sleep(0.1)
+            return read_jwks()
+
+        monkeypatch.setattr(verifier, '_read_jwks', slow_read)
+        token = _sign()
+        threads = [threading.Thread(target=verifier.verify, args=(token,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(reads) == 1
+
+    @staticmethod
+    @pytest.mark.parametrize('claims', [
+        {'exp': int(time.time()) - 1},
+        {'aud': 'other_client_id'},
+        {'iss': 'https://cognito-idp.us-east-1.amazonaws.com/other_pool'},
+        {'token_use': 'refresh'}
+    ])
+    def test_invalid_claims_rejected(jwks_file, claims):
+        verifier = JWKSVerifier(str(jwks_file), ISSUER, CLIENT_ID)
+        with pytest.raises(AWSServicesException) as exc_info:
+            verifier.verify(_sign(claims))
+        assert exc_info.value.recommended_status_code == status.HTTP_401_UNAUTHORIZED
+
+    @staticmethod
+    def test_invalid_signature_rejected(jwks_file):
+        verifier = JWKSVerifier(str(jwks_file), ISSUER, CLIENT_ID)
+        header, payload, signature = _sign().split('.')
+        forged_payload = _sign({'sub': 'other-sub'}).split('.')[1]
+        with pytest.raises(AWSServicesException) as exc_info:
+            verifier.verify('.'.join([header, forged_payload, signature]))
+        assert exc_info.value.recommended_status_code == status.HTTP_401_UNAUTHORIZED
+
+    @staticmethod
+    def test_malformed_token_rejected(jwks_file):
+        verifier = JWKSVerifier(str(jwks_file), ISSUER, CLIENT_ID)
+        with pytest.raises(AWSServicesException) as exc_info:
+            verifier.verify('not-a-token')
+        assert exc_info.value.recommended_status_code == status.HTTP_401_UNAUTHORIZED
+
+    @staticmethod
+    def test_verify_cognito_token(logged_in_client):
+        from app.utils.auth.jwks import verify_token
+        client, headers, identity = logged_in_client
+        token = headers['Authorization'].split(' ', 1)[1]
+        assert verify_token(token)['sub'] == identity.cognito_claims['sub']
@@ -0,0 +1,138 @@
+import json
+
+import pytest
+from fastapi import status
+
+from app.utils.metrics import REGISTRY, Counter, Histogram, MetricsMiddleware, RequestTimings, timed, \
+    get_request_timings, _request_timings
+
+
+@pytest.fixture(scope="function")
+def metrics_registry():
+    REGISTRY.clear()
+    yield REGISTRY
+    REGISTRY.clear()
+
+
+def _sample(metrics_text, line_prefix):
+    return [float(line.rsplit(' ', 1)[1]) for line in metrics_text.splitlines() if line.startswith(line_prefix)]
+
+
+class TestMetrics:
+
+    notes_base_url = '/v1/notes'
+
+    @staticmethod
+    def test_counter_and_histogram_render():
+        counter = Counter('test_total', 'Test counter.', ('operation',))
+        counter.inc(operation='get')
+        counter.inc(2, operation='get')
+        histogram = Histogram('test_seconds', 'Test histogram.', ('stage',), buckets=(0.1, 1.0))
+        histogram.observe(0.05, stage='a"b')
+        histogram.observe(5, stage='a"b')
+
+        assert list(counter.render())[-1] == 'test_total{operation="get"} 3.0'
+        assert list(histogram.render())[2:] == [
+            'test_seconds_bucket{stage="a\\"b",le="0.1"} 1',
+            'test_seconds_bucket{stage="a\\"b",le="1.0"} 1',
+            'test_seconds_bucket{stage="a\\"b",le="+Inf"} 2',
+            'test_seconds_sum{stage="a\\"b"} 5.05',
+            'test_seconds_count{stage="a\\"b"} 2',
+        ]
+
+    @staticmethod
+    def test_timed_decorator_and_context_manager(metrics_registry):
+        from app.utils.metrics import STAGE_DURATION, STAGE_ERRORS
+
+        @timed('test.function')
+        def function():
+            return 1
+
+        @timed('test.generator')
+        def generator():
+            yield 1
+            raise ValueError()
+
+        token = _request_timings.set(RequestTimings())
+        try:
+            assert function() == 1
+            with timed('test.block'):
+                pass
+            with pytest.raises(ValueError):
+                list(generator())
+            timings = get_request_timings()
+        finally:
+            _request_timings.reset(token)
+
+        assert set(timings.stages) == {'test.function', 'test.block', 'test.generator'}
+        assert STAGE_DURATION.get_count(stage='test.generator') == 1
+        assert STAGE_ERRORS.get(stage='test.generator', error='ValueError') == 1
+        assert 'test.function;dur=' in timings.server_timing_header()
+
+    def test_request_metrics_and_server_timing(self, logged_in_client, dynamo_db_table, metrics_registry):
+        client, headers, identity = logged_in_client
+        response = client.post(self.notes_base_url, json={'title': 'test', 'text': 'test_text'}, headers=headers)
+        assert response.status_code == status.HTTP_201_CREATED
+        server_timing = response.headers['Server-Timing']
+        for stage in ['notes_db.create_note', 'dynamodb.PutItem', 'endpoint', 'serialize', 'total']:
+            assert f'{stage};dur=' in server_timing
+
+        response = client.get('/metrics')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+        metrics_text = response.text
+        assert _sample(metrics_text, 'fastnote_request_duration_seconds_count{handler="create_note",method="POST",'
+                                     'status="201"}') == [1.0]
+        assert _sample(metrics_text, 'fastnote_stage_duration_seconds_count{stage="notes_db.create_note"}') == [1.0]
+        assert _sample(metrics_text, 'fastnote_stage_duration_seconds_count{stage="aws_jwt.get_aws_identity"}')
+        assert _sample(metrics_text,
+                       'fastnote_dynamodb_consumed_capacity_units_total{operation="PutItem"}')[0] > 0
+
+    def test_errors_counted(self, logged_in_client, dynamo_db_table, metrics_registry):
+        client, headers, identity = logged_in_client
+        response = client.get(f'{self.notes_base_url}/missing', headers=headers)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert _sample(client.get('/metrics').text,
+                       'fastnote_stage_errors_total{stage="notes_db.get_note",error="AWSServicesException"}') == [1.0]
+
+    @staticmethod
+    def test_metrics_endpoint_access(client, monkeypatch):
+        from app.settings import get_settings
+        assert client.get('/metrics').status_code == status.HTTP_200_OK
+
+        monkeypatch.setenv('AWS_LAMBDA_FUNCTION_NAME', 'fastnote')
+        get_settings.cache_clear()
+        assert client.get('/metrics').status_code == status.HTTP_404_NOT_FOUND
+
+        monkeypatch.setenv('METRICS_ENDPOINT', 'true')
+        monkeypatch.setenv('METRICS_TOKEN', 'scrape-token')
+        get_settings.cache_clear()
+        assert client.get('/metrics').status_code == status.HTTP_401_UNAUTHORIZED
+        assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == \
+            status.HTTP_401_UNAUTHORIZED
+        assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'}).status_code == \
+            status.HTTP_200_OK
+        get_settings.cache_clear()
+
+    @staticmethod
+    def test_emf_line(capsys, metrics_registry):
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+
+        app = FastAPI()
+
+        @app.get('/ping')
+        async def ping():
+            with timed('test.stage'):
+                return {}
+
+        app.add_middleware(MetricsMiddleware, emit_emf=True, namespace='Test')
+        response = TestClient(app).get('/ping')
+        assert response.status_code == status.HTTP_200_OK
+
+        line = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+        assert line['handler'] == 'ping' and line['status'] == 200
+        assert line['_aws']['CloudWatchMetrics'][0]['Namespace'] == 'Test'
+        assert {metric['Name'] for metric in line['_aws']['CloudWatchMetrics'][0]['Metrics']} == \
+            {'duration', 'test.stage'}
+        assert line['test.stage'] <= line['duration']
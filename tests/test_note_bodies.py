@@ -0,0 +1,194 @@
+import json
+import os
+
+import boto3
+import pytest
+from fastapi import status
+from moto import mock_s3
+
+from app.settings import get_settings
+from tests.test_notes import _record_dynamodb_operations
+
+BLOB_BUCKET = 'test-note-bodies'
+
+
+def _large_text(size):
+    # Hex of random bytes compresses to roughly half, so it stays large after compression.
+    return os.urandom(size // 2).hex()
+
+
+@pytest.fixture(scope="function", params=['filesystem', 's3'])
+def blob_store(request, monkeypatch, tmp_path, aws_credentials):
+    from app.utils.blob_store import get_blob_store, reset_blob_store
+    monkeypatch.setenv('NOTES_BLOB_BACKEND', request.param)
+    monkeypatch.setenv('NOTES_BLOB_THRESHOLD', '16384')
+    if request.param == 'filesystem':
+        monkeypatch.setenv('NOTES_BLOB_PATH', str(tmp_path))
+        list_blobs = lambda: sorted(str(path.relative_to(tmp_path)) for path in tmp_path.rglob('*') if path.is_file())
+        get_settings.cache_clear()
+        reset_blob_store()
+        yield get_blob_store(), list_blobs
+    else:
+        monkeypatch.setenv('NOTES_BLOB_BUCKET', BLOB_BUCKET)
+        with mock_s3():
+            s3 = boto3.client('s3')
+            s3.create_bucket(Bucket=BLOB_BUCKET)
+            list_blobs = lambda: sorted(item['Key']
+                                        for item in s3.list_objects_v2(Bucket=BLOB_BUCKET).get('Contents', []))
+            get_settings.cache_clear()
+            reset_blob_store()
+            yield get_blob_store(), list_blobs
+    reset_blob_store()
+    get_settings.cache_clear()
+
+
+class TestNoteBodies:
+
+    notes_base_url = '/v1/notes'
+
+    def _create(self, client, headers, text):
+        response = client.post(self.notes_base_url, json={'title': 'test', 'text': text}, headers=headers)
+        assert response.status_code == status.HTTP_201_CREATED
+        return json.loads(response.content)['note_id']
+
+    def _get_text(self, client, headers, note_id):
+        response = client.get(f'{self.notes_base_url}/{note_id}', headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        return json.loads(response.content)['text']
+
+    def test_small_note_stored_plain(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        note_id = self._create(client, headers, 'test_text')
+
+        dynamodb_note = DynamoDBNote.get(identity.identity_id, f'note_{note_id}')
+        assert dynamodb_note.text == 'test_text'
+        assert dynamodb_note.text_compressed is None and dynamodb_note.text_blob is None
+
+    def test_large_note_compressed(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        text = 'a compressible line of note text\n' * 1000
+        note_id = self._create(client, headers, text)
+
+        dynamodb_note = DynamoDBNote.get(identity.identity_id, f'note_{note_id}')
+        assert dynamodb_note.text is None
+        assert len(dynamodb_note.text_compressed) < len(text) // 10
+        assert self._get_text(client, headers, note_id) == text
+
+        response = client.get(f'{self.notes_base_url}/summaries', params={'preview_length': 8}, headers=headers)
+        assert json.loads(response.content)['notes'][0]['preview'] == 'a compre'
+
+        client.patch(f'{self.notes_base_url}/{note_id}', json={'text': 'short'}, headers=headers)
+        dynamodb_note = DynamoDBNote.get(identity.identity_id, f'note_{note_id}')
+        assert dynamodb_note.text == 'short' and dynamodb_note.text_compressed is None
+
+    def test_note_over_item_limit_without_blob_store(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        response = client.post(self.notes_base_url, json={'title': 'test', 'text': _large_text(1024 * 1024)},
+                               headers=headers)
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    def test_update_over_item_limit_without_blob_store(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        note_id = self._create(client, headers, 'test_text')
+        response = client.patch(f'{self.notes_base_url}/{note_id}', json={'text': _large_text(1024 * 1024)},
+                                headers=headers)
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        assert self._get_text(client, headers, note_id) == 'test_text'
+
+    def test_note_offloaded_to_blob_store(self, logged_in_client, dynamo_db_table, blob_store):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        store, list_blobs = blob_store
+        text = _large_text(1024 * 1024)
+        note_id = self._create(client, headers, text)
+
+        dynamodb_note = DynamoDBNote.get(identity.identity_id, f'note_{note_id}')
+        assert dynamodb_note.text is None and dynamodb_note.text_compressed is None
+        assert list_blobs() == [dynamodb_note.text_blob]
+        assert dynamodb_note.text_blob.startswith(f'{identity.identity_id}/{note_id}/')
+        assert self._get_text(client, headers, note_id) == text
+
+        new_text = _large_text(64 * 1024)
+        response = client.put(f'{self.notes_base_url}/{note_id}', json={'title': 'test', 'text': new_text},
+                              headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        new_blob_key = DynamoDBNote.get(identity.identity_id, f'note_{note_id}').text_blob
+        assert list_blobs() == [new_blob_key] and new_blob_key != dynamodb_note.text_blob
+        assert self._get_text(client, headers, note_id) == new_text
+
+        response = client.delete(f'{self.notes_base_url}/{note_id}', headers=headers)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert list_blobs() == []
+
+    def test_blob_writes_do_not_read_the_note_first(self, logged_in_client, dynamo_db_table, blob_store, monkeypatch):
+        client, headers, identity = logged_in_client
+        store, list_blobs = blob_store
+        note_id = self._create(client, headers, _large_text(64 * 1024))
+        operations = _record_dynamodb_operations(monkeypatch)
+
+        new_text = _large_text(64 * 1024)
+        response = client.patch(f'{self.notes_base_url}/{note_id}', json={'text': new_text}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert json.loads(response.content)['text'] == new_text
+        assert [name for name, kwargs in operations] == ['UpdateItem']
+        assert len(list_blobs()) == 1
+
+        operations.clear()
+        response = client.delete(f'{self.notes_base_url}/{note_id}', headers=headers)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert [name for name, kwargs in operations] == ['DeleteItem', 'PutItem']
+        assert list_blobs() == []
+
+    def test_blob_bodies_fetched_per_page(self, logged_in_client, dynamo_db_table, blob_store, monkeypatch):
+        client, headers, identity = logged_in_client
+        store, list_blobs = blob_store
+        texts = {self._create(client, headers, _large_text(64 * 1024)): None for _ in range(3)}
+        for note_id in texts:
+            texts[note_id] = self._get_text(client, headers, note_id)
+        fetches = []
+        get_many = store.get_many
+
+        def recording_get_many(keys):
+            fetches.append(len(keys))
+            return get_many(keys)
+
+        monkeypatch.setattr(store, 'get_many', recording_get_many)
+        response = client.get(self.notes_base_url, headers=headers)
+        assert {note['note_id']: note['text'] for note in json.loads(response.content)['notes']} == texts
+        response = client.get(f'{self.notes_base_url}/export', headers=headers)
+        assert {json.loads(line)['note_id']: json.loads(line)['text'] for line in response.text.splitlines()} == texts
+        assert fetches == [3, 3]
+
+    def test_failed_update_removes_new_blob(self, logged_in_client, dynamo_db_table, blob_store):
+        client, headers, identity = logged_in_client
+        store, list_blobs = blob_store
+        note_id = self._create(client, headers, _large_text(64 * 1024))
+        blobs = list_blobs()
+
+        response = client.patch(f'{self.notes_base_url}/{note_id}', json={'text': _large_text(64 * 1024)},
+                                headers={**headers, 'If-Match': '"1"'})
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+        assert list_blobs() == blobs
+
+    def test_batch_notes_offloaded_to_blob_store(self, logged_in_client, dynamo_db_table, blob_store):
+        client, headers, identity = logged_in_client
+        store, list_blobs = blob_store
+        texts = {f'test_{i}': _large_text(64 * 1024) for i in range(3)}
+        notes = [{'note_id': note_id, 'title': 'test', 'text': text} for note_id, text in texts.items()]
+        response = client.post(f'{self.notes_base_url}:batch', json={'notes': notes}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(list_blobs()) == 3
+
+        response = client.post(f'{self.notes_base_url}:batch', json={'notes': notes[:1]}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(list_blobs()) == 3
+
+        response = client.post(f'{self.notes_base_url}:batchGet', json={'note_ids': list(texts)}, headers=headers)
+        assert {note['note_id']: note['text'] for note in json.loads(response.content)['notes']} == texts
+
+        response = client.post(f'{self.notes_base_url}:batchDelete', json={'note_ids': ['test_0', 'test_1']},
+                               headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(list_blobs()) == 1
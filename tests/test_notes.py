@@ -2,6 +2,20 @@ import json
 from fastapi import status
 
 
+def _record_dynamodb_operations(monkeypatch):
+    from app.utils.dynamodb_service import DynamoDBNote
+    connection = DynamoDBNote._get_connection().connection
+    dispatch = connection.dispatch
+    operations = []
+
+    def recording_dispatch(operation_name, operation_kwargs, *args, **kwargs):
+        operations.append((operation_name, operation_kwargs))
+        return dispatch(operation_name, operation_kwargs, *args, **kwargs)
+
+    monkeypatch.setattr(connection, 'dispatch', recording_dispatch)
+    return operations
+
+
 class TestNotes:
 
     notes_base_url = '/v1/notes'
@@ -22,12 +36,68 @@ class TestNotes:
         response = client.get(self.notes_base_url, headers=headers)
         assert response.status_code == status.HTTP_200_OK
 
-        notes = json.loads(response.content)
+        notes = json.loads(response.content)['notes']
         assert len(notes) == 1
 
         note = notes[0]
         assert note['title'] == dynamodb_note.title and note['text'] == dynamodb_note.text and note['note_id'] == 'test'
 
+    def test_get_notes_paginated(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+
+        for i in range(5):
+            DynamoDBNote(identity.identity_id, contents=f'note_test_{i}', title='test_title', text='test_text').save()
+        DynamoDBNote('other_identity', contents='note_other', title='test_title', text='test_text').save()
+
+        note_ids = []
+        pages = 0
+        params = {'limit': 2}
+        while True:
+            response = client.get(self.notes_base_url, params=params, headers=headers)
+            assert response.status_code == status.HTTP_200_OK
+            body = json.loads(response.content)
+            assert len(body['notes']) <= 2
+            note_ids.extend(note['note_id'] for note in body['notes'])
+            pages += 1
+            if not body['next_cursor']:
+                break
+            params['cursor'] = body['next_cursor']
+
+        assert note_ids == [f'test_{i}' for i in range(5)]
+        assert pages == 3
+
+    def test_get_notes_invalid_cursor(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        response = client.get(self.notes_base_url, params={'cursor': 'invalid'}, headers=headers)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_get_note_summaries(self, logged_in_client, dynamo_db_table, monkeypatch):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+
+        DynamoDBNote(identity.identity_id, contents='note_test', title='test_title', text='test_text' * 100).save()
+        operations = _record_dynamodb_operations(monkeypatch)
+        response = client.get(f'{self.notes_base_url}/summaries', headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+
+        body = json.loads(response.content)
+        assert body == {'notes': [{'note_id': 'test', 'title': 'test_title', 'preview': None}], 'next_cursor': None}
+        query = operations[0][1]
+        projected = [query['ExpressionAttributeNames'][name] for name in query['ProjectionExpression'].split(', ')]
+        assert sorted(projected) == ['contents', 'title']
+
+    def test_get_note_summaries_with_preview(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+
+        DynamoDBNote(identity.identity_id, contents='note_test', title='test_title', text='test_text' * 100).save()
+        response = client.get(f'{self.notes_base_url}/summaries', params={'preview_length': 12}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+
+        notes = json.loads(response.content)['notes']
+        assert notes == [{'note_id': 'test', 'title': 'test_title', 'preview': 'test_texttes'}]
+
     def test_get_note_unauthenticated(self, client):
         response = client.get(f'{self.notes_base_url}/1')
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -189,5 +259,28 @@ class TestNotes:
 
         assert len(dynamo_db_notes) == 0
 
+    def test_patch_note_single_update_item(self, logged_in_client, dynamo_db_table, monkeypatch):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+
+        DynamoDBNote(identity.identity_id, contents='note_test', title='test_title', text='test_text').save()
+        operations = _record_dynamodb_operations(monkeypatch)
+        response = client.patch(f'{self.notes_base_url}/test', json={'title': 'test-2'}, headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        body = json.loads(response.content)
+        assert body.pop('updated_at') > 0
+        assert body == {'title': 'test-2', 'text': 'test_text', 'note_id': 'test'}
+        assert [name for name, kwargs in operations] == ['UpdateItem']
+        assert 'text' not in json.dumps(operations[0][1]['ExpressionAttributeNames'])
+
+    def test_delete_note_single_request(self, logged_in_client, dynamo_db_table, monkeypatch):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
 
+        DynamoDBNote(identity.identity_id, contents='note_test', title='test_title', text='test_text').save()
+        operations = _record_dynamodb_operations(monkeypatch)
+        response = client.delete(f'{self.notes_base_url}/test', headers=headers)
 
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert [name for name, kwargs in operations] == ['TransactWriteItems']
@@ -0,0 +1,195 @@
+import pytest
+from fastapi import status
+
+from app.exceptions import AWSServicesException
+from app.schemas import AWSIdentity, Note, BatchNote
+
+
+def _identity(identity_id='identity'):
+    return AWSIdentity.construct(identity_id=identity_id, credentials=None)
+
+
+@pytest.fixture(scope="function")
+def storage_backend(aws_credentials, tmp_path, monkeypatch):
+    from app.settings import get_settings
+    from app.utils.notes_backends import reset_notes_backends
+
+    def use(backend):
+        monkeypatch.setenv('NOTES_STORAGE_BACKEND', backend)
+        monkeypatch.setenv('NOTES_SQLITE_PATH', str(tmp_path / 'notes.db'))
+        get_settings.cache_clear()
+        reset_notes_backends()
+
+    yield use
+    reset_notes_backends()
+
+
+@pytest.fixture(scope="function", params=['memory', 'sqlite', 'dynamodb'])
+def notes_service_factory(request, storage_backend):
+    from app.utils.notes_service import NotesDBService
+    storage_backend(request.param)
+    if request.param == 'dynamodb':
+        request.getfixturevalue('dynamo_db_table')
+    return lambda identity_id='identity': NotesDBService(_identity(identity_id))
+
+
+class TestNotesBackends:
+
+    notes_base_url = '/v1/notes'
+
+    @staticmethod
+    def test_crud(notes_service_factory):
+        notes_service = notes_service_factory()
+        created = notes_service.create_note(Note(title='title', text='text'))
+        assert notes_service.get_note(created.note_id) == created
+
+        updated = notes_service.update_note(created.note_id, text='new text', expected_updated_at=created.updated_at)
+        assert (updated.title, updated.text) == ('title', 'new text')
+        assert updated.updated_at > created.updated_at
+
+        notes_service.delete_note(created.note_id)
+        with pytest.raises(AWSServicesException) as ex:
+            notes_service.get_note(created.note_id)
+        assert ex.value.recommended_status_code == status.HTTP_404_NOT_FOUND
+
+    @staticmethod
+    def test_missing_and_stale_notes(notes_service_factory):
+        notes_service = notes_service_factory()
+        for call in (lambda: notes_service.update_note('missing', title='title'),
+                     lambda: notes_service.delete_note('missing')):
+            with pytest.raises(AWSServicesException) as ex:
+                call()
+            assert ex.value.recommended_status_code == status.HTTP_404_NOT_FOUND
+
+        created = notes_service.create_note(Note(title='title', text='text'))
+        with pytest.raises(AWSServicesException) as ex:
+            notes_service.update_note(created.note_id, title='other', expected_updated_at=created.updated_at - 1)
+        assert ex.value.recommended_status_code == status.HTTP_412_PRECONDITION_FAILED
+
+    @staticmethod
+    def test_pages_and_export(notes_service_factory):
+        notes_service = notes_service_factory()
+        notes_service_factory('other_identity').create_note(Note(title='other', text='other'))
+        notes_service.batch_save_notes([BatchNote(note_id=f'{i:03d}', title=f'title_{i}', text=f'text_{i}')
+                                        for i in range(7)])
+
+        note_ids = []
+        cursor = None
+        while True:
+            page = notes_service.get_notes(limit=3, cursor=cursor)
+            note_ids.extend(note.note_id for note in page.notes)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert note_ids == [f'{i:03d}' for i in range(7)]
+
+        summaries = notes_service.get_note_summaries(limit=10, preview_length=4)
+        assert [summary.preview for summary in summaries.notes] == ['text'] * 7
+        assert [note.note_id for note in notes_service.export_notes(page_size=2)] == note_ids
+
+    @staticmethod
+    def test_batches_and_changes(notes_service_factory):
+        notes_service = notes_service_factory()
+        result = notes_service.batch_save_notes([BatchNote(note_id=f'{i}', title='title', text='text')
+                                                 for i in range(4)])
+        assert [item.status for item in result.results] == ['succeeded'] * 4
+        saved_at = notes_service.get_note('0').updated_at
+        notes_service.update_note('1', title='changed')
+        notes_service.batch_delete_notes(['2', '3'])
+
+        batch = notes_service.batch_get_notes(['0', '1', '2'])
+        assert [note.note_id for note in batch.notes] == ['0', '1']
+        assert batch.missing_ids == ['2']
+
+        upserts, deletions = [], []
+        cursor = None
+        while True:
+            page = notes_service.get_note_changes(since=saved_at, limit=1, cursor=cursor)
+            upserts.extend(note.note_id for note in page.upserts)
+            deletions.extend(deletion.note_id for deletion in page.deletions)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert upserts == ['1']
+        assert sorted(deletions) == ['2', '3']
+        assert page.sync_token >= saved_at
+        assert notes_service.get_note_changes(since=saved_at - 1, limit=10).upserts[0].note_id == '0'
+
+        # A note re-created after its delete is reported as an upsert only.
+        notes_service.batch_save_notes([BatchNote(note_id='3', title='title', text='text')])
+        page = notes_service.get_note_changes(since=saved_at, limit=10)
+        assert sorted(note.note_id for note in page.upserts) == ['1', '3']
+        assert [deletion.note_id for deletion in page.deletions] == ['2']
+
+    @staticmethod
+    def test_search(notes_service_factory):
+        notes_service = notes_service_factory()
+        created = notes_service.create_note(Note(title='groceries', text='apples and pears'))
+        notes_service.create_note(Note(title='work', text='quarterly report'))
+        hits = notes_service.search_notes('pears', limit=5).hits
+        assert [hit.note_id for hit in hits] == [created.note_id]
+
+    @staticmethod
+    def test_sqlite_indexes(storage_backend):
+        from app.utils.notes_backends import SQLiteNotesDatabase
+        database = SQLiteNotesDatabase(':memory:')
+        indexes = {row[1] for row in database.connection.execute("PRAGMA index_list('notes')")}
+        assert 'notes_user_id_updated_at' in indexes
+        plan = ' '.join(str(row) for row in database.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM notes WHERE user_id = ? AND note_id > ? ORDER BY note_id', ('a', 'b')))
+        assert 'PRIMARY KEY' in plan
+        database.close()
+
+    @staticmethod
+    def test_sqlite_update_holds_write_lock(storage_backend, tmp_path):
+        import sqlite3
+        from app.utils.notes_backends import SQLiteNotesBackend, SQLiteNotesDatabase
+        path = str(tmp_path / 'shared.db')
+        backend = SQLiteNotesBackend(_identity(), SQLiteNotesDatabase(path))
+        # Another worker process on the same file.
+        other_connection = sqlite3.connect(path, timeout=0, isolation_level=None)
+        created = backend.create_note(Note(title='title', text='text'))
+
+        with backend._transaction():
+            backend._get_row(created.note_id)
+            with pytest.raises(sqlite3.OperationalError):
+                other_connection.execute('BEGIN IMMEDIATE')
+        other_connection.execute('BEGIN IMMEDIATE')
+        other_connection.execute('ROLLBACK')
+
+        with pytest.raises(AWSServicesException):
+            with backend._transaction():
+                backend._put_rows([backend._get_deleted_row(created.note_id, 1)])
+                raise backend._get_precondition_failed_exception(created.note_id)
+        assert backend.get_note(created.note_id) == created
+        other_connection.close()
+        backend.database.close()
+
+    @staticmethod
+    def test_incomplete_backend_fails_at_construction():
+        from app.utils.notes_backends import LocalNotesBackend
+
+        class IncompleteBackend(LocalNotesBackend):
+            def _transaction(self):
+                pass
+
+        with pytest.raises(TypeError):
+            IncompleteBackend(_identity())
+
+    @staticmethod
+    def test_unknown_backend(storage_backend):
+        from app.utils.notes_backends import get_notes_backend
+        storage_backend('cassandra')
+        with pytest.raises(ValueError):
+            get_notes_backend(_identity())
+
+    def test_api_on_memory_backend(self, logged_in_client, storage_backend):
+        storage_backend('memory')
+        client, headers, identity = logged_in_client
+        response = client.post(self.notes_base_url, json={'title': 'title', 'text': 'text'}, headers=headers)
+        assert response.status_code == status.HTTP_201_CREATED
+        note_id = response.json()['note_id']
+
+        response = client.get(f'{self.notes_base_url}/{note_id}', headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['text'] == 'text'
@@ -0,0 +1,161 @@
+import json
+import time
+
+import pytest
+from fastapi import status
+
+from app.schemas import StoredNote, NotesPage
+from app.utils.notes_cache import InMemoryCacheBackend, RedisCacheBackend, NotesCache
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        value, expires_at = self.values.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.values[key]
+            return None
+        return value.encode('utf-8') if value is not None else None
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and self.get(key) is not None:
+            return None
+        self.values[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+
+@pytest.fixture(scope="function", params=['memory', 'redis'])
+def notes_cache(request):
+    if request.param == 'memory':
+        backend = InMemoryCacheBackend(max_size=100)
+    else:
+        backend = RedisCacheBackend(FakeRedis())
+    return NotesCache(backend, ttl=60)
+
+
+@pytest.fixture(scope="function")
+def cached_client(logged_in_client, dynamo_db_table, monkeypatch):
+    from app.settings import get_settings
+    from app.utils.notes_cache import reset_notes_cache, get_notes_cache
+    monkeypatch.setenv('NOTES_CACHE_BACKEND', 'memory')
+    get_settings.cache_clear()
+    reset_notes_cache()
+    yield logged_in_client + (get_notes_cache(),)
+    reset_notes_cache()
+
+
+class TestNotesCache:
+
+    notes_base_url = '/v1/notes'
+
+    @staticmethod
+    def test_note_round_trip(notes_cache):
+        note = StoredNote(note_id='test', title='test_title', text='test_text')
+        assert notes_cache.get_note('identity', 'test')[0] is None
+        notes_cache.set_note('identity', note)
+        assert notes_cache.get_note('identity', 'test')[0] == note
+        assert notes_cache.get_note('other_identity', 'test')[0] is None
+        assert notes_cache.stats() == {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3}
+
+    @staticmethod
+    def test_fill_after_concurrent_write_is_not_served(notes_cache):
+        old_note = StoredNote(note_id='test', title='old', text='test_text')
+        new_note = StoredNote(note_id='test', title='new', text='test_text')
+
+        # A reader misses and loads the old note while a writer writes through the new one.
+        _, generation = notes_cache.get_note('identity', 'test')
+        notes_cache.set_note('identity', new_note)
+        notes_cache.fill_note('identity', old_note, generation)
+        assert notes_cache.get_note('identity', 'test')[0] == new_note
+
+        # The same holds for a reader racing a delete.
+        _, generation = notes_cache.get_note('identity', 'test')
+        notes_cache.delete_notes('identity', ['test'])
+        notes_cache.fill_note('identity', new_note, generation)
+        assert notes_cache.get_note('identity', 'test')[0] is None
+
+    @staticmethod
+    def test_listing_invalidated_per_identity(notes_cache):
+        page = NotesPage(notes=[StoredNote(note_id='test', title='test_title', text='test_text')])
+        for identity_id in ('identity', 'other_identity'):
+            _, generation = notes_cache.get_listing(identity_id, 'notes', NotesPage)
+            notes_cache.set_listing(identity_id, 'notes', page, generation)
+
+        notes_cache.invalidate_listings('identity')
+
+        assert notes_cache.get_listing('identity', 'notes', NotesPage)[0] is None
+        assert notes_cache.get_listing('other_identity', 'notes', NotesPage)[0] == page
+
+    @staticmethod
+    def test_listing_fill_after_concurrent_write_is_not_served(notes_cache):
+        old_page = NotesPage(notes=[])
+        new_page = NotesPage(notes=[StoredNote(note_id='test', title='test_title', text='test_text')])
+
+        # A reader misses and loads the listing while a writer invalidates the listings.
+        _, generation = notes_cache.get_listing('identity', 'notes', NotesPage)
+        notes_cache.invalidate_listings('identity')
+        notes_cache.set_listing('identity', 'notes', old_page, generation)
+        page, generation = notes_cache.get_listing('identity', 'notes', NotesPage)
+        assert page is None
+
+        notes_cache.set_listing('identity', 'notes', new_page, generation)
+        assert notes_cache.get_listing('identity', 'notes', NotesPage)[0] == new_page
+
+    @staticmethod
+    def test_in_memory_backend_expires_and_evicts():
+        backend = InMemoryCacheBackend(max_size=2)
+        backend.set('expired', 'value', ttl=-1)
+        assert backend.get('expired') is None
+
+        backend.set('first', '1')
+        backend.set('second', '2')
+        backend.get('first')
+        backend.set('third', '3')
+        assert backend.get('second') is None
+        assert backend.get('first') == '1' and backend.get('third') == '3'
+
+    def test_get_note_served_from_cache(self, cached_client, monkeypatch):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity, notes_cache = cached_client
+        DynamoDBNote(identity.identity_id, contents='note_test', title='test_title', text='test_text').save()
+
+        first = client.get(f'{self.notes_base_url}/test', headers=headers)
+        monkeypatch.setattr(DynamoDBNote, 'get', None)
+        second = client.get(f'{self.notes_base_url}/test', headers=headers)
+
+        assert first.status_code == second.status_code == status.HTTP_200_OK
+        assert first.content == second.content
+        assert notes_cache.hits == 1
+
+    def test_update_writes_through(self, cached_client):
+        client, headers, identity, notes_cache = cached_client
+        response = client.post(self.notes_base_url, json={'title': 'test', 'text': 'test_text'}, headers=headers)
+        note_id = json.loads(response.content)['note_id']
+
+        client.patch(f'{self.notes_base_url}/{note_id}', json={'title': 'test-2'}, headers=headers)
+        response = client.get(f'{self.notes_base_url}/{note_id}', headers=headers)
+
+        assert json.loads(response.content)['title'] == 'test-2'
+        assert notes_cache.hits == 1
+
+    def test_writes_invalidate_listing(self, cached_client):
+        client, headers, identity, notes_cache = cached_client
+        assert json.loads(client.get(self.notes_base_url, headers=headers).content)['notes'] == []
+        assert json.loads(client.get(self.notes_base_url, headers=headers).content)['notes'] == []
+        assert notes_cache.hits == 1
+
+        response = client.post(self.notes_base_url, json={'title': 'test', 'text': 'test_text'}, headers=headers)
+        note_id = json.loads(response.content)['note_id']
+        notes = json.loads(client.get(self.notes_base_url, headers=headers).content)['notes']
+        assert [note['note_id'] for note in notes] == [note_id]
+
+        client.delete(f'{self.notes_base_url}/{note_id}', headers=headers)
+        assert json.loads(client.get(self.notes_base_url, headers=headers).content)['notes'] == []
+        assert client.get(f'{self.notes_base_url}/{note_id}', headers=headers).status_code == status.HTTP_404_NOT_FOUND
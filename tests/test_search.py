@@ -0,0 +1,186 @@
+import json
+import time
+
+import pytest
+from fastapi import status
+
+
+class TestInvertedIndex:
+
+    def test_bm25_ranking(self):
+        from app.utils.search import InvertedIndex
+        index = InvertedIndex()
+        index.add('a', 'shopping list: milk, eggs, bread')
+        index.add('b', 'milk milk milk')
+        index.add('c', 'meeting notes about the roadmap')
+
+        assert [key for key, score in index.search('milk', 10)] == ['b', 'a']
+        assert sorted(key for key, score in index.search('milk roadmap', 10)) == ['a', 'b', 'c']
+        assert index.search('unknown', 10) == []
+
+    def test_rare_terms_weigh_more(self):
+        from app.utils.search import InvertedIndex
+        index = InvertedIndex()
+        for i in range(10):
+            index.add(f'common_{i}', 'weekly status')
+        index.add('rare', 'weekly retrospective')
+
+        assert index.search('weekly retrospective', 1)[0][0] == 'rare'
+
+    def test_prefix_matching(self):
+        from app.utils.search import InvertedIndex
+        index = InvertedIndex()
+        index.add('a', 'Groceries for the weekend')
+        index.add('b', 'Grocery store opening hours')
+        index.add('c', 'Great ideas')
+
+        assert sorted(key for key, score in index.search('groc', 10)) == ['a', 'b']
+        assert sorted(key for key, score in index.search('GR', 10)) == ['a', 'b', 'c']
+
+    def test_incremental_updates(self):
+        from app.utils.search import InvertedIndex
+        index = InvertedIndex()
+        index.add('a', 'alpha beta')
+        index.add('b', 'beta gamma')
+
+        index.add('a', 'delta')
+        assert [key for key, score in index.search('alpha', 10)] == []
+        assert [key for key, score in index.search('delta', 10)] == ['a']
+
+        index.remove('b')
+        index.remove('missing')
+        assert index.search('beta gamma', 10) == []
+        assert len(index) == 1
+        assert index._terms == ['delta']
+
+
+class TestNoteSearchIndex:
+
+    def test_build_does_not_block_writes(self):
+        import threading
+        from app.exceptions import AWSServicesException
+        from app.schemas import NoteChangesPage, StoredNote
+        from app.utils.search import NoteSearchIndex
+
+        export_started, resume_export = threading.Event(), threading.Event()
+
+        class SlowNotesService:
+            def export_notes(self, page_size):
+                yield StoredNote(note_id='a', title='alpha', text='')
+                yield StoredNote(note_id='b', title='beta', text='')
+                export_started.set()
+                resume_export.wait(5)
+
+            def get_note_changes(self, since, limit, cursor=None):
+                return NoteChangesPage(upserts=[], deletions=[])
+
+        index = NoteSearchIndex()
+        builder = threading.Thread(target=index.sync, args=(SlowNotesService(), 10))
+        builder.start()
+        assert export_started.wait(5)
+
+        # Writes go through while the export runs, and a second search is turned away instead of waiting.
+        index.upsert(StoredNote(note_id='c', title='gamma', text=''))
+        index.remove('a')
+        with pytest.raises(AWSServicesException) as ex:
+            index.sync(SlowNotesService(), 10)
+        assert ex.value.recommended_status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+        resume_export.set()
+        builder.join(5)
+        assert sorted(hit.note_id for hit in index.search('alpha beta gamma', 10)) == ['b', 'c']
+
+    def test_sync_does_not_block_searches(self):
+        import threading
+        from app.schemas import NoteChangesPage, StoredNote
+        from app.utils.search import NoteSearchIndex
+
+        fetch_started, resume_fetch = threading.Event(), threading.Event()
+
+        class SlowNotesService:
+            slow = False
+
+            def export_notes(self, page_size):
+                yield StoredNote(note_id='a', title='alpha', text='')
+
+            def get_note_changes(self, since, limit, cursor=None):
+                if self.slow:
+                    fetch_started.set()
+                    resume_fetch.wait(5)
+                    return NoteChangesPage(upserts=[StoredNote(note_id='b', title='beta', text='', updated_at=since)],
+                                           deletions=[])
+                return NoteChangesPage(upserts=[], deletions=[])
+
+        index = NoteSearchIndex()
+        index.sync(SlowNotesService(), 10)
+        synced_until = index._synced_until
+        SlowNotesService.slow = True
+        syncer = threading.Thread(target=index.sync, args=(SlowNotesService(), 10))
+        syncer.start()
+        assert fetch_started.wait(5)
+
+        # The change feed is read without holding the index lock.
+        index.upsert(StoredNote(note_id='c', title='gamma', text=''))
+        assert [hit.note_id for hit in index.search('alpha', 10)] == ['a']
+
+        resume_fetch.set()
+        syncer.join(5)
+        assert sorted(hit.note_id for hit in index.search('alpha beta gamma', 10)) == ['a', 'b', 'c']
+        assert index._synced_until == synced_until
+
+
+class TestSearch:
+
+    notes_base_url = '/v1/notes'
+    search_url = '/v1/notes/search'
+
+    def _search(self, client, headers, query):
+        response = client.get(self.search_url, params={'q': query}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        return [hit['note_id'] for hit in json.loads(response.content)['hits']]
+
+    def test_search_unauthenticated(self, client):
+        response = client.get(self.search_url, params={'q': 'test'})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_search_requires_query(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        response = client.get(self.search_url, headers=headers)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_search_notes(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        DynamoDBNote(identity.identity_id, contents='note_legacy', title='Recipes', text='pancakes').save()
+        DynamoDBNote('other_identity', contents='note_other', title='Recipes', text='pancakes').save()
+        response = client.post(self.notes_base_url, json={'title': 'Groceries', 'text': 'flour, eggs, milk'},
+                               headers=headers)
+        groceries_id = json.loads(response.content)['note_id']
+
+        assert self._search(client, headers, 'pancake') == ['legacy']
+        response = client.get(self.search_url, params={'q': 'groc'}, headers=headers)
+        hits = json.loads(response.content)['hits']
+        assert [(hit['note_id'], hit['title']) for hit in hits] == [(groceries_id, 'Groceries')]
+        assert hits[0]['score'] > 0
+
+        response = client.post(self.notes_base_url, json={'title': 'Shopping', 'text': 'more milk'}, headers=headers)
+        shopping_id = json.loads(response.content)['note_id']
+        assert sorted(self._search(client, headers, 'milk')) == sorted([groceries_id, shopping_id])
+
+        client.patch(f'{self.notes_base_url}/{groceries_id}', json={'text': 'butter'}, headers=headers)
+        assert self._search(client, headers, 'milk') == [shopping_id]
+        assert self._search(client, headers, 'butter') == [groceries_id]
+
+        client.delete(f'{self.notes_base_url}/{shopping_id}', headers=headers)
+        client.post(f'{self.notes_base_url}:batchDelete', json={'note_ids': ['legacy']}, headers=headers)
+        assert self._search(client, headers, 'milk pancakes') == []
+
+    def test_search_catches_up_with_other_writers(self, logged_in_client, dynamo_db_table):
+        from app.utils.dynamodb_service import DynamoDBNote
+        client, headers, identity = logged_in_client
+        assert self._search(client, headers, 'roadmap') == []
+
+        # Written behind this process' back, as another instance would.
+        DynamoDBNote(identity.identity_id, contents='note_remote', title='Roadmap', text='Q3 planning',
+                     updated_at=time.time_ns() // 1000).save()
+        assert self._search(client, headers, 'roadmap') == ['remote']
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+from fastapi import status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.schemas import StoredNote, NotesPage, NoteChangesPage, NoteDeletion, NotesBatchGetResult
+from app.utils.serialization import NotesJSONResponse
+
+TEXTS = [
+    'plain text',
+    'quotes " and backslashes \\ and slashes /',
+    'control \x00\x01\x1f\t\n\r\b\f and \x7f',
+    'unicode ñ € 漢字 😀   ',
+    '',
+]
+
+
+def _stdlib_body(content):
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+class TestSerialization:
+
+    notes_base_url = '/v1/notes'
+
+    @staticmethod
+    @pytest.mark.parametrize('text', TEXTS)
+    def test_byte_identical_to_json_response(text):
+        notes = [StoredNote(title=text, text=text, note_id='id', updated_at=1700000000000000),
+                 StoredNote.construct(title='title', text=text, note_id='id', updated_at=None)]
+        for content in [notes[0],
+                        NotesPage(notes=notes, next_cursor=None),
+                        NotesPage.construct(notes=notes, next_cursor='cursor'),
+                        NoteChangesPage(upserts=notes, deletions=[NoteDeletion(note_id='id', deleted_at=1)]),
+                        NotesBatchGetResult(notes=notes, missing_ids=[text])]:
+            assert NotesJSONResponse(content).body == _stdlib_body(content)
+
+    @staticmethod
+    def test_falls_back_for_what_orjson_rejects():
+        note = StoredNote(title='title', text='text', note_id='id', updated_at=2 ** 70)
+        assert NotesJSONResponse(note).body == _stdlib_body(note)
+
+    def test_list_of_stored_variants(self, logged_in_client, dynamo_db_table):
+        client, headers, identity = logged_in_client
+        texts = {'plain': 'small text', 'compressed': 'a compressible line of note text\n' * 1000}
+        for title, text in texts.items():
+            client.post(self.notes_base_url, json={'title': title, 'text': text}, headers=headers)
+
+        response = client.get(self.notes_base_url, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['content-type'] == 'application/json'
+        page = json.loads(response.content)
+        assert {note['title']: note['text'] for note in page['notes']} == texts
+        assert all(isinstance(note['updated_at'], int) for note in page['notes'])
+        assert response.content == _stdlib_body(NotesPage.parse_raw(response.content))
+
+        exported = [json.loads(line) for line in client.get(f'{self.notes_base_url}/export', headers=headers)
+                    .text.splitlines()]
+        assert exported == page['notes']
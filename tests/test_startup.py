@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+WARM_UP_EVENT = {'source': 'aws.events', 'detail-type': 'Scheduled Event', 'detail': {}}
+
+
+@pytest.fixture(scope="function")
+def main_module(aws_credentials, dynamo_db_table):
+    from app import main
+    return main
+
+
+class TestStartup:
+
+    @staticmethod
+    def test_import_does_not_load_heavy_modules(aws_credentials):
+        repository_root = Path(__file__).resolve().parent.parent
+        env = dict(os.environ, PYTHONPATH=str(repository_root))
+        code = ('import sys, app.main; '
+                'print(",".join(m for m in ("boto3", "botocore", "pynamodb", "jose", "requests") if m in sys.modules))')
+        result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == ''
+
+    @staticmethod
+    def test_warm_up_event_skips_fastapi(main_module, monkeypatch):
+        def fail(event, context):
+            raise AssertionError('warm-up events should not reach the FastAPI app')
+
+        monkeypatch.setattr(main_module, 'mangum_handler', fail)
+        assert main_module.handler(WARM_UP_EVENT, None) == {'warmed': True}
+        assert main_module.handler({'warmup': True}, None) == {'warmed': True}
+
+    @staticmethod
+    def test_handler_delegates_to_mangum(main_module, monkeypatch):
+        event = {'version': '2.0', 'requestContext': {'http': {'method': 'GET'}}}
+        monkeypatch.setattr(main_module, 'mangum_handler', lambda received_event, context: received_event)
+        assert main_module.handler(event, None) is event
+
+    @staticmethod
+    def test_initialize_records_timings(main_module, monkeypatch):
+        from app import startup
+        monkeypatch.setattr(startup, '_initialized', False)
+        monkeypatch.setattr(startup, 'init_timings', {})
+        timings = startup.initialize()
+        assert {'import app.utils.dynamodb_service', 'client cognito-idp', 'client dynamodb', 'total'} <= set(timings)
+        assert startup.initialize() is timings
@@ -0,0 +1,226 @@
+import threading
+import time
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+from fastapi import status
+
+from app.exceptions import AWSServicesException
+from app.settings import get_settings
+from app.utils.throttling import TokenBucket, RateLimiter, SingleFlight, get_backoff_delay, reset_rate_limiter
+
+INITIATE_AUTH_RESPONSE = {
+    'AuthenticationResult': {
+        'IdToken': 'id_token',
+        'TokenType': 'Bearer',
+        'RefreshToken': 'refresh_token',
+        'ExpiresIn': 3600
+    }
+}
+
+
+@pytest.fixture(scope="function")
+def throttling_settings(monkeypatch, aws_credentials):
+    monkeypatch.setenv('AWS_RETRY_BASE_DELAY', '0.001')
+    monkeypatch.setenv('AWS_RETRY_MAX_ATTEMPTS', '3')
+    get_settings.cache_clear()
+    reset_rate_limiter()
+    yield monkeypatch
+    reset_rate_limiter()
+    get_settings.cache_clear()
+
+
+@pytest.fixture(scope="function")
+def stubbed_cognito_idp(aws_clients, throttling_settings):
+    client = boto3.client('cognito-idp')
+    aws_clients.set_client('cognito-idp', client)
+    with Stubber(client) as stubber:
+        yield stubber
+
+
+class TestThrottling:
+
+    @staticmethod
+    def test_token_bucket():
+        bucket = TokenBucket(rate=20, capacity=1)
+        assert bucket.acquire(timeout=0)
+        assert not bucket.acquire(timeout=0)
+
+        started = time.monotonic()
+        assert bucket.acquire(timeout=1)
+        assert 0.03 <= time.monotonic() - started < 0.5
+
+    @staticmethod
+    def test_rate_limiter_per_operation():
+        limiter = RateLimiter({'initiate_auth': 1, 'get_id': 0}, timeout=0)
+        limiter.acquire('initiate_auth')
+        with pytest.raises(AWSServicesException) as exc_info:
+            limiter.acquire('initiate_auth')
+        assert exc_info.value.recommended_status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+        for _ in range(100):
+            limiter.acquire('get_id')
+            limiter.acquire('sign_up')
+
+    @staticmethod
+    def test_single_flight():
+        single_flight = SingleFlight()
+        calls = []
+        started = threading.Barrier(8)
+
+        def slow_call(value):
+            calls.append(value)
+            time.sleep(0.2)
+            return value
+
+        def worker(results):
+            started.wait()
+            results.append(single_flight.do('key', slow_call, 'value'))
+
+        results = []
+        threads = [threading.Thread(target=worker, args=(results,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls == ['value']
+        assert results == ['value'] * 8
+        assert single_flight.do('key', slow_call, 'again') == 'again'
+
+    @staticmethod
+    def test_single_flight_shares_errors():
+        single_flight = SingleFlight()
+
+        def failing_call():
+            raise ValueError('failed')
+
+        with pytest.raises(ValueError):
+            single_flight.do('key', failing_call)
+        assert single_flight._calls == {}
+
+    @staticmethod
+    def test_single_flight_waiters_share_the_deadline():
+        single_flight = SingleFlight()
+        leader_started, release_leader = threading.Event(), threading.Event()
+
+        def slow_call():
+            leader_started.set()
+            release_leader.wait(5)
+            return 'value'
+
+        leader = threading.Thread(target=single_flight.do, args=('key', slow_call), kwargs={'timeout': 0.1})
+        leader.start()
+        assert leader_started.wait(5)
+        started = time.monotonic()
+        with pytest.raises(AWSServicesException) as exc_info:
+            single_flight.do('key', slow_call, timeout=0.1)
+        assert exc_info.value.recommended_status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert time.monotonic() - started < 1
+        release_leader.set()
+        leader.join()
+
+    @staticmethod
+    def test_backoff_delay_is_jittered_and_capped():
+        delays = [get_backoff_delay(attempt, base_delay=0.1, max_delay=1) for attempt in range(10) for _ in range(50)]
+        assert all(0 <= delay <= 1 for delay in delays)
+        assert len(set(delays)) > 1
+        assert max(get_backoff_delay(0, base_delay=0.1, max_delay=1) for _ in range(50)) <= 0.1
+
+    @staticmethod
+    def test_throttled_call_retried(stubbed_cognito_idp):
+        from app.utils.auth import cognito_service
+        stubbed_cognito_idp.add_client_error('initiate_auth', service_error_code='TooManyRequestsException')
+        stubbed_cognito_idp.add_client_error('initiate_auth', service_error_code='LimitExceededException')
+        stubbed_cognito_idp.add_response('initiate_auth', INITIATE_AUTH_RESPONSE)
+
+        assert cognito_service.initiate_auth('test', 'password')['access_token'] == 'id_token'
+        stubbed_cognito_idp.assert_no_pending_responses()
+
+    @staticmethod
+    def test_throttled_call_exhausts_retries(stubbed_cognito_idp):
+        from app.utils.auth import cognito_service
+        for _ in range(3):
+            stubbed_cognito_idp.add_client_error('initiate_auth', service_error_code='TooManyRequestsException')
+
+        with pytest.raises(AWSServicesException) as exc_info:
+            cognito_service.initiate_auth('test', 'password')
+        assert exc_info.value.recommended_status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        stubbed_cognito_idp.assert_no_pending_responses()
+
+    @staticmethod
+    def test_transient_error_retried_only_when_idempotent(stubbed_cognito_idp):
+        from app.utils.auth import cognito_service
+        stubbed_cognito_idp.add_client_error('initiate_auth', service_error_code='InternalErrorException')
+        stubbed_cognito_idp.add_response('initiate_auth', INITIATE_AUTH_RESPONSE)
+        assert cognito_service.initiate_auth('test', 'password')['access_token'] == 'id_token'
+
+        # A sign-up that failed half way may have created the user, so it is not repeated.
+        stubbed_cognito_idp.add_client_error('sign_up', service_error_code='InternalErrorException')
+        with pytest.raises(AWSServicesException) as exc_info:
+            cognito_service.sign_up('test', 'password', 'test@example.com')
+        assert exc_info.value.recommended_status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+        stubbed_cognito_idp.assert_no_pending_responses()
+
+        stubbed_cognito_idp.add_client_error('sign_up', service_error_code='TooManyRequestsException')
+        stubbed_cognito_idp.add_response('sign_up', {'UserConfirmed': False, 'UserSub': 'sub'})
+        cognito_service.sign_up('test', 'password', 'test@example.com')
+        stubbed_cognito_idp.assert_no_pending_responses()
+
+    @staticmethod
+    def test_non_retryable_error_not_retried(stubbed_cognito_idp):
+        from app.utils.auth import cognito_service
+        stubbed_cognito_idp.add_client_error('initiate_auth', service_error_code='NotAuthorizedException')
+
+        with pytest.raises(AWSServicesException) as exc_info:
+            cognito_service.initiate_auth('test', 'password')
+        assert exc_info.value.recommended_status_code == status.HTTP_401_UNAUTHORIZED
+
+    @staticmethod
+    def test_rate_limit_applies_to_operation(stubbed_cognito_idp, throttling_settings):
+        from app.utils.auth import cognito_service
+        throttling_settings.setenv('AWS_RATE_LIMITS', '{"initiate_auth": 1}')
+        throttling_settings.setenv('AWS_RATE_LIMIT_TIMEOUT', '0')
+        get_settings.cache_clear()
+        reset_rate_limiter()
+        stubbed_cognito_idp.add_response('initiate_auth', INITIATE_AUTH_RESPONSE)
+
+        cognito_service.initiate_auth('test', 'password')
+        with pytest.raises(AWSServicesException) as exc_info:
+            cognito_service.initiate_auth('test', 'password')
+        assert exc_info.value.recommended_status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    @staticmethod
+    def test_cognito_clients_leave_retries_to_the_app(aws_clients, aws_credentials):
+        assert aws_clients.get_client('cognito-idp').meta.config.retries['total_max_attempts'] == 1
+        assert aws_clients.get_client('dynamodb').meta.config.retries['total_max_attempts'] > 1
+
+    @staticmethod
+    def test_identity_resolution_coalesced(monkeypatch, aws_credentials):
+        from app.schemas import AWSIdentity
+        from app.utils.auth import aws_jwt
+        resolutions = []
+
+        def resolve(token):
+            resolutions.append(token)
+            time.sleep(0.2)
+            return AWSIdentity.parse_obj({
+                'IdentityId': f'identity-{token}',
+                'Credentials': {
+                    'AccessKeyId': 'key', 'SecretKey': 'secret', 'SessionToken': 'session',
+                    'Expiration': '2100-01-01T00:00:00Z'
+                }
+            })
+
+        monkeypatch.setattr(aws_jwt, '_resolve_aws_identity', resolve)
+        results = []
+        threads = [threading.Thread(target=lambda token=token: results.append(aws_jwt.get_aws_identity(token)))
+                   for token in ['a'] * 6 + ['b'] * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(resolutions) == ['a', 'b']
+        assert sorted(identity.identity_id for identity in results) == ['identity-a'] * 6 + ['identity-b'] * 2